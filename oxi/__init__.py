@@ -12,6 +12,13 @@ __oxi_host__ = "0.0.0.0"
 __all__ = [
     "utils",
     "mp4parser",
+    "fmp4",
+    "httpparser",
+    "fsexecutor",
+    "filecache",
+    "compressor",
+    "dirlisting",
+    "accesslog",
     "template",
     "websocket",
     "app",
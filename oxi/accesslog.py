@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+import atexit, json, os, sys, threading, time
+from collections import deque
+
+######################################################################################
+
+levels = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'silent': 100}
+
+formats = ('common', 'combined', 'json')
+
+class AccessLog:
+    """
+    Access log plus the server's own messages, written by a background thread.
+
+    The event loop only appends small tuples to a bounded queue: no lock, no thread
+    wakeup per record. The writer thread comes by every `flush_interval` seconds, or
+    as soon as `batch_size` records are waiting, formats everything queued and sends
+    it out in one write. When the queue is full, records are dropped and counted
+    (`dropped`) rather than stalling the server.
+
+    Access lines go to `access_log`: '-' for stdout, a file path (relative ones
+    land in `log_dir`), or None/'' for no access log. Messages below `level` are
+    discarded before they are formatted; 'silent' turns off access lines as well.
+    Access lines carry the bytes sent for the response, head included, and the
+    request time in seconds.
+    """
+
+    def __init__(self, access_log: str = '-', format: str = 'common', level: str = 'info',
+                 log_dir: str = None, queue_size: int = 10000, batch_size: int = 512,
+                 flush_interval: float = 0.1):
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.thread = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.idle = threading.Event()
+        self.idle.set()
+        self.stream = None
+        self.configure(access_log, format, level, log_dir)
+        atexit.register(self.close)
+
+    def configure(self, access_log: str = '-', format: str = 'common', level: str = 'info',
+                  log_dir: str = None) -> None:
+        if format not in formats:
+            raise ValueError(f"Unknown access log format '{format}'. Use one of {', '.join(formats)}.")
+        if level not in levels:
+            raise ValueError(f"Unknown log level '{level}'. Use one of {', '.join(levels)}.")
+        self.flush()
+        self.format = format
+        self.level = levels[level]
+        self.access = bool(access_log) and self.level < levels['silent']
+        path = None
+        if self.access and access_log != '-':
+            path = access_log if os.path.isabs(access_log) or not log_dir else os.path.join(log_dir, access_log)
+        if path != getattr(self.stream, 'name', None):
+            if self.stream is not None:
+                self.stream.close()
+            self.stream = None
+            if path is not None:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                # Unbuffered and appending: each batch is a single write(), so several
+                # worker processes can share the file without splitting each other's lines.
+                self.stream = open(path, 'ab', buffering=0)
+
+    def enabled(self, level: str) -> bool:
+        return levels[level] >= self.level
+
+    # Producer side: called from the event loop, never blocks.
+
+    def _put(self, record: tuple) -> None:
+        if self.thread is None:
+            self._start()
+        queued = len(self.queue)
+        if queued >= self.queue_size:
+            self.dropped += 1
+            return
+        self.queue.append(record)
+        if queued + 1 == self.batch_size:
+            self.wakeup.set()
+
+    def request(self, remote: str, request, status: int, size: int, duration: float) -> None:
+        """
+        Log one served request. `request` is its RequestHead, or None if it couldn't be parsed.
+        """
+        if not self.access:
+            return
+        if request is None:
+            line, referer, user_agent = "-", None, None
+        else:
+            line = f"{request.method} {request.target} {request.version}"
+            headers = request.headers
+            referer, user_agent = headers.get("referer"), headers.get("user-agent")
+        self._put(('access', time.time(), remote, line, status, size, duration, referer, user_agent))
+
+    def log(self, level: str, msg: str, *args) -> None:
+        """
+        Queue a server message. `msg % args` is only worked out by the writer thread,
+        and not at all if `level` is below the configured one.
+        """
+        if levels[level] >= self.level:
+            self._put((level, time.time(), msg, args))
+
+    def debug(self, msg: str, *args) -> None:
+        self.log('debug', msg, *args)
+
+    def info(self, msg: str, *args) -> None:
+        self.log('info', msg, *args)
+
+    def warning(self, msg: str, *args) -> None:
+        self.log('warning', msg, *args)
+
+    def error(self, msg: str, *args) -> None:
+        self.log('error', msg, *args)
+
+    # Consumer side: the writer thread.
+
+    def _start(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="oxi-log", daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        popleft = self.queue.popleft
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            stopping = self.stopping
+            while self.queue:
+                self.idle.clear()
+                batch = []
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(popleft())
+                except IndexError:
+                    pass
+                self._write(batch)
+            self.idle.set()
+            if stopping:
+                return
+
+    def _write(self, batch: list) -> None:
+        access, messages = [], []
+        for record in batch:
+            try:
+                if record[0] == 'access':
+                    access.append(self.format_access(*record[1:]))
+                else:
+                    messages.append(self.format_message(*record))
+            except Exception as e:
+                messages.append(f"Bad log record {record!r}: {e}\n")
+        try:
+            if access and self.stream is not None:
+                self.stream.write("".join(access).encode("utf-8", "backslashreplace"))
+            elif access:
+                messages.extend(access)
+            if messages:
+                sys.stdout.write("".join(messages))
+                sys.stdout.flush()
+        except (OSError, ValueError):
+            # Closed stdout or a full disk: logging must never take the server down.
+            pass
+
+    def format_access(self, when: float, remote: str, line: str, status: int, size: int,
+                      duration: float, referer: str, user_agent: str) -> str:
+        if self.format == 'json':
+            return json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(when)),
+                               'remote': remote, 'request': line, 'status': status, 'bytes': size,
+                               'duration': round(duration, 6), 'referer': referer,
+                               'user_agent': user_agent}, ensure_ascii=False) + "\n"
+        stamp = time.strftime('%d/%b/%Y:%H:%M:%S %z', time.localtime(when))
+        line = line.replace('\\', '\\\\').replace('"', '\\"')
+        entry = f'{remote or "-"} - - [{stamp}] "{line}" {status or "-"} {size or "-"}'
+        if self.format == 'combined':
+            referer = (referer or "-").replace('"', '\\"')
+            user_agent = (user_agent or "-").replace('"', '\\"')
+            entry += f' "{referer}" "{user_agent}"'
+        # Request time in seconds last, as nginx's $request_time.
+        return f"{entry} {duration:.6f}\n"
+
+    @staticmethod
+    def format_message(level: str, when: float, msg: str, args: tuple) -> str:
+        text = msg % args if args else msg
+        if level in ('warning', 'error'):
+            text = f"{level.upper()}: {text}"
+        return text + "\n"
+
+    # Shutdown
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """
+        Wait (up to `timeout` seconds) for everything queued so far to be written.
+        """
+        if self.thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self.queue or not self.idle.is_set()) and time.monotonic() < deadline:
+            self.wakeup.set()
+            time.sleep(0.005)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Write out what is queued and stop the writer thread. Logging again starts a new one.
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+            if thread is None:
+                return
+            self.stopping = True
+            self.wakeup.set()
+            thread.join(timeout)
+            self.stopping = False
+
+######################################################################################
+
+# The process wide log. ProtocolFactory configures it from Config.
+log = AccessLog()
+
+######################################################################################
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 from typing import Callable
 
 try:
     from . import  __version__ as oxi_version, __oxi_port__ as oxi_port, __oxi_host__ as oxi_host
     from .utils import is_windows, is_linux, is_mac, to_bytes
     from .config import Config
+    from .compressor import compress_file
+    from .accesslog import log
 except ImportError:
     from activate_this import oxi_env
     if not oxi_env:
@@ -13,6 +16,8 @@ except ImportError:
     from oxi import  __version__ as oxi_version, __oxi_port__ as oxi_port, __oxi_host__ as oxi_host
     from oxi.utils import is_linux, is_windows, is_mac
     from oxi.config import Config
+    from oxi.compressor import compress_file
+    from oxi.accesslog import log
 
 oxi_version
 
@@ -32,7 +37,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
         resource = '' if resource is None else str(resource)
         body = template.format(statusobj.value, statusobj.value, resource, statusobj.phrase, tina_version)
         body_len = len(body)
-        print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - {statusobj.value}")
+        log.debug("%s %s request from %s(%s) - %s", method, pth, remote_ip, remote_host, statusobj.value)
         
         await send({
         "type": "http.response.start",
@@ -103,7 +108,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
         pt_writer = None
         try:
             pt_reader, pt_writer = await asyncio.open_connection(addr, port, limit = 65536 * 4)
-            print(f"CONNECTION OPENED WITH {addr}:{port} AT {time.strftime(strftime_template)}")
+            log.debug("CONNECTION OPENED WITH %s:%s AT %s", addr, port, time.strftime(strftime_template))
         except:
             await send_error(404, pth)
             return 404
@@ -112,19 +117,19 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             pt_writer.write(to_bytes(request))
             await pt_writer.drain()
         except Exception as exc:
-            print(f"Exception occurred while writing headers to proxy pass: '{exc}'")
+            log.warning("Exception occurred while writing headers to proxy pass: '%s'", exc)
             return await send_error(500, repr(exc))
         if len(request_body) > 2:
             try:
                 pt_writer.write(request_body)
                 await pt_writer.drain()
             except Exception as exc:
-                print(f"Exception occurred while writing request body to proxy pass: '{exc}'")
+                log.warning("Exception occurred while writing request body to proxy pass: '%s'", exc)
                 return await send_error(500, repr(exc))
-        print(f"REQUEST SENT AT {time.strftime(strftime_template)}, AWAITING RESPONSE.")
+        log.debug("REQUEST SENT AT %s, AWAITING RESPONSE.", time.strftime(strftime_template))
 
         response_head = await pt_reader.readuntil(b'\r\n\r\n')
-        print(f"GOT RESPONSE HEAD  AT {time.strftime(strftime_template)}")
+        log.debug("GOT RESPONSE HEAD  AT %s", time.strftime(strftime_template))
 
         lines = response_head.split(b'\r\n')
         try: 
@@ -132,15 +137,15 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             three_values_expected = lines[0].split(b" ")
             # response_status = int(response_status)
             response_status = int(three_values_expected[1])
-            print(f"RESPONSE STATUS CODE: {response_status}")
+            log.debug("RESPONSE STATUS CODE: %s", response_status)
         except Exception as exc:
-            print(f"Error processing line: '{lines[0]}'")
+            log.warning("Error processing line: '%s'", lines[0])
             await send_error(500, repr(exc))
             return 500
         
         response_headers = []
         for line in lines[1:]:
-            print(f"Processing response header line: '{line.decode()}'")
+            log.debug("Processing response header line: '%s'", line.decode())
             if len(line):
                 try:
                     k, v = line.split(b': ')
@@ -157,7 +162,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                 response_body += response_chunk
                 if not len(response_chunk):
                     break
-        print(f"GOT RESPONSE BODY AT {time.strftime(strftime_template)}")
+        log.debug("GOT RESPONSE BODY AT %s", time.strftime(strftime_template))
 
         # print(response_headers)
 
@@ -166,13 +171,13 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
 
         response_content_type = response_headers_dict.get('content-type')
         if response_content_type and response_content_type.startswith(b'text/html'):
-            print("It is HTML informed by response content-type header.")
+            log.debug("It is HTML informed by response content-type header.")
             response_body = TinaHandler.rewrite_urls(key, response_body)
         elif response_content_type:
-            print(f"It is {response_content_type}")
+            log.debug("It is %s", response_content_type)
         else:
             if TinaHandler.is_html(response_body):
-                print("It is HTML guessed examining contents")
+                log.debug("It is HTML guessed examining contents")
                 response_headers_dict[b'content-type'] = b'text/html; charset=utf-8'
                 response_body = TinaHandler.rewrite_urls(key, response_body)
             else:
@@ -181,14 +186,14 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                     response_headers_dict[b'content-type'] = guessed_type.encode('utf-8')
                     if guessed_type.startswith("text/html"):
                         response_headers_dict[b'content-type'] += b"; charset=utf-8"
-                        print("It is HTML detected by guess_type")
+                        log.debug("It is HTML detected by guess_type")
                         response_body = TinaHandler.rewrite_urls(key, response_body)
                 else:    
-                    print("Shit! We don't know what it is, and we should, in order to provide 'rewrite_urls' in case it's HTML.")
+                    log.debug("Shit! We don't know what it is, and we should, in order to provide 'rewrite_urls' in case it's HTML.")
                     response_body = TinaHandler.rewrite_urls(key, response_body)
 
         response_headers = response_headers_dict.items()
-        print(f"RESPONSE HEADERS:\n{response_headers}")
+        log.debug("RESPONSE HEADERS:\n%s", response_headers)
 
         await send({
         "type": "http.response.start",
@@ -206,14 +211,14 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
         return response_status
 
     async def send_mp4(filepath):
-        print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 200")
+        log.debug("%s %s request from %s(%s) - 200", method, pth, remote_ip, remote_host)
 
         def getrange(rangebytes: bytes) -> tuple[int, int]:
             # with open(f"log/ranges.log", "ba") as fd:
             #     fd.write(to_bytes(pth) + b" (" + time.strftime("%X").encode() + b"): " + rangebytes + b'\n')
             _, points = rangebytes.split(b"=")
             if b"," in points:
-                print(f"\n@Range requested@\n{points}\n@@@\n")
+                log.debug("\n@Range requested@\n%s\n@@@\n", points)
             begin, end = points.split(b"-")
             try:
                 b = int(begin)
@@ -247,14 +252,15 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                 bodydict = SmartDict(type='http.response.body', body=chunk, more_body=True)
                 await send(bodydict)
         except Exception as exc:
-            print(f"Exception occurred while streaming mp4 content to client: {exc}")
+            log.warning("Exception occurred while streaming mp4 content to client: %s", exc)
         finally:
             try:
                 bodydict = SmartDict(type='http.response.body', body=b'', more_body=False)
                 await send(bodydict)
             except:
                 pass
-            print("Video stream closed.")
+            mp4.close()
+            log.debug("Video stream closed.")
             return
 
     async def send_chunked_file(filepath):
@@ -275,7 +281,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             return retval
             # return False
 
-        print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 200")
+        log.debug("%s %s request from %s(%s) - 200", method, pth, remote_ip, remote_host)
 
         if ftype in ["video/mp4", "video/quicktime"]:
             return await send_mp4(filepath)
@@ -286,13 +292,13 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
         body_len = file_stat.st_size
         # body = b''
 
-        file_desc = open(filepath, "rb")
         if can_gzip():
-            body = gzip.compress(file_desc.read())    
+            # Compressed chunk by chunk in a worker thread, never inside the event loop.
+            body = await asyncio.to_thread(compress_file, filepath, 'gzip')
             body_len = len(body)
             body = io.BytesIO(body)
         else:
-            body = file_desc
+            body = open(filepath, "rb")
 
         chunks, tail = TinaHandler.chunks(body_len)
         response_headers = [
@@ -311,7 +317,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             stri = f"Ranges requested: {ranges.decode('utf-8')}"
             with open("log/file_log.txt", "a") as logfile:
                 logfile.writelines([stri + '\n'])
-            print(stri)
+            log.debug(stri)
 
         try:
             await send({
@@ -324,7 +330,6 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                 chunk_size = TinaHandler.config.get("chunk-size")
                 for index, chunk in enumerate(chunks):
                     # print(f"Sending chunk number {index + 1} ({chunk[0]}-{chunk[1]}) of {len(chunks)}")
-                    print(".", end="")
                     await send({
                         "type": "http.response.body",
                         # "body": body[chunk[0]:chunk[1]],
@@ -333,7 +338,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                         "more_body": True
                     })
             if tail:
-                print(f"\nSending last chunk (tail) ({tail[0]}-{tail[1]}) for file {scope.get('path')}")
+                log.debug("Sending last chunk (tail) (%s-%s) for file %s", tail[0], tail[1], scope.get('path'))
                 tail_bytes = body.read()
                 tail_len = len(tail_bytes)
                 await send({
@@ -344,7 +349,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                     "more_body": True
                 })
             else:
-                print(f"Closing transmission for file {scope.get('path')} with no further data.")
+                log.debug("Closing transmission for file %s with no further data.", scope.get('path'))
             
             await send({
                 "type": "http.response.body",
@@ -355,10 +360,10 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             })
 
         except BrokenPipeError as bpErr:
-            print(f"Broken pipe ({errno.EPIPE}). Leaving intent of sending {scope.get('path')}.")
+            log.warning("Broken pipe (%s). Leaving intent of sending %s.", errno.EPIPE, scope.get('path'))
             return
         except Exception as exc:
-            print(f"Exception ({exc}). Leaving intent of sending {scope.get('path')}.")
+            log.warning("Exception (%s). Leaving intent of sending %s.", exc, scope.get('path'))
             return
 
     async def send_file(filepath):
@@ -367,7 +372,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
         if ftype.startswith("text"):
             ftype += "; charset=utf-8"
 
-        print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 200")
+        log.debug("%s %s request from %s(%s) - 200", method, pth, remote_ip, remote_host)
 
         if ftype in ["video/mp4", "video/quicktime"]:
             return await send_mp4(filepath)
@@ -409,7 +414,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                         break
                     remaining -= len(part)
                     if not remaining:
-                        print(f"Finished reading {scope.get('path', '---')}")
+                        log.debug("Finished reading %s", scope.get('path', '---'))
                     await send({
                         "type": "http.response.body",
                         "body": part, 
@@ -431,10 +436,10 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             })
 
         except BrokenPipeError as bpErr:
-            print(f"Broken pipe ({errno.EPIPE}). Leaving intent of sending {scope.get('path')}.")
+            log.warning("Broken pipe (%s). Leaving intent of sending %s.", errno.EPIPE, scope.get('path'))
             return
         except Exception as exc:
-            print(f"Exception ({exc}). Leaving intent of sending {scope.get('path')}.")
+            log.warning("Exception (%s). Leaving intent of sending %s.", exc, scope.get('path'))
             return
 
     async def send_directory(path, dirpath):
@@ -472,7 +477,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             </li>'''
         body += "</ul></body></html>"
         body_len = len(body)
-        print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 200")
+        log.debug("%s %s request from %s(%s) - 200", method, pth, remote_ip, remote_host)
         
         await send({
         "type": "http.response.start",
@@ -524,7 +529,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                 _, code, phrase = resp_line.split(b' ', 3)
             except:
                 pass
-            print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - {code.decode('utf-8')}")
+            log.debug("%s %s request from %s(%s) - %s", method, pth, remote_ip, remote_host, code.decode('utf-8'))
             writer = scope.get('_writer')
             if not writer:
                 raise RuntimeError("No writer socket to send response.")
@@ -532,14 +537,14 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             try: 
                 await writer.drain()
             except Exception as exc:
-                print(f"Exception occurred while trying to send CGI data to remote host: '{exc}'")
+                log.warning("Exception occurred while trying to send CGI data to remote host: '%s'", exc)
                 return await send_error(500, repr(exc))
             finally:
                 try: 
                     writer.close()
                     await writer.wait_closed()
                 except:
-                    print(f"Exception occurred while trying to close pipe to remote host for CGI data: '{exc}'")
+                    log.warning("Exception occurred while trying to close pipe to remote host for CGI data: '%s'", exc)
                     return await send_error(500, repr(exc))
 
 # 
@@ -548,13 +553,13 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
                 if await asyncio.to_thread(os.access, cgipath, os.X_OK):
                     return await actually_send_cgi()
                 else:
-                    print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 403")
+                    log.debug("%s %s request from %s(%s) - 403", method, pth, remote_ip, remote_host)
                     return await send_error(403, os.path.split(cgipath)[1])
             else:
-                print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 403")
+                log.debug("%s %s request from %s(%s) - 403", method, pth, remote_ip, remote_host)
                 return await send_error(403,  os.path.split(cgipath)[1])
         else:
-            print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 403")
+            log.debug("%s %s request from %s(%s) - 403", method, pth, remote_ip, remote_host)
             return await send_error(403,  os.path.split(cgipath)[1])
 
     body = ""     
@@ -575,7 +580,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
     if TinaHandler.config.get('redirects') and pth[1:] in TinaHandler.config.get('redirects').keys():
         d = TinaHandler.config.get('redirects')
         where = d.get(pth[1:])
-        print(f"(PID {os.getpid()}) \nRedirect {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 302")
+        log.debug("Redirect %s %s request from %s(%s) - 302", method, pth, remote_ip, remote_host)
         return await send_redirection(where)
 
 #    if pth[1:] in TinaHandler.config.get('proxy_pass').keys():
@@ -585,7 +590,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
             # where = d.get(pth[1:])
             where = d.get(key)
             retcode = await send_proxy_pass(key, where)
-            print(f"\n(PID {os.getpid()}) Proxy pass {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - {retcode}")
+            log.debug("Proxy pass %s %s request from %s(%s) - %s", method, pth, remote_ip, remote_host, retcode)
             return 
     
     if pth in easter_eggs.keys() and scope.get('method').lower().strip() == 'get':
@@ -614,7 +619,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
         except Exception as exc:
             _, _, trace_back = os.sys.exc_info()
             lineno = trace_back.tb_lineno
-            print(f"Exception occurred while trying to load demo app at line {lineno}: '{exc}'\nTraceback: {repr(trace_back)}")
+            log.error("Exception occurred while trying to load demo app at line %s: '%s'\nTraceback: %s", lineno, exc, repr(trace_back))
 
     if pth == '/uploader':
         try:
@@ -623,7 +628,7 @@ async def static_app(scope: dict, receive: Callable, send: Callable, absolute_pa
         except Exception as exc:
             _, _, trace_back = os.sys.exc_info()
             lineno = trace_back.tb_lineno
-            print(f"Exception occurred while trying to load formhandler at line {lineno}: '{exc}'\nTraceback: {repr(trace_back)}")
+            log.error("Exception occurred while trying to load formhandler at line %s: '%s'\nTraceback: %s", lineno, exc, repr(trace_back))
 
     m = re.match(f".*{cgi_dir}.*", pth)
     # print(f"CGI string in position in path is: {m}")
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import asyncio, zlib
+from concurrent.futures import Executor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+######################################################################################
+
+# Content codings we can produce, best first. Missing optional modules drop out.
+encodings = tuple(name for name, available in (('br', brotli is not None),
+                                               ('zstd', zstd is not None),
+                                               ('gzip', True)) if available)
+
+# Sibling file suffixes holding precompressed variants, e.g. style.css.br.
+precompressed_suffixes = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz'}
+
+default_levels = {'br': 5, 'zstd': 3, 'gzip': 6}
+
+compressible_types = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'application/xhtml+xml', 'application/rss+xml', 'application/atom+xml',
+                      'application/manifest+json', 'application/wasm', 'application/x-javascript',
+                      'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon', 'font/ttf', 'font/otf')
+
+def is_compressible(content_type: str) -> bool:
+    """
+    Whether `content_type` is worth compressing. Already compressed formats
+    (images, audio, video, archives, woff fonts) are not.
+    """
+    return content_type.startswith(compressible_types) or content_type.endswith(('+json', '+xml'))
+
+def negotiate(accept_encoding: str, offered=encodings) -> str:
+    """
+    Best of `offered` (listed in server preference order) that Accept-Encoding allows,
+    honouring q-values and '*'. None means identity.
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities["gzip" if coding == "x-gzip" else coding] = quality
+    best, best_quality = None, 0.0
+    for coding in offered:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+######################################################################################
+
+class StreamCompressor:
+    """
+    Incremental compressor with one interface over gzip, brotli and zstd:
+    feed data through `compress()`, then call `flush()` once at the end.
+    """
+
+    def __init__(self, encoding: str, level: int = None):
+        if encoding not in encodings:
+            raise ValueError(f"Unsupported content coding '{encoding}'. Available: {', '.join(encodings)}.")
+        self.encoding = encoding
+        level = default_levels[encoding] if level is None else level
+        if encoding == 'gzip':
+            # wbits 31: zlib stream with a gzip header and trailer.
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        elif hasattr(zstd, 'ZstdCompressor') and hasattr(zstd.ZstdCompressor, 'compressobj'):
+            self._compressor = zstd.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = zstd.ZstdCompressor(level=level)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def compress_file(path: str, encoding: str, level: int = None, chunk_size: int = 256 * 1024) -> bytes:
+    """
+    Blocking. Compress a whole file, reading it `chunk_size` bytes at a time.
+    """
+    compressor = StreamCompressor(encoding, level)
+    parts = []
+    with open(path, 'rb') as fd:
+        while chunk := fd.read(chunk_size):
+            parts.append(compressor.compress(chunk))
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+async def compress_file_chunks(path: str, encoding: str, executor: Executor = None,
+                               level: int = None, chunk_size: int = 256 * 1024):
+    """
+    Async generator of compressed chunks of a file. Reading and compressing
+    happen in `executor` (the default one if None), one chunk per hop, so the
+    event loop never blocks on a large file.
+    """
+    loop = asyncio.get_running_loop()
+    compressor = StreamCompressor(encoding, level)
+
+    def next_chunk(fd):
+        data = fd.read(chunk_size)
+        if not data:
+            return compressor.flush(), True
+        return compressor.compress(data), False
+
+    fd = await loop.run_in_executor(executor, open, path, 'rb')
+    try:
+        done = False
+        while not done:
+            chunk, done = await loop.run_in_executor(executor, next_chunk, fd)
+            if chunk:
+                yield chunk
+    finally:
+        fd.close()
+
+######################################################################################
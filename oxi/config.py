@@ -5,13 +5,51 @@ import os, json
 Config = {
     'static_dir': 'static',
     'template_dir': 'templates',
+    'template_cache_size': 8 * 1024 * 1024,
+    'template_bytecode_dir': None,
+    'template_inline_dots': True,
     'upload_dir': 'uploads',
     'log_dir': 'logs',
     'cgi_dir': 'cgi-bin',
     'allow_dirlisting': True,
+    'dirlisting_sort': 'name',
+    'dirlisting_page_size': 1000,
+    'dirlisting_cache_size': 16 * 1024 * 1024,
     'allow_cgi': True,
     'chunk_size': 8192,
     'index_files': ['index.html', 'index.htm'],
+    'keep_alive': True,
+    'keep_alive_timeout': 5,
+    'header_timeout': 10,
+    'keep_alive_max_requests': 100,
+    'max_head_size': 65536,
+    'max_header_count': 100,
+    'workers': 1,
+    'graceful_timeout': 10,
+    'server_mode': 'stream',
+    'event_loop': 'asyncio',
+    'static_cache_size': 64 * 1024 * 1024,
+    'static_cache_max_file': 256 * 1024,
+    'static_cache_revalidate': 1.0,
+    'etag': 'strong',
+    'cache_control': {'*': 'no-cache'},
+    'compression': True,
+    'precompressed': True,
+    'compression_min_size': 256,
+    'compression_cache_size': 32 * 1024 * 1024,
+    'compression_cache_max_file': 4 * 1024 * 1024,
+    'compression_workers': 2,
+    'faststart_cache_size': 32 * 1024 * 1024,
+    'faststart_sidecar_dir': None,
+    'hls': True,
+    'hls_segment_duration': 4.0,
+    'fragment_cache_size': 32 * 1024 * 1024,
+    'mp4_seek': True,
+    'fs_workers': 8,
+    'fs_queue_warning': 64,
+    'access_log': '-',
+    'access_log_format': 'common',
+    'log_level': 'info',
 }
 
 if os.path.exists('config.json'):
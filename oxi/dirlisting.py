@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import asyncio, json, os, stat, time
+from html import escape
+from operator import itemgetter
+from urllib.parse import quote, urlencode
+
+from .utils import LRUCache
+from .fsexecutor import FileSystemExecutor
+
+######################################################################################
+
+# Listing orders, by entry field. Directories always come first.
+sort_keys = {'name': 0, 'size': 2, 'mtime': 3}
+
+class DirectoryListing:
+    """
+    A directory as read by one os.scandir pass: a (name, is_dir, size, mtime) tuple per
+    entry, plus the directory's own mtime to tell when it has to be read again.
+    Sorted views are made on first use and kept.
+    """
+
+    __slots__ = ('path', 'mtime_ns', 'entries', 'views', 'name_bytes')
+
+    # Rough cost of one entry and of one sorted view slot, charged against the cache budget.
+    entry_overhead = 160
+    view_overhead = 8
+
+    def __init__(self, path: str, mtime_ns: int, entries: list):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.entries = entries
+        self.views = {}
+        self.name_bytes = sum(len(entry[0]) for entry in entries)
+
+    @classmethod
+    def scan(cls, path: str):
+        """
+        Blocking. Read `path` in a single os.scandir pass.
+        Returns None if it isn't a readable directory.
+        """
+        try:
+            st = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISDIR(st.st_mode):
+            return None
+        entries = []
+        try:
+            with os.scandir(path) as scanner:
+                for entry in scanner:
+                    try:
+                        is_dir = entry.is_dir()
+                        entry_stat = entry.stat()
+                        size, mtime = (0 if is_dir else entry_stat.st_size), entry_stat.st_mtime
+                    except OSError:
+                        # A dangling symlink, or gone since the directory was read.
+                        is_dir, size, mtime = False, 0, 0.0
+                    entries.append((entry.name, is_dir, size, mtime))
+        except OSError:
+            return None
+        # Stamped with the mtime from before the scan: a change during it forces a rescan next time.
+        return cls(path, st.st_mtime_ns, entries)
+
+    def sorted(self, key: str = 'name', reverse: bool = False) -> list:
+        """
+        Entries ordered by `key` (see sort_keys), directories first either way.
+        """
+        view = self.views.get((key, reverse))
+        if view is None:
+            index = sort_keys[key]
+            order = itemgetter(0) if index == 0 else itemgetter(index, 0)
+            dirs = sorted((entry for entry in self.entries if entry[1]), key=order, reverse=reverse)
+            files = sorted((entry for entry in self.entries if not entry[1]), key=order, reverse=reverse)
+            view = self.views[key, reverse] = dirs + files
+        return view
+
+    @property
+    def memory(self) -> int:
+        return self.name_bytes + len(self.entries) * (self.entry_overhead + self.view_overhead * max(1, len(self.views)))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"<DirectoryListing {self.path} {len(self.entries)} entries>"
+
+######################################################################################
+
+class DirectoryListingCache:
+    """
+    Directory listings keyed by path, evicted LRU under a byte budget.
+    Every lookup costs one stat of the directory in a worker thread; the directory
+    is only read again when its mtime has changed (an entry was added, removed or
+    renamed). File sizes and times shown may lag behind until then.
+    Reads run in `executor` (a FileSystemExecutor) when given, else in the default one.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, executor: FileSystemExecutor = None):
+        self.entries = LRUCache(max_bytes)
+        self.executor = executor
+
+    def load(self, path: str, listing: DirectoryListing = None, sort: str = 'name', reverse: bool = False):
+        """
+        Blocking. Revalidate `listing` against the directory, or read it anew, and make
+        sure the (`sort`, `reverse`) view exists. None if `path` isn't a directory (any more).
+        """
+        if listing is not None:
+            try:
+                st = os.stat(path)
+            except (OSError, ValueError):
+                return None
+            if not stat.S_ISDIR(st.st_mode):
+                return None
+            if st.st_mtime_ns != listing.mtime_ns:
+                listing = None
+        if listing is None:
+            listing = DirectoryListing.scan(path)
+        if listing is not None:
+            listing.sorted(sort, reverse)
+        return listing
+
+    async def get(self, path: str, sort: str = 'name', reverse: bool = False):
+        """
+        The DirectoryListing for `path`, sorted view ready, or None if it isn't a directory.
+        Costs one thread pool hop; no listing work at all happens on the event loop.
+        """
+        path = os.path.normpath(path)
+        cached = self.entries.peek(path)
+        if self.executor is not None:
+            listing = await self.executor.run(self.load, path, cached, sort, reverse, key=('listing', path, sort, reverse))
+        else:
+            listing = await asyncio.to_thread(self.load, path, cached, sort, reverse)
+        if listing is None:
+            self.entries.pop(path)
+        else:
+            self.entries.put(path, listing, listing.memory)
+        return listing
+
+    def invalidate(self, path: str = None) -> None:
+        if path is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(path)
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+######################################################################################
+
+listing_head = """<!DOCTYPE html>
+<html><head><title>Directory Listing</title>
+<style>
+    body {
+        background-color: #f0f0f0;
+        font-family: Helvetica, Arial, sans-serif;
+        font-size: 16px;
+    }
+    .green {
+        color: green;
+    }
+    .silver {
+        color: silver;
+    }
+    .black {
+        color: black;
+    }
+    .renglon_dirlist {
+        margin-left: 1em;
+        width: 50%;
+        max-width: 50%;
+        display: flex;
+        flex-direction: row;
+        justify-content: space-between;
+        align-items: center;
+        list-style-type: none;
+        font-size: 150%;
+        margin-bottom: 0.5em;
+    }
+    a.link {
+        text-decoration: none;
+        color: steelblue;
+        font-weight: bold;
+    }
+    a.link:hover {
+        color: black;
+    }
+    .pages {
+        margin-left: 1em;
+    }
+    @media (max-width: 798px) {
+        .renglon_dirlist {
+            width: 90%;
+            max-width: 90%;
+        }
+    }
+</style>
+</head><body style="margin-left: 1em; margin-right: 1em;">
+"""
+
+def page_query(sort: str, reverse: bool, offset: int = None, limit: int = None) -> str:
+    params = {'sort': sort, 'order': 'desc' if reverse else 'asc'}
+    if limit:
+        params.update(offset=offset, limit=limit)
+    return "?" + urlencode(params)
+
+def html_listing(path: str, entries: list, total: int, offset: int, limit: int,
+                 sort: str = 'name', reverse: bool = False, server_software: str = "",
+                 rows_per_chunk: int = 500):
+    """
+    Generator of the HTML page for `entries` (one page of a `total` entries listing,
+    starting at `offset`), in pieces of `rows_per_chunk` rows.
+    """
+    base = path.rstrip("/") + "/"
+    parent = base.rstrip("/").rpartition("/")[0] + "/"
+    shown = f"{offset + 1:,}-{offset + len(entries):,} of {total:,}" if entries else f"0 of {total:,}"
+    sorting = " | ".join(f'<a class="link" href="{page_query(key, key == sort and not reverse)}">{key}</a>'
+                         for key in sort_keys)
+    pages = []
+    if limit and offset > 0:
+        pages.append(f'<a class="link" href="{page_query(sort, reverse, max(0, offset - limit), limit)}">&laquo; previous</a>')
+    if limit and offset + limit < total:
+        pages.append(f'<a class="link" href="{page_query(sort, reverse, offset + limit, limit)}">next &raquo;</a>')
+    yield (listing_head +
+           f'<h2>Directory listing for <span class="green">.{escape(path)}</span></h2>\n'
+           f'<hr>\n<p style="margin-bottom: 1em; text-align: center; font-family: Times New Roman; font-size: 16px;">'
+           f'{server_software}</p>\n<hr>\n'
+           f'<p class="pages">Entries {shown} &middot; sort by {sorting} &middot; {" ".join(pages)}</p>\n<ul>\n'
+           f'<li class="renglon_dirlist"><a class="link" title="Home" href="/">.</a></li>\n'
+           f'<li class="renglon_dirlist"><a class="link" title="{escape(parent)}" href="{quote(parent)}">..</a></li>\n')
+    for start in range(0, len(entries), rows_per_chunk):
+        rows = []
+        for name, is_dir, size, mtime in entries[start:start + rows_per_chunk]:
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime))
+            details = '<span class="silver">[DIR]</span>' if is_dir \
+                      else f'<span style="text-align: right;" class="black">{size:,} bytes</span>'
+            rows.append(f'<li class="renglon_dirlist"><a class="link" href="{quote(base + name)}{"/" if is_dir else ""}">'
+                        f'{escape(name)}</a><span class="silver">{modified}</span>{details}</li>\n')
+        yield "".join(rows)
+    yield f'</ul>\n<p class="pages">{" ".join(pages)}</p>\n</body></html>'
+
+def json_listing(path: str, entries: list, total: int, offset: int, limit: int,
+                 rows_per_chunk: int = 500):
+    """
+    Generator of the JSON document for one page of a listing, in pieces of `rows_per_chunk` entries.
+    """
+    yield (f'{{"path": {json.dumps(path)}, "total": {total}, "offset": {offset}, '
+           f'"limit": {limit or "null"}, "entries": [')
+    for start in range(0, len(entries), rows_per_chunk):
+        yield ("," if start else "") + ",".join(
+            json.dumps({'name': name, 'type': 'dir' if is_dir else 'file', 'size': size, 'mtime': mtime})
+            for name, is_dir, size, mtime in entries[start:start + rows_per_chunk])
+    yield "]}"
+
+######################################################################################
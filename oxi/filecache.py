@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import asyncio, os, stat, time
+from mimetypes import guess_type
+from email.utils import formatdate
+from typing import Callable
+
+from .utils import LRUCache
+from .fsexecutor import FileSystemExecutor
+
+######################################################################################
+
+class StaticFile:
+    """
+    Everything needed to serve one static file, gathered with a single stat:
+    stat fields, validators, MIME type, precomputed response heads, precompressed
+    siblings and, for small files, the body.
+    """
+
+    __slots__ = ('path', 'size', 'mtime', 'mtime_ns', 'ino', 'executable', 'etag', 'last_modified',
+                 'content_type', 'body', 'heads', 'siblings', 'checked')
+
+    # Rough per-entry overhead, on top of body and heads, charged against the cache budget.
+    overhead = 512
+
+    def __init__(self, path: str, st: os.stat_result, executable: bool = False):
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.ino = st.st_ino
+        self.executable = executable
+        # Strong validator: changes whenever the file is replaced, touched or resized.
+        self.etag = f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.content_type = guess_type(path)[0] or "application/octet-stream"
+        self.body = None
+        # Response heads keyed by (status, keep_alive).
+        self.heads = {}
+        # Precompressed variants found next to the file: {content coding: path}.
+        self.siblings = {}
+        self.checked = time.monotonic()
+
+    @classmethod
+    def load(cls, path: str, make_heads: Callable = None, max_body_size: int = 0, siblings: dict = None):
+        """
+        Blocking. Stat `path` and build its entry, reading the body if it is at most
+        `max_body_size` bytes and looking for the `siblings` ({coding: suffix}) of it.
+        Returns None if `path` isn't a regular file.
+        """
+        try:
+            st = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        entry = cls(path, st, executable=bool(st.st_mode & 0o111) and os.access(path, os.X_OK))
+        if st.st_size <= max_body_size:
+            try:
+                with open(path, 'rb') as fd:
+                    body = fd.read(st.st_size + 1)
+            except OSError:
+                return None
+            # Changed while we were reading: serve it from disk until it settles.
+            if len(body) == st.st_size:
+                entry.body = body
+        if siblings and not path.endswith(tuple(siblings.values())):
+            entry.siblings = {coding: path + suffix for coding, suffix in siblings.items()
+                              if os.path.isfile(path + suffix)}
+        if make_heads is not None:
+            entry.heads = make_heads(entry)
+        return entry
+
+    def same_file(self, st: os.stat_result) -> bool:
+        return (st.st_mtime_ns, st.st_size, st.st_ino) == (self.mtime_ns, self.size, self.ino)
+
+    @property
+    def memory(self) -> int:
+        return len(self.body or b"") + sum(map(len, self.heads.values())) + self.overhead
+
+    def __repr__(self):
+        cached = "cached body" if self.body is not None else "on disk"
+        return f"<StaticFile {self.path} {self.size} bytes {self.content_type} ({cached})>"
+
+######################################################################################
+
+class StaticFileCache:
+    """
+    Static files keyed by resolved path, evicted LRU under a byte budget.
+
+    An entry younger than `revalidate_after` seconds is served without any I/O.
+    Past that, one stat in a worker thread checks mtime, size and inode, and the
+    entry is rebuilt only if the file changed. `make_heads(entry)` returns the
+    entry's precomputed response heads. `siblings` ({coding: suffix}) are looked
+    up when an entry is built; they are rechecked when the file itself changes.
+    Loads run in `executor` (a FileSystemExecutor, coalescing concurrent loads of
+    one path) or, without one, in the default executor.
+    """
+
+    def __init__(self, make_heads: Callable = None, max_bytes: int = 64 * 1024 * 1024,
+                 max_body_size: int = 256 * 1024, revalidate_after: float = 1.0, siblings: dict = None,
+                 executor: FileSystemExecutor = None):
+        self.make_heads = make_heads
+        self.executor = executor
+        self.siblings = siblings
+        self.max_body_size = max_body_size
+        self.revalidate_after = revalidate_after
+        self.entries = LRUCache(max_bytes)
+
+    def lookup(self, path: str):
+        """
+        The cached entry for `path` if it is still fresh, without touching the file system.
+        """
+        entry = self.entries.get(path)
+        if entry is not None and time.monotonic() - entry.checked < self.revalidate_after:
+            return entry
+        return None
+
+    def load(self, path: str, entry: StaticFile = None):
+        """
+        Blocking. Revalidate `entry` against the file, or build a new one.
+        Returns None if `path` isn't a regular file (any more).
+        """
+        if entry is not None:
+            try:
+                st = os.stat(path)
+            except (OSError, ValueError):
+                return None
+            if entry.same_file(st):
+                entry.checked = time.monotonic()
+                return entry
+        return StaticFile.load(path, self.make_heads, self.max_body_size, self.siblings)
+
+    async def get(self, path: str):
+        """
+        The StaticFile for `path`, or None if it isn't a regular file.
+        Costs at most one thread pool hop, none for fresh entries.
+        """
+        entry = self.lookup(path)
+        if entry is not None:
+            return entry
+        stale = self.entries.peek(path)
+        if self.executor is not None:
+            entry = await self.executor.run(self.load, path, stale, key=('static', path))
+        else:
+            entry = await asyncio.to_thread(self.load, path, stale)
+        if entry is None:
+            self.entries.pop(path)
+        elif entry is not stale:
+            self.entries.put(path, entry, entry.memory)
+        return entry
+
+    def invalidate(self, path: str = None) -> None:
+        if path is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(path)
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+######################################################################################
@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+
+import struct, sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, groupby, repeat
+from operator import add, sub
+from urllib.parse import quote
+
+from .mp4parser import Mp4, Atom, FaststartLayout, read_offsets, uint32_code, uint64_code
+
+######################################################################################
+
+int32_code = next(code for code in 'il' if array(code).itemsize == 4)
+
+# trun sample flags: sync samples depend on nothing, the others on earlier ones.
+sync_flags = 0x02000000
+non_sync_flags = 0x01010000
+
+def box(name: bytes, *payloads: bytes) -> bytes:
+    """
+    An atom named `name` around `payloads`.
+    """
+    size = 8 + sum(map(len, payloads))
+    return b"".join((struct.pack(">I", size), name, *payloads))
+
+def full_box(name: bytes, version: int, flags: int, *payloads: bytes) -> bytes:
+    return box(name, struct.pack(">I", (version << 24) | flags), *payloads)
+
+def big_endian(values, code: str = uint32_code) -> bytes:
+    packed = array(code, values)
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+def run_lengths(values) -> list:
+    """
+    (count, value) pairs, flattened, for the runs of equal `values`: stts and ctts entries.
+    """
+    return list(chain.from_iterable((sum(1 for _ in run), value) for value, run in groupby(values)))
+
+def with_duration(atom: bytes, duration: int) -> bytes:
+    """
+    An mvhd, tkhd or mdhd atom with its duration field set to `duration`.
+    """
+    version = atom[8]
+    position = (36 if version == 1 else 28) if atom[4:8] == b'tkhd' else (32 if version == 1 else 24)
+    width = 8 if version == 1 else 4
+    return atom[:position] + duration.to_bytes(width, byteorder='big') + atom[position + width:]
+
+def read_table(data: bytes, code: str, count: int, position: int = 16) -> array:
+    """
+    `count` big-endian 32 bit entries of a sample table atom, past its header and entry count.
+    """
+    table = array(code)
+    table.frombytes(data[position:position + 4 * count])
+    if sys.byteorder == 'little':
+        table.byteswap()
+    return table
+
+######################################################################################
+
+class Track:
+    """
+    The sample tables of one track, expanded into flat arrays: per sample its file
+    offset, size, decode time and, if the track has any, composition offset; plus
+    the indexes of the sync samples (None when every sample is one).
+    `times` has one entry more than there are samples: the track's end.
+    `skeleton` is the trak atom without its sample tables, as (name, children)
+    for the containers down to stbl and raw bytes for everything else.
+    """
+
+    __slots__ = ('track_id', 'handler', 'timescale', 'offsets', 'sizes', 'times', 'cts', 'sync',
+                 'description', 'skeleton')
+
+    def __init__(self, track_id: int, handler: str, timescale: int, offsets: array, sizes: array,
+                 times: array, cts: array = None, sync: array = None, description: int = 1,
+                 skeleton: tuple = None):
+        self.track_id = track_id
+        self.handler = handler
+        self.timescale = timescale
+        self.offsets = offsets
+        self.sizes = sizes
+        self.times = times
+        self.cts = cts
+        self.sync = sync
+        # The sample description all samples use, None if they use several.
+        self.description = description
+        self.skeleton = skeleton
+
+    @classmethod
+    def load(cls, mp4: Mp4, trak: Atom):
+        """
+        Read `trak`'s tables. Returns None for tracks other than video and audio.
+        """
+        atoms = {}
+
+        def collect(atom: Atom):
+            for child in atom.children:
+                atoms.setdefault(child.name, child)
+                collect(child)
+
+        collect(trak)
+        data = {name: mp4.mm[atom.offset:atom.offset + atom.size] for name, atom in atoms.items()
+                if name in ('tkhd', 'mdhd', 'hdlr', 'stsz', 'stsc', 'stco', 'co64', 'stts', 'ctts', 'stss')}
+        handler = data['hdlr'][16:20].decode('latin-1') if 'hdlr' in data else ''
+        if handler not in ('vide', 'soun'):
+            return None
+        if 'stsz' not in data or 'stsc' not in data or 'stts' not in data or not ('stco' in data or 'co64' in data):
+            raise ValueError("Track without the sample tables needed (stz2 is not supported).")
+        tkhd, mdhd = data['tkhd'], data['mdhd']
+        track_id = struct.unpack_from(">I", tkhd, 28 if tkhd[8] == 1 else 20)[0]
+        timescale = struct.unpack_from(">I", mdhd, 28 if mdhd[8] == 1 else 20)[0]
+
+        stsz = data['stsz']
+        sample_size, count = struct.unpack_from(">II", stsz, 12)
+        sizes = array(uint32_code, repeat(sample_size, count)) if sample_size else read_table(stsz, uint32_code, count, 20)
+
+        chunk_table = data.get('stco') or data['co64']
+        chunk_count = struct.unpack_from(">I", chunk_table, 12)[0]
+        chunks = read_offsets(chunk_table, 16, chunk_count, 4 if 'stco' in data else 8)
+
+        # stsc runs: (first chunk, samples per chunk, description index); file offsets chunk by chunk.
+        stsc = data['stsc']
+        runs = read_table(stsc, uint32_code, 3 * struct.unpack_from(">I", stsc, 12)[0])
+        offsets = array(uint64_code)
+        sample = 0
+        for run in range(0, len(runs), 3):
+            first = runs[run] - 1
+            last = runs[run + 3] - 1 if run + 3 < len(runs) else chunk_count
+            per_chunk = runs[run + 1]
+            for chunk in range(first, last):
+                offsets.extend(accumulate(sizes[sample:sample + per_chunk - 1], initial=int(chunks[chunk])))
+                sample += per_chunk
+        if sample < count:
+            raise ValueError(f"Chunk tables hold {sample} samples, stsz {count}.")
+        del offsets[count:]
+
+        stts = data['stts']
+        pairs = read_table(stts, uint32_code, 2 * struct.unpack_from(">I", stts, 12)[0])
+        deltas = chain.from_iterable(map(repeat, pairs[1::2], pairs[0::2]))
+        times = array(uint64_code, accumulate(deltas, initial=0))
+        if len(times) < count + 1:
+            raise ValueError(f"stts covers {len(times) - 1} samples, stsz {count}.")
+        del times[count + 1:]
+
+        cts = None
+        if 'ctts' in data:
+            ctts = data['ctts']
+            pairs = read_table(ctts, int32_code, 2 * struct.unpack_from(">I", ctts, 12)[0])
+            cts = array(int32_code, chain.from_iterable(map(repeat, pairs[1::2], pairs[0::2])))
+            cts.extend(repeat(0, max(0, count - len(cts))))
+            del cts[count:]
+
+        sync = None
+        if 'stss' in data:
+            stss = data['stss']
+            sync = array(uint32_code, (number - 1 for number in
+                                       read_table(stss, uint32_code, struct.unpack_from(">I", stss, 12)[0])))
+        descriptions = set(runs[2::3])
+        description = descriptions.pop() if len(descriptions) == 1 else None
+
+        def skeleton(atom: Atom):
+            if atom.name == 'stbl':
+                return (b'stbl', [mp4.mm[child.offset:child.offset + child.size]
+                                  for child in atom.children if child.name == 'stsd'])
+            if atom.name in ('trak', 'mdia', 'minf'):
+                return (atom.name.encode('latin-1'), [skeleton(child) for child in atom.children])
+            return mp4.mm[atom.offset:atom.offset + atom.size]
+
+        return cls(track_id, handler, timescale, offsets, sizes, times, cts, sync, description, skeleton(trak))
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def is_sync(self, sample: int) -> bool:
+        if self.sync is None:
+            return True
+        index = bisect_left(self.sync, sample)
+        return index < len(self.sync) and self.sync[index] == sample
+
+    def sample_at(self, time: int) -> int:
+        """
+        Index of the first sample decoded at or after `time` (in this track's timescale).
+        """
+        return bisect_left(self.times, time, 0, len(self.sizes))
+
+    def traf(self, first: int, last: int, data_offset: int) -> bytes:
+        """
+        The traf atom for samples `first` to `last` (exclusive), their data `data_offset`
+        bytes from the start of the moof.
+        """
+        count = last - first
+        columns = 4 if self.cts is not None else 3
+        entries = array(uint32_code, bytes(4 * columns * count))
+        entries[0::columns] = array(uint32_code, map(sub, self.times[first + 1:last + 1], self.times[first:last]))
+        entries[1::columns] = self.sizes[first:last]
+        flags = array(uint32_code, repeat(sync_flags if self.sync is None else non_sync_flags, count))
+        if self.sync is not None:
+            for index in range(bisect_left(self.sync, first), bisect_left(self.sync, last)):
+                flags[self.sync[index] - first] = sync_flags
+        entries[2::columns] = flags
+        if columns == 4:
+            # Signed offsets, written as their two's complement (trun version 1).
+            entries[3::columns] = array(uint32_code, self.cts[first:last].tobytes())
+        if sys.byteorder == 'little':
+            entries.byteswap()
+        # data-offset, sample-duration, sample-size, sample-flags and maybe composition offset present.
+        trun_flags = 0x000001 | 0x000100 | 0x000200 | 0x000400 | (0x000800 if columns == 4 else 0)
+        return box(b'traf',
+                   full_box(b'tfhd', 0, 0x020000, struct.pack(">I", self.track_id)),
+                   full_box(b'tfdt', 1, 0, struct.pack(">Q", self.times[first])),
+                   full_box(b'trun', 1 if columns == 4 else 0, trun_flags,
+                            struct.pack(">Ii", count, data_offset), entries.tobytes()))
+
+    def tables(self, first: int, shift: int, width: int = 4) -> list:
+        """
+        stbl tables (all but stsd) for the samples from `first` on, their data
+        moved by `shift` bytes; chunk offsets `width` bytes wide. Samples adjacent
+        in the file share a chunk.
+        """
+        if self.description is None:
+            raise ValueError(f"Track {self.track_id} uses several sample descriptions.")
+        count = len(self) - first
+        offsets, sizes = self.offsets[first:], self.sizes[first:]
+        chunk_offsets, per_chunk, previous_end = [], [], None
+        for offset, size in zip(offsets, sizes):
+            if offset != previous_end:
+                chunk_offsets.append(offset + shift)
+                per_chunk.append(0)
+            per_chunk[-1] += 1
+            previous_end = offset + size
+        stsc, chunk_number = [], 1
+        for samples, run in groupby(per_chunk):
+            stsc.extend((chunk_number, samples, self.description))
+            chunk_number += sum(1 for _ in run)
+        stts = run_lengths(map(sub, self.times[first + 1:], self.times[first:-1]))
+        tables = [full_box(b'stts', 0, 0, struct.pack(">I", len(stts) // 2), big_endian(stts))]
+        if self.cts is not None:
+            ctts = run_lengths(self.cts[first:])
+            tables.append(full_box(b'ctts', 1 if min(ctts[1::2], default=0) < 0 else 0, 0,
+                                   struct.pack(">I", len(ctts) // 2), big_endian(ctts, int32_code)))
+        if self.sync is not None:
+            sync = [sample - first + 1 for sample in self.sync[bisect_left(self.sync, first):]]
+            tables.append(full_box(b'stss', 0, 0, struct.pack(">I", len(sync)), big_endian(sync)))
+        tables.append(full_box(b'stsc', 0, 0, struct.pack(">I", len(stsc) // 3), big_endian(stsc)))
+        tables.append(full_box(b'stsz', 0, 0, struct.pack(">II", 0, count), big_endian(sizes)))
+        tables.append(full_box(b'stco' if width == 4 else b'co64', 0, 0, struct.pack(">I", len(chunk_offsets)),
+                               big_endian(chunk_offsets, uint32_code if width == 4 else uint64_code)))
+        return tables
+
+    def trak(self, tables, movie_duration: int = None, media_duration: int = None, drop: tuple = ()) -> bytes:
+        """
+        The trak atom from `skeleton`, with `tables` in stbl, durations set when given
+        and the leaf atoms named in `drop` left out.
+        """
+
+        def build(node) -> bytes:
+            if isinstance(node, tuple):
+                name, children = node
+                parts = [build(child) for child in children
+                         if isinstance(child, tuple) or child[4:8] not in drop]
+                return box(name, *parts, *(tables if name == b'stbl' else ()))
+            if node[4:8] == b'tkhd' and movie_duration is not None:
+                return with_duration(node, movie_duration)
+            if node[4:8] == b'mdhd' and media_duration is not None:
+                return with_duration(node, media_duration)
+            return node
+
+        return build(self.skeleton)
+
+    def runs(self, first: int, last: int):
+        """
+        (file offset, length) of the data of samples `first` to `last` (exclusive), adjacent samples merged.
+        """
+        start, length = None, 0
+        for offset, size in zip(self.offsets[first:last], self.sizes[first:last]):
+            if start is not None and start + length == offset:
+                length += size
+                continue
+            if start is not None:
+                yield start, length
+            start, length = offset, size
+        if start is not None:
+            yield start, length
+
+    @property
+    def memory(self) -> int:
+        tables = (self.offsets, self.sizes, self.times, self.cts, self.sync)
+        return sum(table.itemsize * len(table) for table in tables if table is not None) + 512
+
+######################################################################################
+
+class FragmentedMp4:
+    """
+    An MP4 file served as fragmented MP4 (CMAF style): an init segment (ftyp and a
+    moov without samples) and media segments, each one moof plus mdat starting on
+    a keyframe of the main track, about `segment_duration` seconds apiece. Only the
+    sample tables and segment boundaries are kept; fragments are put together on
+    request as FaststartLayouts, so their samples go out straight from the file.
+    The same tables cut the file at a keyframe for seeking (`trim`).
+    """
+
+    __slots__ = ('path', 'size', 'ftyp', 'mvhd', 'init', 'tracks', 'boundaries', 'durations')
+
+    def __init__(self, path: str, size: int, ftyp: bytes, mvhd: bytes, tracks: list, boundaries: list,
+                 durations: list):
+        self.path = path
+        self.size = size
+        self.ftyp = ftyp
+        self.mvhd = mvhd
+        self.init = self.init_segment(mvhd, tracks)
+        self.tracks = tracks
+        # Per segment, its first sample in each track; one more for the end.
+        self.boundaries = boundaries
+        self.durations = durations
+
+    @classmethod
+    def load(cls, path: str, segment_duration: float = 4.0):
+        """
+        Blocking. Parse `path`'s sample tables and cut it into segments.
+        """
+        with Mp4(path) as mp4:
+            if not mp4.moov or not mp4.mdat:
+                raise ValueError(f"{path} has no moov or no mdat.")
+            if any(child.name == 'mvex' for child in mp4.moov.children):
+                raise ValueError(f"{path} is fragmented already.")
+            traks = [child for child in mp4.moov.children if child.name == 'trak']
+            tracks = [track for track in (Track.load(mp4, trak) for trak in traks) if track is not None and len(track)]
+            if not tracks:
+                raise ValueError(f"{path} has no video or audio samples.")
+            mvhd = next(child for child in mp4.moov.children if child.name == 'mvhd')
+            mvhd = mp4.mm[mvhd.offset:mvhd.offset + mvhd.size]
+            ftyp = mp4.mm[mp4.ftyp.offset:mp4.ftyp.offset + mp4.ftyp.size] if mp4.ftyp else None
+            size = mp4.filesize
+        boundaries, durations = cls.segment(tracks, segment_duration)
+        return cls(path, size, ftyp, mvhd, tracks, boundaries, durations)
+
+    @staticmethod
+    def init_segment(mvhd: bytes, tracks: list) -> bytes:
+        """
+        ftyp and moov: mvhd, the traks with empty sample tables, and an mvex announcing fragments.
+        """
+        empty_tables = (full_box(b'stts', 0, 0, bytes(4)), full_box(b'stsc', 0, 0, bytes(4)),
+                        full_box(b'stsz', 0, 0, bytes(8)), full_box(b'stco', 0, 0, bytes(4)))
+        mvex = box(b'mvex', *(full_box(b'trex', 0, 0, struct.pack(">IIIII", track.track_id, 1, 0, 0, 0))
+                              for track in tracks))
+        ftyp = box(b'ftyp', b'iso6', struct.pack(">I", 0), b'iso6cmfcisommp41')
+        return ftyp + box(b'moov', mvhd, *(track.trak(empty_tables) for track in tracks), mvex)
+
+    @staticmethod
+    def main_track(tracks: list) -> Track:
+        """
+        The track cuts are made on: the first video track, or the first track if there is none.
+        """
+        return next((track for track in tracks if track.handler == 'vide'), tracks[0])
+
+    @classmethod
+    def segment(cls, tracks: list, segment_duration: float):
+        """
+        Segment boundaries: on sync samples of the main (first video) track, at least
+        `segment_duration` apart; the other tracks cut at the same instants.
+        """
+        main = cls.main_track(tracks)
+        step = max(1, int(segment_duration * main.timescale))
+        candidates = main.sync if main.sync is not None else range(len(main))
+        cuts = [0]
+        for sample in candidates:
+            if main.times[sample] >= main.times[cuts[-1]] + step:
+                cuts.append(sample)
+        instants = [main.times[sample] for sample in cuts] + [main.times[-1]]
+        boundaries = []
+        for index, instant in enumerate(instants):
+            last = index == len(instants) - 1
+            boundaries.append(tuple(len(track) if last else
+                                    track.sample_at(instant * track.timescale // main.timescale)
+                                    for track in tracks))
+        durations = [(instants[index + 1] - instants[index]) / main.timescale for index in range(len(cuts))]
+        return boundaries, durations
+
+    def __len__(self) -> int:
+        return len(self.durations)
+
+    def fragment(self, index: int) -> FaststartLayout:
+        """
+        Media segment `index`: moof and mdat head in memory, sample data as file ranges.
+        """
+        first, last = self.boundaries[index], self.boundaries[index + 1]
+        parts = [(track, first[n], last[n]) for n, track in enumerate(self.tracks) if last[n] > first[n]]
+        lengths = [sum(track.sizes[a:b]) for track, a, b in parts]
+        total = sum(lengths)
+        mdat_head = struct.pack(">I4s", 8 + total, b'mdat') if total + 8 <= 0xFFFFFFFF \
+                    else struct.pack(">I4sQ", 1, b'mdat', total + 16)
+
+        def moof(data_start: int) -> bytes:
+            trafs, position = [], data_start
+            for (track, a, b), length in zip(parts, lengths):
+                trafs.append(track.traf(a, b, position))
+                position += length
+            return box(b'moof', full_box(b'mfhd', 0, 0, struct.pack(">I", index + 1)), *trafs)
+
+        # Offsets are relative to the moof, whose size doesn't depend on them.
+        head = moof(len(moof(0)) + len(mdat_head)) + mdat_head
+        segments, position = [(0, len(head), head, None)], len(head)
+        for track, a, b in parts:
+            for file_offset, length in track.runs(a, b):
+                segments.append((position, length, None, file_offset))
+                position += length
+        return FaststartLayout(self.path, position, segments)
+
+    def keyframe(self, start: float) -> int:
+        """
+        The main track's last sync sample at or before `start` seconds.
+        """
+        main = self.main_track(self.tracks)
+        sample = max(0, bisect_right(main.times, int(start * main.timescale), 0, len(main)) - 1)
+        if main.sync is not None:
+            sample = main.sync[max(0, bisect_right(main.sync, sample) - 1)]
+        return sample
+
+    def trim(self, keyframe: int) -> FaststartLayout:
+        """
+        Blocking. The file as a regular faststart MP4 starting at the main track's
+        sample `keyframe` (see `keyframe()`): a rewritten moov, then one range of the
+        original mdat, from the first sample kept to the end of the last one.
+        Edit lists are dropped, since they refer to the original timeline.
+        """
+        main = self.main_track(self.tracks)
+        instant = main.times[keyframe]
+        kept = []
+        for track in self.tracks:
+            first = keyframe if track is main else track.sample_at(instant * track.timescale // main.timescale)
+            if first < len(track):
+                kept.append((track, first))
+        cut = min(track.offsets[first] for track, first in kept)
+        end = max(max(map(add, track.offsets[first:], track.sizes[first:])) for track, first in kept)
+        movie_timescale = struct.unpack_from(">I", self.mvhd, 28 if self.mvhd[8] == 1 else 20)[0]
+
+        def moov(shift: int, width: int) -> bytes:
+            traks, movie_duration = [], 0
+            for track, first in kept:
+                media_duration = track.times[-1] - track.times[first]
+                duration = media_duration * movie_timescale // track.timescale
+                movie_duration = max(movie_duration, duration)
+                traks.append(track.trak(track.tables(first, shift, width), duration, media_duration,
+                                        drop=(b'edts',)))
+            return box(b'moov', with_duration(self.mvhd, movie_duration), *traks)
+
+        ftyp = self.ftyp or box(b'ftyp', b'isom', struct.pack(">I", 512), b'isomiso2mp41')
+        length = end - cut
+        mdat_head = struct.pack(">I4s", 8 + length, b'mdat') if length + 8 <= 0xFFFFFFFF \
+                    else struct.pack(">I4sQ", 1, b'mdat', length + 16)
+        # The moov's size depends on the chunk offset width only, not on the offsets.
+        width = 4
+        head_size = len(ftyp) + len(moov(0, width)) + len(mdat_head)
+        if head_size + length > 0xFFFFFFFF:
+            width = 8
+            head_size = len(ftyp) + len(moov(0, width)) + len(mdat_head)
+        head = ftyp + moov(head_size - cut, width) + mdat_head
+        return FaststartLayout(self.path, len(head) + length, [(0, len(head), head, None),
+                                                                (len(head), length, None, cut)])
+
+    def playlist(self, name: str) -> str:
+        """
+        HLS media playlist for the file served as `name` (init and segments are `name` with a query).
+        """
+        uri = quote(name)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", f"#EXT-X-TARGETDURATION:{int(max(self.durations) + 0.999)}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-INDEPENDENT-SEGMENTS",
+                 f'#EXT-X-MAP:URI="{uri}?format=init"']
+        for index, duration in enumerate(self.durations):
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(f"{uri}?segment={index}")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    @property
+    def memory(self) -> int:
+        return len(self.init) * 2 + sum(track.memory for track in self.tracks) + 16 * len(self.tracks) * len(self.boundaries)
+
+    def __repr__(self):
+        return f"<FragmentedMp4 {self.path} {len(self.tracks)} tracks in {len(self)} segments>"
+
+######################################################################################
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import asyncio, os, stat, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from .accesslog import log
+
+######################################################################################
+
+class PathInfo:
+    """
+    What the server needs to know about a path, from a single stat:
+    existence, type, size, mtime and whether it is an executable file.
+    """
+
+    __slots__ = ('path', 'exists', 'is_file', 'is_dir', 'size', 'mtime', 'executable')
+
+    def __init__(self, path: str, st: os.stat_result = None, executable: bool = False):
+        self.path = path
+        self.exists = st is not None
+        self.is_file = st is not None and stat.S_ISREG(st.st_mode)
+        self.is_dir = st is not None and stat.S_ISDIR(st.st_mode)
+        self.size = st.st_size if st is not None else 0
+        self.mtime = st.st_mtime if st is not None else 0.0
+        self.executable = executable
+
+    def __bool__(self) -> bool:
+        return self.exists
+
+    def __repr__(self):
+        kind = "file" if self.is_file else "directory" if self.is_dir else "other" if self.exists else "missing"
+        return f"<PathInfo {self.path} {kind}{' executable' if self.executable else ''}>"
+
+def path_info(path: str) -> PathInfo:
+    """
+    Blocking. Stat `path` once; os.access only runs for regular files with an exec bit set.
+    """
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return PathInfo(path)
+    executable = stat.S_ISREG(st.st_mode) and bool(st.st_mode & 0o111) and os.access(path, os.X_OK)
+    return PathInfo(path, st, executable)
+
+######################################################################################
+
+class FileSystemExecutor:
+    """
+    Thread pool reserved for blocking file system calls, so a burst of cache-cold
+    requests neither waits behind nor starves the default executor.
+
+    Calls given a `key` are coalesced: while one is in flight, later calls with the
+    same key wait for its result instead of queueing the same work again. `stat()`
+    does that for path lookups. Queue depth and counters are in `stats()`, and a
+    warning is logged each time the queue grows past `queue_warning` calls.
+    """
+
+    def __init__(self, max_workers: int = 8, thread_name_prefix: str = "oxi-fs", queue_warning: int = 0):
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.queue_warning = queue_warning
+        self.pending = {}
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def _call(self, func: Callable, args: tuple):
+        with self._lock:
+            self.started += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.completed += 1
+
+    async def run(self, func: Callable, *args, key=None):
+        """
+        Run `func(*args)` in the pool. Concurrent calls with the same (hashable) `key` share one run.
+        """
+        loop = asyncio.get_running_loop()
+        if key is not None:
+            future = self.pending.get(key)
+            if future is not None and future.get_loop() is loop:
+                self.coalesced += 1
+                return await asyncio.shield(future)
+        self.submitted += 1
+        future = loop.run_in_executor(self.pool, self._call, func, args)
+        if self.queue_warning:
+            self._check_queue()
+        if key is None:
+            return await future
+        self.pending[key] = future
+
+        def forget(_):
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+        future.add_done_callback(forget)
+        # Shielded: one caller giving up must not cancel the lookup for the others.
+        return await asyncio.shield(future)
+
+    async def stat(self, path: str) -> PathInfo:
+        return await self.run(path_info, path, key=('stat', path))
+
+    def _check_queue(self) -> None:
+        depth = self.queue_depth
+        if depth >= self.queue_warning and not self._warned:
+            self._warned = True
+            log.warning("File system executor backlog: %s calls waiting for %s workers.", depth, self.max_workers)
+        elif depth < self.queue_warning // 2:
+            self._warned = False
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Calls submitted but not yet picked up by a worker.
+        """
+        return self.submitted - self.started
+
+    @property
+    def running(self) -> int:
+        return self.started - self.completed
+
+    def stats(self) -> dict:
+        return {'workers': self.max_workers, 'queued': self.queue_depth, 'running': self.running,
+                'in_flight_keys': len(self.pending), 'submitted': self.submitted,
+                'completed': self.completed, 'coalesced': self.coalesced}
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.pool.shutdown(wait=wait)
+
+######################################################################################
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+import re
+from collections.abc import Mapping
+from urllib.parse import unquote, parse_qsl
+
+######################################################################################
+
+SP_HT = (0x20, 0x09)
+
+class HttpParserError(ValueError):
+    """
+    Malformed or oversized request head. `status` is the response code to answer with.
+    """
+    def __init__(self, msg: str, status: int = 400):
+        super().__init__(msg)
+        self.status = status
+
+######################################################################################
+
+class Headers(Mapping):
+    """
+    Request headers kept as the bytes they arrived in.
+    Names match case-insensitively and values are only decoded when read.
+    Repeated fields are combined on `get` (cookies with '; ', anything else
+    with ', ') and are available one by one through `getall`.
+    """
+
+    __slots__ = ('_fields', '_index', '_repeated')
+
+    def __init__(self, fields: list = None):
+        # (name, value) byte pairs in arrival order.
+        self._fields = fields if fields is not None else []
+        self._index = None
+        self._repeated = None
+
+    def _build_index(self) -> dict:
+        index = {name.lower(): value for name, value in self._fields}
+        repeated = {}
+        if len(index) != len(self._fields):
+            for name, value in self._fields:
+                repeated.setdefault(name.lower(), []).append(value)
+            repeated = {name: values for name, values in repeated.items() if len(values) > 1}
+        self._index = index
+        self._repeated = repeated
+        return index
+
+    def raw_values(self, name: str) -> list:
+        index = self._index if self._index is not None else self._build_index()
+        key = name.lower().encode('latin-1')
+        if key in self._repeated:
+            return self._repeated[key]
+        value = index.get(key)
+        return [] if value is None else [value]
+
+    def getall(self, name: str, default: list = None) -> list:
+        values = self.raw_values(name)
+        if not values:
+            return [] if default is None else default
+        return [value.decode('latin-1') for value in values]
+
+    def get(self, name: str, default=None):
+        index = self._index if self._index is not None else self._build_index()
+        key = name.lower().encode('latin-1')
+        if key in self._repeated:
+            separator = b'; ' if key == b'cookie' else b', '
+            return separator.join(self._repeated[key]).decode('latin-1')
+        value = index.get(key)
+        return default if value is None else value.decode('latin-1')
+
+    def raw_items(self) -> list:
+        """
+        [name, value] byte pairs in arrival order, names lowercased (ASGI style).
+        """
+        return [[name.lower(), value] for name, value in self._fields]
+
+    def __getitem__(self, name: str) -> str:
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name) -> bool:
+        index = self._index if self._index is not None else self._build_index()
+        return isinstance(name, str) and name.lower().encode('latin-1') in index
+
+    def __iter__(self):
+        index = self._index if self._index is not None else self._build_index()
+        return (name.decode('latin-1') for name in index)
+
+    def __len__(self) -> int:
+        index = self._index if self._index is not None else self._build_index()
+        return len(index)
+
+    def __repr__(self):
+        return f"Headers({dict(self.items())!r})"
+
+######################################################################################
+
+class RequestHead:
+    """
+    Parsed request line plus headers.
+    """
+
+    __slots__ = ('method', 'target', 'version', 'headers', '_path', '_query_string')
+
+    def __init__(self, method: str, target: str, version: str, headers: Headers):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self._path = None
+        self._query_string = None
+
+    def _split_target(self):
+        target = self.target
+        if not target.startswith('/'):
+            # absolute-form (proxies) or '*': keep only the path part.
+            scheme_end = target.find('://')
+            if scheme_end != -1:
+                path_start = target.find('/', scheme_end + 3)
+                target = target[path_start:] if path_start != -1 else '/'
+        path, _, query_string = target.partition('?')
+        self._path = unquote(path.partition('#')[0])
+        self._query_string = query_string.partition('#')[0]
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._split_target()
+        return self._path
+
+    @property
+    def query_string(self) -> str:
+        if self._query_string is None:
+            self._split_target()
+        return self._query_string
+
+    @property
+    def query(self) -> dict:
+        return dict(parse_qsl(self.query_string)) if self.query_string else {}
+
+    def __repr__(self):
+        return f"<RequestHead {self.method} {self.target} {self.version}>"
+
+######################################################################################
+
+class HttpRequestParser:
+    """
+    Incremental, single-pass HTTP/1.x request head parser.
+
+    Bytes go in through `feed()` into one reusable buffer; `parse()` returns a
+    `RequestHead` once a full head is buffered and leaves whatever follows
+    (a body, the next pipelined request) in `buffer`. `parse_head()` parses a
+    head that has already been read in full, e.g. by `StreamReader.readuntil`.
+    """
+
+    def __init__(self, max_head_size: int = 65536, max_header_count: int = 100, max_line_size: int = 8190):
+        self.max_head_size = max_head_size
+        self.max_header_count = max_header_count
+        self.max_line_size = max_line_size
+        self.buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+
+    def parse(self):
+        """
+        Consume one request head from the buffer. Returns None if it isn't complete yet.
+        """
+        buffer = self.buffer
+        end = buffer.find(b"\r\n\r\n", max(0, self._scanned - 3))
+        if end == -1:
+            self._scanned = len(buffer)
+            if self._scanned > self.max_head_size:
+                raise HttpParserError("Request head too large.", 431)
+            return None
+        end += 4
+        if end > self.max_head_size:
+            raise HttpParserError("Request head too large.", 431)
+        head = bytes(memoryview(buffer)[:end])
+        del buffer[:end]
+        self._scanned = 0
+        return self.parse_head(head)
+
+    def take(self, size: int = -1) -> bytes:
+        """
+        Remove up to `size` (all, if negative) already buffered body bytes.
+        """
+        buffer = self.buffer
+        if size < 0 or size >= len(buffer):
+            data = bytes(buffer)
+            buffer.clear()
+        else:
+            data = bytes(memoryview(buffer)[:size])
+            del buffer[:size]
+        self._scanned = 0
+        return data
+
+    def parse_head(self, head: bytes) -> RequestHead:
+        """
+        Parse a complete head, terminating empty line included.
+        """
+        if len(head) > self.max_head_size:
+            raise HttpParserError("Request head too large.", 431)
+        # Splitting once in C beats walking offsets line by line in Python.
+        lines = head.split(b"\r\n")
+        first = 0
+        while first < len(lines) and not lines[first]:
+            # Stray empty lines before the request line are allowed (RFC 7230 3.5).
+            first += 1
+        if first >= len(lines) - 2 or lines[-2] or lines[-1]:
+            raise HttpParserError("Request head is incomplete.")
+        request_line = lines[first]
+        if len(request_line) > self.max_line_size:
+            raise HttpParserError("Request line too long.", 414)
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HttpParserError("Request line is malformed. Unable to split into method, path, and protocol.")
+        method, target, version = parts
+        if not version.startswith(b"HTTP/1."):
+            if version.startswith(b"HTTP/"):
+                raise HttpParserError(f"Protocol {version.decode('latin-1')} not supported.", 505)
+            raise HttpParserError("Request line is malformed. Missing method, path, or protocol.")
+        try:
+            target = target.decode('utf-8')
+        except UnicodeDecodeError:
+            raise HttpParserError("Request target is not valid UTF-8.")
+
+        header_lines = lines[first + 1:-2]
+        if len(head) > self.max_line_size and any(len(line) > self.max_line_size for line in header_lines):
+            raise HttpParserError("Header line too long.", 431)
+        fields = []
+        append = fields.append
+        for line in header_lines:
+            name, colon, value = line.partition(b":")
+            # strip() hands back the very same object when there is nothing to strip, so this
+            # one check sends obs-fold lines and blanks before the colon to the careful path.
+            if not colon or not name or name.strip(b" \t") is not name:
+                fields = self._parse_fields_strict(header_lines)
+                break
+            append((name, value.strip(b" \t")))
+        if len(fields) > self.max_header_count:
+            raise HttpParserError("Too many headers.", 431)
+
+        return RequestHead(method.decode('latin-1').upper(), target, version.decode('latin-1'), Headers(fields))
+
+    @staticmethod
+    def _parse_fields_strict(header_lines: list) -> list:
+        fields = []
+        for line in header_lines:
+            if not line:
+                raise HttpParserError("Headers block is malformed.")
+            if line[0] in SP_HT:
+                # obs-fold: the line continues the previous field's value.
+                if not fields:
+                    raise HttpParserError("Headers block starts with a continuation line.")
+                name, value = fields[-1]
+                fields[-1] = (name, value + b" " + line.strip(b" \t"))
+                continue
+            name, colon, value = line.partition(b":")
+            if not colon or not name or name[-1] in SP_HT:
+                raise HttpParserError(f"Header line is malformed: {line.decode('latin-1')!r}")
+            fields.append((name, value.strip(b" \t")))
+        return fields
+
+######################################################################################
+
+byte_range_spec = re.compile(r"\s*(\d*)\s*-\s*(\d*)\s*")
+
+def parse_range(value: str, size: int, max_ranges: int = 16):
+    """
+    Parse a Range header (RFC 7233) against a representation of `size` bytes.
+    Returns inclusive (first, last) pairs, overlapping ones merged; an empty list
+    if none is satisfiable; None if the header is to be ignored (another unit,
+    malformed, or more than `max_ranges` ranges).
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    specs = [part for part in spec.split(",") if part.strip()]
+    if not specs:
+        return None
+    for part in specs:
+        match = byte_range_spec.fullmatch(part)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first:
+            first = int(first)
+            if last and int(last) < first:
+                return None
+            if first >= size:
+                continue
+            last = min(int(last), size - 1) if last else size - 1
+        elif last:
+            # Suffix range: the final `last` bytes.
+            if int(last) == 0 or size == 0:
+                continue
+            first, last = max(0, size - int(last)), size - 1
+        else:
+            return None
+        ranges.append((first, last))
+        if len(ranges) > max_ranges:
+            return None
+    if len(ranges) > 1:
+        ordered = sorted(ranges)
+        if any(following[0] <= previous[1] + 1 for previous, following in zip(ordered, ordered[1:])):
+            merged = [ordered[0]]
+            for first, last in ordered[1:]:
+                if first <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+                else:
+                    merged.append((first, last))
+            ranges = merged
+    return ranges
+
+######################################################################################
@@ -3,56 +3,55 @@
 
 # test with: static/Media/Videos/Cele/Cele_patinando_cerca_de_Venecia.mp4
 
-import os, mmap, asyncio
+import os, sys, mmap, asyncio, json, hashlib, errno, glob, shutil, tempfile, time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from mimetypes import guess_type
 import argparse #, copy
 from . import __version__ as oxi_version
-from .utils import dual_mode
+from .utils import dual_mode, LRUCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
        
 class Smmap:
-    def __init__(self, fileno, offset:int = 0, limit:int =  0):
-        self._mmap = mmap.mmap(fileno, 0, flags=mmap.MAP_PRIVATE)
+    """
+    File-like window of `limit` bytes at `offset` into a memory map, with its own
+    position. Given an mmap, it is a view sharing that mapping, which stays its
+    owner's to close; given a file descriptor, it maps the file itself.
+    """
+
+    __slots__ = ('_mmap', '_offset', '_limit', '_pos', '_owner')
+
+    def __init__(self, source, offset:int = 0, limit:int =  0):
+        self._owner = not isinstance(source, mmap.mmap)
+        self._mmap = mmap.mmap(source, 0, flags=mmap.MAP_PRIVATE) if self._owner else source
         self._offset = offset
         self._limit = limit
-        self._mmap.seek(self._offset)
+        self._pos = 0
+
+    def _clamp(self, index: int) -> int:
+        return 0 if index < 0 else self._limit if index > self._limit else index
 
     def __getitem__(self, index):
-        shifted_index = None
         if isinstance(index, slice):
-            indexstart = 0 if not index.start else index.start
-            indexstop = len(self._mmap) if not index.stop else index.stop
-            indexstart = 0 if indexstart < 0 else indexstart
-            indexstart = self._limit if indexstart > self._limit else indexstart
-            indexstop = 0 if indexstop < 0 else indexstop
-            indexstop = self._limit if indexstop > self._limit else indexstop
-            shifted_index = slice(indexstart + self._offset, indexstop + self._offset, index.step)
-        else:
-            shifted_index = index
-            shifted_index = 0 if shifted_index < 0 else shifted_index
-            shifted_index = self._limit if shifted_index > self._limit else shifted_index
-            shifted_index += self._offset
-        return self._mmap.__getitem__(shifted_index)
+            start = self._clamp(index.start or 0)
+            stop = self._clamp(index.stop or self._limit)
+            return self._mmap[start + self._offset:stop + self._offset:index.step]
+        return self._mmap[self._clamp(index) + self._offset]
     
     def __setitem__(self, index, value):
-        shifted_index = None
         if isinstance(index, slice):
-            indexstart = 0 if not index.start else index.start
-            indexstop = len(self._mmap) if not index.stop else index.stop
-            indexstart = 0 if indexstart < 0 else indexstart
-            indexstart = self._limit if indexstart > self._limit else indexstart
-            indexstop = 0 if indexstop < 0 else indexstop
-            indexstop = self._limit if indexstop > self._limit else indexstop
-            diff = indexstop - indexstart
+            start = self._clamp(index.start or 0)
+            stop = self._clamp(index.stop or self._limit)
+            diff = stop - start
             if not isinstance(value, bytes) or len(value) > diff:
                 raise ValueError(f"value must be an instance of bytes with len <= to {diff}")
-            for i in range(diff):
-                self._mmap[indexstart + i + self._offset] = value[i]
+            self._mmap[start + self._offset:start + self._offset + len(value)] = value
         else:
-            shifted_index = index
-            shifted_index = 0 if shifted_index < 0 else shifted_index
-            shifted_index = self._limit if shifted_index > self._limit else shifted_index
-            shifted_index += self._offset
-            self._mmap[shifted_index], = value
+            self._mmap[self._clamp(index) + self._offset], = value
     
     @property
     def size(self):
@@ -67,64 +66,137 @@ class Smmap:
         return self._mmap
     
     def seek(self, num: int):
-        num = self._limit if num >= self._limit else num
-        self._mmap.seek(num + self._offset)
+        self._pos = self._clamp(num)
 
     def tell(self):
-        return self._mmap.tell() - self._offset
+        return self._pos
 
     def read(self, nbytes: int = -1):
-        if nbytes == -1 or nbytes >= (self._limit - self.tell()):
-            nbytes = self._limit - self.tell()
-        return self._mmap.read(nbytes)
+        if nbytes == -1 or nbytes >= (self._limit - self._pos):
+            nbytes = self._limit - self._pos
+        start = self._offset + self._pos
+        self._pos += nbytes
+        return self._mmap[start:start + nbytes]
     
     def write(self, what: bytes = b''):
-        self._mmap.write(what)
+        if len(what) > self._limit - self._pos:
+            raise ValueError(f"Cannot write {len(what)} bytes, {self._limit - self._pos} left.")
+        start = self._offset + self._pos
+        self._mmap[start:start + len(what)] = what
+        self._pos += len(what)
 
     def find(self, what: bytes):
-        found = self._mmap.find(what)
+        found = self._mmap.find(what, self._offset, self._offset + self._limit)
         return found if found == -1 else found - self._offset
 
     def rfind(self, what: bytes):
-        found = self._mmap.rfind(what)
+        found = self._mmap.rfind(what, self._offset, self._offset + self._limit)
         return found if found == -1 else found - self._offset
 
     def close(self):
-        self._mmap.close()
+        if self._owner:
+            self._mmap.close()
 
     def __del__(self):
         try:
-            if not self._mmap.closed:
+            if self._owner and not self._mmap.closed:
                 self._mmap.close()
         except:
             pass
 
+######################################################################################
+
+# Chunk offset tables (stco: 32 bit entries, co64: 64 bit) are relocated in bulk:
+# with NumPy when it is installed, else through array, whose C loops do the byte
+# swapping and the conversions. Either way there is no per-entry slicing.
+
+uint32_code = next(code for code in 'IL' if array(code).itemsize == 4)
+uint64_code = next(code for code in 'LQ' if array(code).itemsize == 8)
+
+def read_offsets(data, position: int, count: int, width: int):
+    """
+    `count` big-endian chunk offsets of `width` bytes (4 or 8) from `data` at `position`.
+    """
+    if numpy is not None:
+        return numpy.frombuffer(data, dtype='>u4' if width == 4 else '>u8',
+                                count=count, offset=position).astype(numpy.uint64)
+    offsets = array(uint32_code if width == 4 else uint64_code)
+    offsets.frombytes(data[position:position + count * width])
+    if sys.byteorder == 'little':
+        offsets.byteswap()
+    return offsets
+
+def shift_offsets(offsets, shift: int, limit: int, beyond: int = 0):
+    """
+    `offsets` with `shift` added to the ones below `limit` and `beyond` to the rest:
+    the data in front of the original moov position moves by the size of the new
+    moov, the data after it only by how much moov grew.
+    Returns the shifted offsets and the largest of them.
+    """
+    if not len(offsets):
+        return offsets, 0
+    if numpy is not None:
+        shifted = numpy.where(offsets < limit, offsets + numpy.uint64(shift), offsets + numpy.uint64(beyond))
+        return shifted, int(shifted.max())
+    highest = max(offsets)
+    if highest < limit:
+        # The usual case: every chunk lies before moov. Stay 32 bit while the values fit.
+        highest += shift
+        code = offsets.typecode if highest <= 0xFFFFFFFF else uint64_code
+        return array(code, map(shift.__add__, offsets)), highest
+    shifted = array(uint64_code, [offset + (shift if offset < limit else beyond) for offset in offsets])
+    return shifted, max(shifted)
+
+def pack_offsets(offsets, width: int) -> bytes:
+    """
+    `offsets` as a big-endian table of `width` byte entries.
+    """
+    if numpy is not None:
+        return offsets.astype('>u4' if width == 4 else '>u8').tobytes()
+    packed = offsets[:] if offsets.itemsize == width else array(uint32_code if width == 4 else uint64_code, offsets)
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+######################################################################################
 
 class Mp4:
     """Stub for Atom"""
 
 class Atom:
+    """
+    One atom: where it is, its size and name. The children of container atoms
+    (the path from moov down to stco/co64) are parsed from the file's one shared
+    mapping the first time they are asked for; `contents` is a view into it.
+    """
+
+    __slots__ = ('offset', 'size', 'name', 'ordinal', 'level', 'container', '_children', '_mm')
+
+    containers = frozenset(("moov", "trak", "mdia", "minf", "stbl"))
+
     def __init__(self, offset: int, size: int, name: str, level: int = 0, ordinal: int = -1, container=None):
         self.offset = offset
         self.size = size
         self.name = name
         self.ordinal = ordinal
         self.level = level
-        # self.contents = contents
         self.container = container
-        self.children: list = []
+        self._children = None
         self._mm = None
 
+    @property
+    def children(self) -> list:
+        if self._children is None:
+            self._children = self.load_children() if self.name in self.containers and self.container else []
+        return self._children
+
     @property
     def contents(self):
         if self._mm:
             return self._mm
-        if not self.container:
-            return None
-        fp = self.container.fp
-        if not fp:
+        if not self.container or self.container.mm is None:
             return None
-        self._mm = Smmap(fp.fileno(), self.offset, self.size)
+        self._mm = Smmap(self.container.mm, self.offset, self.size)
         return self._mm
 
     def setcontents(self, new_mm):
@@ -146,30 +218,28 @@ class Atom:
         # Retained for backward compatibility
         pass
 
-    def load_children(self):
-            container: Mp4 = self.container
-            ordinal = 0
-            offset = self.offset + 8
-            fp = mmap.mmap(container.fp.fileno(), container.filesize, flags=mmap.MAP_PRIVATE)
-            while offset < (self.size + self.offset):
-                child = container._get_atom(fp, offset, ordinal, self.level + 1)
-                if child.size == 0:
-                    raise ValueError("Atom of size 0 not admitted out of 0 level.")
-                if child.offset + child.size > container.filesize:
-                    raise ValueError("Atom size exceeds file boundaries.")
-                if child.name == '\x00\x00\x00\x00':
-                    offset += child.size
-                    continue
-                if child.name in ["trak", "mdia", "minf", "stbl"]:
-                    # Known ancestor atom of stco or co64, search within it!
-                    # for res in _find_atoms_ex(atom, datastream):
-                    #     yield res
-                    child.load_children()
-                elif child.name in ["stco", "co64"]:
-                    self.container.relocation_targets.append(child)
-                self.children.append(child)
-                ordinal += 1
+    def load_children(self) -> list:
+        """
+        Parse the atoms directly inside this one. Their own children wait until asked for.
+        """
+        container: Mp4 = self.container
+        children = []
+        ordinal = 0
+        offset = self.offset + 8
+        while offset < (self.size + self.offset):
+            child = container._get_atom(container.mm, offset, ordinal, self.level + 1)
+            if child.size == 0:
+                raise ValueError("Atom of size 0 not admitted out of 0 level.")
+            if child.offset + child.size > container.filesize:
+                raise ValueError("Atom size exceeds file boundaries.")
+            if child.name == '\x00\x00\x00\x00':
                 offset += child.size
+                continue
+            children.append(child)
+            ordinal += 1
+            offset += child.size
+        self._children = children
+        return children
           
     @property
     def boundaries(self):
@@ -190,19 +260,44 @@ class Mp4:
         self.filesize = os.path.getsize(filename)
         self.loop = None
         self.atoms: list[Atom] = []
-        self.relocation_targets: list[Atom] = []
+        self._relocation_targets: list[Atom] = None
         self.ftyp: Atom = None
         self.moov: Atom = None
         self.free: Atom = None
         self.mdat: Atom = None
         self._patched_moov: bytearray = None
+        self.mm: mmap.mmap = None
         self.fp = open(self.filename, 'rb')
-        self.atoms = self._collectatoms()
+        try:
+            # The one mapping of the file: every atom and view reads through it.
+            self.mm = mmap.mmap(self.fp.fileno(), 0, flags=mmap.MAP_PRIVATE)
+            self.filesize = len(self.mm)
+            self.atoms = self._collectatoms()
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        """
+        Release the file, its mapping and the patched moov. Atom contents are unusable afterwards.
+        """
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self._patched_moov is not None:
+            self._patched_moov.close()
+        if not self.fp.closed:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def __del__(self):
         try:
-            if not self.fp.closed:
-                self.fp.close()
+            self.close()
         except:
             pass
 
@@ -233,21 +328,21 @@ Size: {self.filesize:,}
     
     def _parse_mp4(self):
         filesize = self.filesize
-        with mmap.mmap(self.fp.fileno(), filesize, flags=mmap.MAP_PRIVATE) as fp:
-            ordinal = 0
-            offset = 0
-            while offset < filesize:
-                atom = self._get_atom(fp, offset, ordinal, 0)
-                if atom.size == 0:
-                    atom.size = self.filesize - offset
-                    yield atom
-                    return
-                ordinal += 1
-                offset += atom.size
-                if atom.name != '\x00\x00\x00\x00':
-                    yield atom
-                else:
-                    continue
+        fp = self.mm
+        ordinal = 0
+        offset = 0
+        while offset < filesize:
+            atom = self._get_atom(fp, offset, ordinal, 0)
+            if atom.size == 0:
+                atom.size = self.filesize - offset
+                yield atom
+                return
+            ordinal += 1
+            offset += atom.size
+            if atom.name != '\x00\x00\x00\x00':
+                yield atom
+            else:
+                continue
 
     def _collectatoms(self):
         atoms = [self._classify_atom(atom) for atom in self._parse_mp4()]
@@ -255,30 +350,110 @@ Size: {self.filesize:,}
         #     self.moov.load_children()
         return atoms
     
+    @property
+    def relocation_targets(self) -> list:
+        """
+        The stco/co64 atoms in moov, found by walking down only the containers leading to them.
+        """
+        if self._relocation_targets is None:
+            targets = []
+
+            def collect(atom: Atom):
+                for child in atom.children:
+                    if child.name in ("stco", "co64"):
+                        targets.append(child)
+                    else:
+                        collect(child)
+
+            if self.moov:
+                collect(self.moov)
+            self._relocation_targets = targets
+        return self._relocation_targets
+
     def _is_relocatable(self):
-        return (not not self.moov) and (not self._is_compressed()) and (self.moov.ordinal > self.mdat.ordinal)
+        return (not not self.moov) and (not not self.mdat) and (not self._is_compressed()) and (self.moov.ordinal > self.mdat.ordinal)
     
+    def _ancestors(self, target: Atom, parent: Atom = None) -> list:
+        """
+        The container atoms from moov down to `target`'s parent.
+        """
+        parent = parent or self.moov
+        for child in parent.children:
+            if child is target:
+                return [parent]
+            if child.offset <= target.offset < child.offset + child.size:
+                return [parent] + self._ancestors(target, child)
+        return []
+
     def _patch_moov(self):
+        """
+        Build the moov to serve in front of mdat: every chunk offset that points before
+        the original moov moves up by the size of the (patched) moov. stco tables whose
+        offsets would overflow 32 bits are rewritten as co64, growing moov and the
+        atoms containing them; the larger moov is taken into account for the shift,
+        and offsets past the original moov move by the growth.
+        """
         if self._patched_moov is not None or not self.moov or self._is_compressed():
             return
-        offset_shift = self.moov.size
+        moov = self.moov
         self.moov.contents.seek(0)
-        self._patched_moov = mmap.mmap(-1, self.moov.size)
-        self._patched_moov.write(self.moov.contents.read())
+        original = self.moov.contents.read()
+        tables = []
         for atom in self.relocation_targets:
-            # os.sys.stderr.write(f'{atom.name} located at ' + str(atom.offset) + '\n')
-            # os.sys.stderr.flush()
-            offset_pos_begin = atom.offset - self.moov.offset
-            offset_pos = offset_pos_begin
-            entry_count = int.from_bytes(self._patched_moov[offset_pos+12:offset_pos+16], byteorder='big')
-            # print(f"Patching atom '{atom.name}' with {entry_count} entries.")
-            displacement = 4 if atom.name == 'stco' else 8 # in case atom.name == 'co64'
-            for i in range(entry_count):
-                offset_pos = offset_pos_begin + 16 + (i * displacement)
-                current_offset = int.from_bytes(self._patched_moov[offset_pos:offset_pos+4], byteorder='big')
-                new_offset = current_offset + offset_shift
-                # print(f"{i}: Transferring offset {current_offset} to {new_offset}")
-                self._patched_moov[offset_pos:offset_pos+4] = new_offset.to_bytes(displacement, byteorder='big')
+            position = atom.offset - moov.offset
+            width = 4 if atom.name == 'stco' else 8
+            entry_count = int.from_bytes(original[position + 12:position + 16], byteorder='big')
+            if position + 16 + entry_count * width > position + atom.size:
+                raise ValueError(f"Atom {atom.name} @ {atom.offset:,} holds fewer entries than it claims.")
+            tables.append([atom, width, read_offsets(original, position + 16, entry_count, width), None])
+        # Promoting a table grows moov, which grows the shift: repeat until nothing else overflows.
+        while True:
+            extra = sum(16 + 8 * len(offsets) - atom.size for atom, width, offsets, _ in tables
+                        if width == 8 and atom.name == 'stco')
+            promoted = False
+            for table in tables:
+                table[3], highest = shift_offsets(table[2], moov.size + extra, moov.offset, extra)
+                if table[1] == 4 and highest > 0xFFFFFFFF:
+                    table[1] = 8
+                    promoted = True
+            if not promoted:
+                break
+
+        pieces, growth, cursor = [], {}, 0
+        for atom, width, _, shifted in sorted(tables, key=lambda table: table[0].offset):
+            position = atom.offset - moov.offset
+            pieces.append(original[cursor:position])
+            entries = pack_offsets(shifted, width)
+            if atom.name == 'stco' and width == 8:
+                # Same version/flags and entry count, as a co64 atom.
+                header = (16 + len(entries)).to_bytes(4, byteorder='big') + b'co64' + original[position + 8:position + 16]
+                growth[atom] = 16 + len(entries) - atom.size
+            else:
+                header = original[position:position + 16]
+            pieces.append(header)
+            pieces.append(entries)
+            cursor = position + 16 + len(entries) if not growth.get(atom) else position + atom.size
+        pieces.append(original[cursor:])
+        patched = b"".join(pieces)
+
+        if growth:
+            patched = bytearray(patched)
+            grown = {}
+            for atom, delta in growth.items():
+                for ancestor in self._ancestors(atom):
+                    grown[ancestor] = grown.get(ancestor, 0) + delta
+            for ancestor, delta in grown.items():
+                # Where the ancestor's header landed: moved by the growth of the tables before it.
+                position = ancestor.offset - moov.offset + sum(d for a, d in growth.items() if a.offset < ancestor.offset)
+                size = ancestor.size + delta
+                if int.from_bytes(patched[position:position + 4], byteorder='big') == 1:
+                    patched[position + 8:position + 16] = size.to_bytes(8, byteorder='big')
+                elif size <= 0xFFFFFFFF:
+                    patched[position:position + 4] = size.to_bytes(4, byteorder='big')
+                else:
+                    raise ValueError(f"Atom {ancestor.name} would outgrow its 32 bit size field.")
+        self._patched_moov = mmap.mmap(-1, len(patched))
+        self._patched_moov.write(patched)
     
     def _classify_atom(self, atom: Atom):
         # atom.container = self
@@ -286,7 +461,6 @@ Size: {self.filesize:,}
         if atom.name == 'ftyp':
             self.ftyp = atom
         elif atom.name == 'moov':
-            atom.load_children()
             self.moov = atom
         elif atom.name == 'free':
             self.free = atom
@@ -322,6 +496,7 @@ Size: {self.filesize:,}
         self.mdat.ordinal = self.moov.ordinal
         self.moov.ordinal = temp_ordinal
         self.moov.setcontents(self.patched_moov)
+        self.moov.size = len(self.patched_moov)
         self.atoms.sort(key=lambda atom: atom.ordinal)
         for index, atm in enumerate(self.atoms):
             atm.contents.seek(0)
@@ -488,10 +663,7 @@ Size: {self.filesize:,}
                 yield chunk
 
     def save(self, outputfile: str = 'out.mp4'):
-        with open(outputfile, 'wb') as fp:
-            for chunk in self.stream():
-                fp.write(chunk)
-
+        self.faststart_layout().write(outputfile)
         print(f"Mp4 file {self.filename} saved succesfully to {outputfile}.")
 
     def quicklist(self):
@@ -499,19 +671,377 @@ Size: {self.filesize:,}
         sizeline= f"Size: {self.filesize:,}"
         underline = "_" * max(len(fileline), len(sizeline))
         return [underline, fileline, sizeline, underline, *list(map(repr, self.atoms))]
-    
+
+    def faststart_layout(self):
+        """
+        The faststart version of the file as a FaststartLayout: moov moved in front
+        of the first mdat and patched, everything else left where it is on disk.
+        Must be called before `faststart` reorders the atoms.
+        """
+        if not self._is_relocatable():
+            return FaststartLayout(self.filename, self.filesize, [(0, self.filesize, None, 0)])
+        moov = bytes(self.patched_moov)
+        segments = []
+        position = 0
+        inserted = False
+        for atom in sorted(self.atoms, key=lambda atom: atom.offset):
+            if atom is self.moov:
+                continue
+            if atom.name == 'mdat' and not inserted:
+                segments.append((position, len(moov), moov, None))
+                position += len(moov)
+                inserted = True
+            if segments and segments[-1][2] is None and segments[-1][3] + segments[-1][1] == atom.offset:
+                # Adjacent on disk: one file range, one sendfile.
+                start, size, _, file_offset = segments[-1]
+                segments[-1] = (start, size + atom.size, None, file_offset)
+            else:
+                segments.append((position, atom.size, None, atom.offset))
+            position += atom.size
+        return FaststartLayout(self.filename, position, segments)
+
+######################################################################################
+
+# Errors meaning "not this way, try the next": no such call, or not across these file systems.
+copy_fallback_errors = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM}
+
+def copy_range(source: int, destination: int, offset: int, count: int) -> None:
+    """
+    Blocking. Append `count` bytes of `source` from `offset` on to `destination`, both file
+    descriptors: os.copy_file_range if possible, else os.sendfile, else reads and writes.
+    """
+    methods = []
+    if hasattr(os, 'copy_file_range'):
+        methods.append(lambda size: os.copy_file_range(source, destination, size, offset))
+    if hasattr(os, 'sendfile'):
+        methods.append(lambda size: os.sendfile(destination, source, offset, size))
+
+    def read_write(size: int) -> int:
+        data = os.pread(source, min(size, 1024 * 1024), offset)
+        chunk = memoryview(data)
+        while chunk:
+            chunk = chunk[os.write(destination, chunk):]
+        return len(data)
+
+    methods.append(read_write)
+    while count > 0:
+        try:
+            copied = methods[0](min(count, 1 << 30))
+        except OSError as exc:
+            if exc.errno not in copy_fallback_errors or len(methods) == 1:
+                raise
+            methods.pop(0)
+            continue
+        if copied == 0:
+            raise ValueError(f"Source file ended {count:,} bytes short of the copy.")
+        offset += copied
+        count -= copied
+
+######################################################################################
+
+class FaststartLayout:
+    """
+    An MP4 file as it is to be served, in order, as (start, size, data, file_offset)
+    segments: `data` holds bytes made in memory (the patched moov), None means the
+    segment is `size` bytes of the original file from `file_offset` on, to be sent
+    straight from disk.
+    """
+
+    __slots__ = ('path', 'size', 'segments')
+
+    def __init__(self, path: str, size: int, segments: list):
+        self.path = path
+        self.size = size
+        self.segments = segments
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Blocking. Parse `path` and work out its faststart layout.
+        """
+        with Mp4(path) as mp4:
+            return mp4.faststart_layout()
+
+    def pieces(self, first: int = 0, last: int = None):
+        """
+        (data, file_offset, length) pieces making up bytes `first` to `last` (inclusive):
+        `data` is a memoryview to send as is, or None for `length` bytes of the file at `file_offset`.
+        """
+        last = self.size - 1 if last is None else last
+        for start, size, data, file_offset in self.segments:
+            end = start + size - 1
+            if end < first or start > last:
+                continue
+            low, high = max(first, start) - start, min(last, end) - start + 1
+            if data is not None:
+                yield memoryview(data)[low:high], None, high - low
+            else:
+                yield None, file_offset + low, high - low
+
+    @property
+    def memory(self) -> int:
+        return sum(len(data) for _, _, data, _ in self.segments if data is not None) + 64 * len(self.segments)
+
+    # Sidecar files: a magic line, a JSON line describing the source file and the
+    # segments, then the in-memory segments' bytes one after the other.
+    sidecar_magic = b"OXI-FASTSTART 1\n"
+
+    def save(self, sidecar: str, source_size: int, source_mtime_ns: int) -> None:
+        """
+        Blocking. Write the layout to `sidecar`, stamped with the size and mtime
+        of the file it was made from. The file appears atomically or not at all.
+        """
+        meta = {'size': self.size, 'source_size': source_size, 'source_mtime_ns': source_mtime_ns,
+                'segments': [(start, size, data is not None, file_offset)
+                             for start, size, data, file_offset in self.segments]}
+        temp = f"{sidecar}.{os.getpid()}.tmp"
+        try:
+            with open(temp, 'wb') as fd:
+                fd.write(self.sidecar_magic)
+                fd.write(json.dumps(meta).encode("utf-8") + b"\n")
+                fd.writelines(data for _, _, data, _ in self.segments if data is not None)
+            os.replace(temp, sidecar)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def write(self, destination: str) -> int:
+        """
+        Blocking. Write the file out to `destination` (which may be the source itself),
+        through a temporary file beside it that takes its place once complete.
+        File ranges are copied in the kernel where it can. Returns the bytes written.
+        """
+        directory = os.path.dirname(os.path.abspath(destination))
+        fd, temp = tempfile.mkstemp(prefix=f".{os.path.basename(destination)}.", suffix=".tmp", dir=directory)
+        try:
+            with open(self.path, 'rb') as source:
+                for data, file_offset, length in self.pieces():
+                    if data is None:
+                        copy_range(source.fileno(), fd, file_offset, length)
+                        continue
+                    while data:
+                        data = data[os.write(fd, data):]
+                shutil.copymode(self.path, temp)
+            os.fsync(fd)
+            os.close(fd)
+            fd = None
+            os.replace(temp, destination)
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if os.path.exists(temp):
+                os.remove(temp)
+        return self.size
+
+    @classmethod
+    def from_sidecar(cls, sidecar: str, path: str, source_size: int, source_mtime_ns: int):
+        """
+        Blocking. The layout saved in `sidecar`, or None if there is none, it is
+        unreadable or it was made from a different version of the file.
+        """
+        try:
+            with open(sidecar, 'rb') as fd:
+                if fd.readline() != cls.sidecar_magic:
+                    return None
+                meta = json.loads(fd.readline())
+                if (meta['source_size'], meta['source_mtime_ns']) != (source_size, source_mtime_ns):
+                    return None
+                segments = []
+                for start, size, in_memory, file_offset in meta['segments']:
+                    data = None
+                    if in_memory:
+                        data = fd.read(size)
+                        if len(data) != size:
+                            return None
+                    segments.append((start, size, data, file_offset))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return cls(path, meta['size'], segments)
+
+    def __repr__(self):
+        return f"<FaststartLayout {self.path} {self.size:,} bytes in {len(self.segments)} segments>"
+
+######################################################################################
+
+class FaststartCache:
+    """
+    FaststartLayouts keyed by (path, mtime_ns, size), evicted LRU under a byte
+    budget, so the Range requests of a player cost one parse per file version,
+    not one per request. A changed file gets a new key; its old layout ages out.
+
+    With a `sidecar_dir`, layouts are also saved there (named after a hash of the
+    path) and read back instead of parsing the file again, e.g. after a restart.
+    Loads run in `executor` (a FileSystemExecutor, coalescing concurrent loads
+    of one file) or, without one, in the default executor.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, sidecar_dir: str = None, executor=None):
+        self.entries = LRUCache(max_bytes)
+        self.sidecar_dir = sidecar_dir
+        self.executor = executor
+
+    def sidecar(self, path: str) -> str:
+        name = hashlib.sha1(os.path.abspath(path).encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.sidecar_dir, f"{name}.faststart")
+
+    def load(self, path: str, size: int, mtime_ns: int) -> FaststartLayout:
+        """
+        Blocking. The layout of `path`, as of `size` and `mtime_ns`, from its sidecar or parsed anew.
+        Raises ValueError if the file is no longer that version once parsed.
+        """
+        sidecar = self.sidecar(path) if self.sidecar_dir else None
+        if sidecar:
+            layout = FaststartLayout.from_sidecar(sidecar, path, size, mtime_ns)
+            if layout is not None:
+                return layout
+        layout = FaststartLayout.load(path)
+        # The layout's own size says nothing here: promoting stco to co64 makes it longer.
+        st = os.stat(path)
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+            raise ValueError("file changed while being parsed")
+        if sidecar:
+            try:
+                os.makedirs(self.sidecar_dir, exist_ok=True)
+                layout.save(sidecar, size, mtime_ns)
+            except OSError:
+                pass
+        return layout
+
+    async def get(self, path: str, size: int, mtime_ns: int) -> FaststartLayout:
+        """
+        The layout of `path` for the given version of it. Raises whatever parsing raises.
+        """
+        key = (path, mtime_ns, size)
+        layout = self.entries.get(key)
+        if layout is not None:
+            return layout
+        if self.executor is not None:
+            layout = await self.executor.run(self.load, path, size, mtime_ns, key=('faststart', key))
+        else:
+            layout = await asyncio.to_thread(self.load, path, size, mtime_ns)
+        self.entries.put(key, layout, layout.memory)
+        return layout
+
+    def invalidate(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+######################################################################################
+
+def not_relocatable_reason(mp4: Mp4) -> str:
+    if not mp4.moov:
+        return "no moov atom"
+    if not mp4.mdat:
+        return "no mdat atom"
+    if mp4.moov.ordinal < mp4.mdat.ordinal:
+        return "already faststart"
+    if any(atom.name == 'cmov' for atom in mp4.moov.children):
+        return "compressed moov"
+    return None
+
+def faststart_file(path: str, destination: str = None, dry_run: bool = False) -> tuple:
+    """
+    Blocking. Rewrite `path` in faststart order, in place or to `destination`.
+    Returns (path, outcome, bytes, seconds), outcome being 'converted' (or, on a
+    dry run, 'to convert'), 'skipped: <why>' or 'failed: <why>'. Never raises,
+    so one bad file doesn't stop a batch.
+    """
+    started = time.perf_counter()
+    size = 0
+    try:
+        with Mp4(path) as mp4:
+            size = mp4.filesize
+            reason = not_relocatable_reason(mp4)
+            if reason:
+                outcome = f"skipped: {reason}"
+            elif dry_run:
+                outcome = "to convert"
+            else:
+                if destination is not None:
+                    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+                size = mp4.faststart_layout().write(destination or path)
+                outcome = "converted"
+    except Exception as exc:
+        outcome = f"failed: {exc}"
+    return path, outcome, size, time.perf_counter() - started
+
+def find_mp4s(inputs: list, output_dir: str = None):
+    """
+    (path, destination) for every MP4 file named by `inputs`: files, directories
+    (walked) and glob patterns. The destination is None when converting in place,
+    else the path under `output_dir`, relative to the directory given.
+    """
+    seen = set()
+    for name in inputs:
+        if os.path.isdir(name):
+            root = name
+            found = (os.path.join(folder, filename)
+                     for folder, folders, filenames in sorted(os.walk(name))
+                     for filename in sorted(filenames) if not filename.startswith('.'))
+        else:
+            found = [name] if os.path.exists(name) else sorted(glob.glob(name, recursive=True))
+            root = None
+        for path in found:
+            real = os.path.realpath(path)
+            if real in seen or not os.path.isfile(path) or guess_type(path)[0] not in ['video/mp4', 'video/quicktime']:
+                continue
+            seen.add(real)
+            destination = None
+            if output_dir is not None:
+                relative = os.path.relpath(path, root) if root else os.path.basename(path)
+                destination = os.path.join(output_dir, relative)
+            yield path, destination
+
+def batch(inputs: list, output_dir: str = None, jobs: int = None, dry_run: bool = False) -> int:
+    """
+    Convert every MP4 file named by `inputs` to faststart, `jobs` files at a time in
+    separate processes, a line per file as each completes and a summary at the end.
+    Returns the number of files that failed.
+    """
+    files = list(find_mp4s(inputs, output_dir))
+    if not files:
+        print("No MP4 files found.")
+        return 0
+    started = time.perf_counter()
+    counts = {'converted': 0, 'to convert': 0, 'skipped': 0, 'failed': 0}
+    total = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(faststart_file, path, destination, dry_run) for path, destination in files]
+        for done, future in enumerate(as_completed(futures), 1):
+            path, outcome, size, seconds = future.result()
+            counts[outcome.partition(':')[0]] += 1
+            if outcome in ('converted', 'to convert'):
+                total += size
+            print(f"[{done}/{len(files)}] {path}: {outcome} ({size:,} bytes, {seconds:.2f}s)")
+    elapsed = time.perf_counter() - started
+    done = f"{counts['to convert']} to convert" if dry_run else f"{counts['converted']} converted"
+    print(f"\n{len(files)} files: {done}, {counts['skipped']} skipped, {counts['failed']} failed.")
+    if not dry_run:
+        print(f"{total / 1e6:,.1f} MB written in {elapsed:.2f}s ({total / 1e6 / max(elapsed, 1e-9):,.1f} MB/s).")
+    return counts['failed']
+
 def main():
     parser = argparse.ArgumentParser(description='Command line arguments for Mp4Parser', prog='mp4parser')
     parser.add_argument('-V', '--version', action='version', version=f"{parser.prog} v {oxi_version}", help=f"Shows {parser.prog} version and exits.")
-    parser.add_argument('inputfile', type=str, help="Name of the file to be listed/processed.")
+    parser.add_argument('inputfile', type=str, nargs='+', help="Name of the file to be listed/processed. With --batch, any number of files, directories or glob patterns.")
     parser.add_argument('-o', '--outputfile', type=str, default='out.mp4', help="Name of the file you wish to save to. Defaults to 'out.mp4'")
     group = parser.add_mutually_exclusive_group(required=False)
     group.add_argument('-s', '--save', action="store_true", help="Use this option to save the input file to a new one.")
     group.add_argument('-l', '--list', action="store_true", help="Shows a list of the main level atoms contained in the input file.")
     group.add_argument('-L', '--full-list', action="store_true", help="Shows a detailed list of the atoms contained in the input file.")
+    group.add_argument('-b', '--batch', action="store_true", help="Converts every input file to faststart, in place unless --output-dir is given. Files already faststart are skipped.")
+    parser.add_argument('-d', '--output-dir', type=str, default=None, help="With --batch, directory to write the converted files to, instead of replacing the originals.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="With --batch, number of files converted at once. Defaults to the number of CPUs.")
+    parser.add_argument('-n', '--dry-run', action="store_true", help="With --batch, only reports which files would be converted.")
     
     args = parser.parse_args()
-    filename = args.inputfile
+    if args.batch:
+        raise SystemExit(1 if batch(args.inputfile, args.output_dir, args.jobs, args.dry_run) else 0)
+    if len(args.inputfile) > 1:
+        parser.error("more than one input file is only allowed with --batch")
+    filename = args.inputfile[0]
     
     try:
         mp4 = Mp4(filename)
@@ -519,14 +1049,15 @@ def main():
         print(f"ERROR: {exc}")
         raise SystemExit
 
-    if  args.save:
-        mp4.save(args.outputfile)
-    elif args.list:
-        print('\n'.join(mp4.quicklist()))
-    elif args.full_list:
-        print(mp4)
-    else:
-        print('\n'.join(mp4.quicklist()))
+    with mp4:
+        if  args.save:
+            mp4.save(args.outputfile)
+        elif args.list:
+            print('\n'.join(mp4.quicklist()))
+        elif args.full_list:
+            print(mp4)
+        else:
+            print('\n'.join(mp4.quicklist()))
 
 if __name__ == '__main__':
     main()
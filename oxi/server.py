@@ -1,21 +1,30 @@
 # -*- coding: utf-8 -*-
 
-import asyncio, os, sys, random, subprocess, re, mimetypes, errno, signal, hashlib, time
+import asyncio, os, sys, random, subprocess, mimetypes, signal, hashlib, time, argparse, select
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 from typing import Callable
 from pprint import pprint
 from pathlib import Path
 from time import time as timestamp, strftime as tstrftime, strptime as tstrptime
 from datetime import datetime as dt
-from urllib.parse import urlparse, parse_qsl, unquote_plus
 from functools import wraps
 
 try:
     from . import  __version__ as oxi_version, __oxi_port__ as oxi_port, __oxi_host__ as oxi_host
     from .config import Config
     from .utils import (is_windows, is_linux, is_mac, 
-                        http_status_dict as status_dict, to_bytes, no_ctrlc_echo)
-    from .mp4parser import Mp4
+                        http_status_dict as status_dict, no_ctrlc_echo, LRUCache)
+    from .mp4parser import FaststartCache, FaststartLayout
+    from .fmp4 import FragmentedMp4
+    from .httpparser import HttpRequestParser, HttpParserError, RequestHead, parse_range
+    from .filecache import StaticFile, StaticFileCache
+    from .compressor import (precompressed_suffixes, encodings, is_compressible, negotiate, 
+                             compress_file, compress_file_chunks)
+    from .accesslog import log, levels, formats
+    from .dirlisting import DirectoryListingCache, sort_keys, html_listing, json_listing
+    from .fsexecutor import FileSystemExecutor
 except ImportError:
     from activate_this import oxi_env
     if not oxi_env:
@@ -23,64 +32,116 @@ except ImportError:
     from oxi import  __version__ as oxi_version, __oxi_port__ as oxi_port, __oxi_host__ as oxi_host
     from oxi.config import Config
     from oxi.utils import (is_linux, is_windows, is_mac, 
-                           http_status_dict as status_dict, to_bytes, no_ctrlc_echo)
-    from oxi.mp4parser import Mp4
+                           http_status_dict as status_dict, no_ctrlc_echo, LRUCache)
+    from oxi.mp4parser import FaststartCache, FaststartLayout
+    from oxi.fmp4 import FragmentedMp4
+    from oxi.httpparser import HttpRequestParser, HttpParserError, RequestHead, parse_range
+    from oxi.filecache import StaticFile, StaticFileCache
+    from oxi.compressor import (precompressed_suffixes, encodings, is_compressible, negotiate, 
+                                compress_file, compress_file_chunks)
+    from oxi.accesslog import log, levels, formats
+    from oxi.dirlisting import DirectoryListingCache, sort_keys, html_listing, json_listing
+    from oxi.fsexecutor import FileSystemExecutor
 
 server_software =f"Oxi/{oxi_version}"
 
+# Process wide pool for blocking file system calls, apart from the default executor.
+fs_executor = FileSystemExecutor(Config.get('fs_workers', 8), queue_warning=Config.get('fs_queue_warning', 64))
+
 async def is_static(resource:str) -> bool:
     """
     Check if the resource exists in the file system.
     """
-    return await asyncio.to_thread(os.path.exists, resource)
+    return (await fs_executor.stat(resource)).exists
 
 async def is_file(resource:str) -> bool:
     """
     Check if the resource is a regular file.
     """
-    exists = await asyncio.to_thread(os.path.exists, resource)
-    return exists and await asyncio.to_thread(os.path.isfile, resource)
+    return (await fs_executor.stat(resource)).is_file
 
 async def is_dir(resource:str) -> bool:
     """
     Check if the resource is a directory.
     """
-    exists = await asyncio.to_thread(os.path.exists, resource)
-    return exists and await asyncio.to_thread(os.path.isdir, resource)
+    return (await fs_executor.stat(resource)).is_dir
 
 async def is_exe(resource:str) -> bool:
     """
     Check if the resource is an executable file.
     """
-    exists = await asyncio.to_thread(os.path.exists, resource)
-    return exists and (await asyncio.to_thread(os.access, resource, os.X_OK))
+    return (await fs_executor.stat(resource)).executable
 
 async def is_cgi_exe(resource:str, cgi_dir:str="cig-bin") -> bool:
     """
     Check if the resource is a CGI executable.
     """
-    exists = await asyncio.to_thread(os.path.exists, resource)
-    if not exists:
-        return False
-    is_exec = await is_exe(resource)
-    if not is_exec:
-        return False
     if not cgi_dir in resource:
         return False
-    return True
+    return (await fs_executor.stat(resource)).executable
 
 async def finalize_writer(writer):
     try:
         # writer.write(b"\r\n\r\n")
-        await writer.drain()
+        if not writer.is_closing():
+            await writer.drain()
     except Exception as e:
-        print(f"Writer drain error: {e}")
+        log.warning("Writer drain error: %s", e)
     finally:
         try:
             writer.close()
             await writer.wait_closed()
         except Exception as e:
-            print(f"Writer close error: {e}")
+            log.warning("Writer close error: %s", e)
+
+def response_status(data: bytes) -> int:
+    """
+    Status code of the response head `data` starts with, None if it doesn't start one.
+    """
+    if data[:7] == b"HTTP/1.":
+        try:
+            return int(bytes(data[9:12]))
+        except ValueError:
+            pass
+    return None
+
+def remote_address(writer) -> str:
+    peername = writer.get_extra_info("peername")
+    return peername[0] if isinstance(peername, tuple) and peername else None
+
+class MeteredWriter:
+    """
+    StreamWriter wrapper keeping the access log's figures for the response being
+    written: its status code and, over the connection, the bytes sent.
+    Anything else goes straight to the wrapped writer.
+    """
+
+    __slots__ = ('writer', 'status', 'bytes_sent')
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.status = None
+        self.bytes_sent = 0
+
+    def start_response(self) -> int:
+        self.status = None
+        return self.bytes_sent
+
+    def write(self, data: bytes) -> None:
+        if self.status is None:
+            self.status = response_status(data)
+        self.bytes_sent += len(data)
+        self.writer.write(data)
+
+    def writelines(self, data) -> None:
+        data = tuple(data)
+        if self.status is None and data:
+            self.status = response_status(data[0])
+        self.bytes_sent += sum(map(len, data))
+        self.writer.writelines(data)
+
+    def __getattr__(self, name: str):
+        return getattr(self.writer, name)
 
 enctypes: tuple = (b"application/x-www-form-urlencoded", 
                    b"multipart/form-data", 
@@ -150,6 +211,20 @@ class ProtocolFactory:
     moved_temporary_line = "HTTP/1.1 302 Moved Temporarily\r\n"
     error_line = "HTTP/1.1 500 Internal Server Error\r\n"
     not_found_line = "HTTP/1.1 404 Not Found\r\n"
+    not_modified_line = "HTTP/1.1 304 Not Modified\r\n"
+    keep_alive_line = "Connection: keep-alive\r\n"
+    close_line = "Connection: close\r\n"
+
+    # Largest unwanted request body we are willing to read past to keep a connection alive.
+    max_discarded_body = 1024 * 1024
+    # More ranges than this in one request and the whole file is sent instead.
+    max_ranges = 16
+    # Class level default for the classmethod handlers; instances get Config's value.
+    chunk_size = Config.get('chunk_size', 8192)
+    # Cleared the first time the event loop turns out not to implement loop.sendfile (uvloop).
+    loop_sendfile = True
+    # Read size of file bodies sent without sendfile.
+    read_size = 256 * 1024
 
     @property
     def base_dir(self) -> str:
@@ -172,7 +247,7 @@ class ProtocolFactory:
         candidates = self.index_files if hasattr(self, 'index_files') else ['index.html', 'index.htm']
         full_candidates = [os.path.join(self.full_base_dir, f) for f in candidates]
         for candidate in full_candidates:
-            if await is_file(candidate):
+            if await self.static_cache.get(candidate) is not None:
                 return True, candidate
         return False, None
     
@@ -191,245 +266,656 @@ class ProtocolFactory:
         self.original_zen = original_zen
         self.strftemplate = strftime_template
         self.enctypes = enctypes
+        self.parser = HttpRequestParser(max_head_size=self.max_head_size, max_header_count=self.max_header_count)
+        self.connections: set = set()
+        self.idle_connections: set = set()
+        self.draining = False
+        self.static_cache = StaticFileCache(self.static_heads, max_bytes=self.static_cache_size,
+                                            max_body_size=self.static_cache_max_file,
+                                            revalidate_after=self.static_cache_revalidate,
+                                            siblings=precompressed_suffixes if self.precompressed else None,
+                                            executor=fs_executor)
+        # Compressed variants of static files, keyed by (ETag, coding), and the ones being made.
+        self.compressed_cache = LRUCache(self.compression_cache_size)
+        self.pending_compressions: dict = {}
+        self.compression_pool = ThreadPoolExecutor(max_workers=self.compression_workers, 
+                                                   thread_name_prefix="oxi-compress")
+        self.directory_cache = DirectoryListingCache(self.dirlisting_cache_size, executor=fs_executor)
+        sidecar_dir = self.faststart_sidecar_dir
+        if sidecar_dir and not os.path.isabs(sidecar_dir):
+            sidecar_dir = os.path.join(self.cwd, sidecar_dir)
+        self.faststart_cache = FaststartCache(self.faststart_cache_size, sidecar_dir=sidecar_dir, executor=fs_executor)
+        # FragmentedMp4 indexes for HLS, keyed by (path, mtime_ns, size).
+        self.fragment_cache = LRUCache(self.fragment_cache_size)
+        log.configure(self.access_log, self.access_log_format, self.log_level, self.log_dir)
 
     async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """
-        Handle the incoming request and send a response.
+        `start_server` client callback: serve the connection through StreamReader/StreamWriter.
         """
+        await self.serve_connection(reader, MeteredWriter(writer), lambda: self.read_request(reader))
+
+    async def serve_connection(self, reader, writer, next_request: Callable):
+        """
+        Serve requests on a connection until the client or the keep-alive policy closes it.
+        Pipelined requests are handled in order, since they simply queue up in the reader.
+        `next_request` is a coroutine function returning the next parsed RequestHead.
+        `writer` keeps the access log figures (a MeteredWriter or an HttpConnection).
+        """
+        served = 0
+        loop = asyncio.get_running_loop()
+        remote = remote_address(writer)
+        self.connections.add(writer)
         try:
-            method, path, protocol = await self.get_request_line(reader)
-            parsed = urlparse(path)
-            path = parsed.path
-            query = parsed.query
-            if query:
-                query = dict(parse_qsl(query))
-            else:
-                query = {}
-            netloc = parsed.netloc
+            while not self.draining:
+                # The first request gets header_timeout to arrive; later ones the keep-alive timeout.
+                timeout = self.keep_alive_timeout if served else self.header_timeout
+                self.idle_connections.add(writer)
+                try:
+                    request = await asyncio.wait_for(next_request(), timeout)
+                except (EOFError, ConnectionError, asyncio.TimeoutError):
+                    break
+                except HttpParserError as e:
+                    log.info("Error parsing request: %s", e)
+                    started, sent = loop.time(), writer.start_response()
+                    await self.send_status_response(writer, status_code=e.status, msg=str(e))
+                    log.request(remote, None, writer.status, writer.bytes_sent - sent, loop.time() - started)
+                    break
+                finally:
+                    self.idle_connections.discard(writer)
+                started, sent = loop.time(), writer.start_response()
+                keep_alive = await self.handle_request(reader, writer, request, served=served)
+                log.request(remote, request, writer.status, writer.bytes_sent - sent, loop.time() - started)
+                served += 1
+                if not keep_alive or writer.is_closing():
+                    break
+        finally:
+            self.connections.discard(writer)
+            await finalize_writer(writer)
+
+    async def drain(self, timeout: float = None) -> None:
+        """
+        Stop taking new requests: hang up idle connections and give busy ones up to
+        `timeout` seconds to finish the response they are sending.
+        """
+        self.draining = True
+        for writer in list(self.idle_connections):
+            writer.close()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.graceful_timeout if timeout is None else timeout)
+        while self.connections and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.connections:
+            log.warning("Dropping %s connection(s) still busy after drain timeout.", len(self.connections))
+        for writer in list(self.connections):
+            writer.close()
+
+    def wants_keep_alive(self, protocol: str, headers: dict, served: int = 0) -> bool:
+        """
+        Decide whether the connection stays open after the current request.
+        HTTP/1.1 is persistent unless told otherwise, HTTP/1.0 only on explicit request.
+        """
+        if self.draining or not self.keep_alive or served + 1 >= self.keep_alive_max_requests:
+            return False
+        tokens = {token.strip().lower() for token in headers.get("connection", "").split(",")}
+        if "close" in tokens:
+            return False
+        if protocol.upper() == "HTTP/1.1":
+            return True
+        return "keep-alive" in tokens
+
+    @classmethod
+    def connection_line(cls, keep_alive: bool = False) -> str:
+        return cls.keep_alive_line if keep_alive else cls.close_line
+
+    def static_heads(self, entry: StaticFile) -> dict:
+        """
+        Precomputed 200 and 304 heads for a static file, keyed by (status, keep_alive).
+        """
+        validators = self.validator_lines(entry)
+        lines = (f"Content-Type: {entry.content_type}\r\n",
+                 f"Content-Length: {entry.size}\r\n",
+                 "Access-Control-Allow-Origin: *\r\n",
+                 "Accept-Ranges: bytes\r\n",
+                 *validators)
+        return {(status, keep_alive): self.build_head(status_line, *header_lines, keep_alive=keep_alive)
+                for status, status_line, header_lines in ((200, self.success_line, lines),
+                                                          (304, self.not_modified_line, validators))
+                for keep_alive in (False, True)}
+
+    def entity_tag(self, entry: StaticFile, encoding: str = None) -> str:
+        """
+        ETag header value for `entry`, or for its `encoding` variant: strong,
+        weak ('W/' prefixed), or None if ETags are off.
+        """
+        etag = entry.etag if encoding is None else f'{entry.etag[:-1]}-{encoding}"'
+        if self.etag == 'weak':
+            return "W/" + etag
+        return etag if self.etag == 'strong' else None
+
+    def cache_control_for(self, entry: StaticFile) -> str:
+        """
+        Cache-Control policy for `entry` from Config['cache_control']. Keys starting with '/'
+        are URL path prefixes (longest wins) and take precedence over MIME types; MIME keys
+        may be exact ('text/css'), a whole type ('image/*') or the fallback '*'.
+        """
+        policies = self.cache_control or {}
+        urlpath = "/" + os.path.relpath(entry.path, self.full_base_dir).replace(os.path.sep, "/")
+        prefixes = [key for key in policies if key.startswith("/") and urlpath.startswith(key)]
+        if prefixes:
+            return policies[max(prefixes, key=len)]
+        content_type = entry.content_type
+        for key in (content_type, content_type.split("/")[0] + "/*", "*"):
+            if key in policies:
+                return policies[key]
+        return None
+
+    def not_modified(self, headers: dict, entry: StaticFile, encoding: str = None) -> bool:
+        """
+        Evaluate If-None-Match / If-Modified-Since (RFC 7232) against `entry`, or its
+        `encoding` variant. If-None-Match wins when both are present, and uses the weak comparison.
+        """
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = self.entity_tag(entry, encoding)
+            if not etag:
+                return False
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or etag.removeprefix("W/") in tags
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            # HTTP dates have whole-second resolution.
+            return int(entry.mtime) <= since
+        return False
+
+    @classmethod
+    def build_head(cls, status_line: str, *header_lines: str, keep_alive: bool = False) -> bytes:
+        """
+        Whole response head, terminating empty line included, as one buffer,
+        so it leaves in a single write instead of one per header.
+        """
+        return "".join((status_line, f"Server: {server_software}\r\n", *header_lines,
+                        cls.connection_line(keep_alive), "\r\n")).encode("utf-8")
+
+    async def discard_body(self, reader: asyncio.StreamReader, headers: dict) -> bool:
+        """
+        Skip over a request body nobody is going to read, so the next pipelined request
+        starts at the right place. Returns False when the body can't be skipped safely.
+        """
+        if "transfer-encoding" in headers:
+            return False
+        try:
+            remaining = int(headers.get("content-length", 0))
+        except ValueError:
+            return False
+        if remaining < 0 or remaining > self.max_discarded_body:
+            return False
+        while remaining > 0:
+            try:
+                chunk = await reader.read(min(remaining, self.chunk_size))
+            except ConnectionError:
+                return False
+            if not chunk:
+                return False
+            remaining -= len(chunk)
+        return True
 
-        except ValueError as e:
-            print(f"Error parsing request line: {e}")
-            return await self.send_status_response(writer, status_code=400, msg=str(e))
-        print(f"Received request: {method} {path} {protocol}")
+    async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             request: RequestHead, served: int = 0) -> bool:
+        """
+        Handle a single request and send its response.
+        Returns True if the connection can be reused for another request.
+        """
+        method, path, protocol = request.method, request.path, request.version
+        query = request.query
+        request_headers = request.headers
+
+        log.debug("Received request: %s %s %s", method, path, protocol)
         if method not in ["HEAD", "GET", "POST", "PUT", "PATCH", "DELETE"]:
             msg = f"Method {method} not allowed."
-            print(msg)
-            return await self.send_status_response(writer, status_code=405, msg=msg)
+            log.debug(msg)
+            await self.send_status_response(writer, status_code=405, msg=msg)
+            return False
+
+        keep_alive = self.wants_keep_alive(protocol, request_headers, served)
+        if "content-length" in request_headers or "transfer-encoding" in request_headers:
+            # Bodies belong to the app; anywhere else they are skipped, or the connection is dropped.
+            if self.app is not None or not await self.discard_body(reader, request_headers):
+                keep_alive = False
 
-        try:
-            request_headers_block= await self.get_headers_block(reader)
-            # print(f"\nHeaders block:\n{request_headers_block.decode('utf-8')}\n\n")
-        except ValueError as e:
-            print(f"Error parsing  request headers: {e}")
-            return await self.send_status_response(writer, status_code=400, msg=str(e))
-        request_headers = await self.parse_headers(request_headers_block)
         if path == "/oxiserver_demo" and method == "GET":
-            print(f"Serving Oxi Server demo page.")
-            return await self.oxiserver_demo(writer=writer)
+            log.debug("Serving Oxi Server demo page.")
+            await self.oxiserver_demo(writer=writer, keep_alive=keep_alive)
         else:
             fullpath = os.path.join(self.full_base_dir, path.lstrip("/").replace("/", os.path.sep)) 
-            if await is_file(fullpath):
-                if not await is_cgi_exe(fullpath, self.cgi_dir):
+            entry = await self.static_cache.get(fullpath)
+            if entry is not None:
+                if not (entry.executable and self.cgi_dir in fullpath):
                     if method == "GET":
-                        print(f"Serving file: {fullpath}")
-                        return await self.send_file(writer=writer, fullpath=fullpath, headers=request_headers)
+                        log.debug("Serving file: %s", fullpath)
+                        await self.send_file(writer=writer, fullpath=fullpath, headers=request_headers, 
+                                             keep_alive=keep_alive, entry=entry, protocol=protocol, query=query)
                     else:
-                        print(f"Method {method} not allowed for file: {fullpath}")
-                        return await self.send_status_response(writer, status_code=405, msg=f"Method {method} not allowed for file.")  
+                        log.debug("Method %s not allowed for file: %s", method, fullpath)
+                        await self.send_status_response(writer, status_code=405, msg=f"Method {method} not allowed for file.", keep_alive=keep_alive)  
                 else:
-                    print(f"Serving CGI executable: {fullpath}")
-                    return await self.send_file(writer=writer, fullpath=fullpath, headers=request_headers)
+                    log.debug("Serving CGI executable: %s", fullpath)
+                    await self.send_file(writer=writer, fullpath=fullpath, headers=request_headers, 
+                                         keep_alive=keep_alive, entry=entry, protocol=protocol)
             elif path == "/":
                 exists, index_file = await self.has_index()
                 if exists:
-                    print(f"Serving index file: {index_file}")
-                    return await self.send_file(writer=writer, fullpath=index_file, headers=request_headers)
+                    log.debug("Serving index file: %s", index_file)
+                    await self.send_file(writer=writer, fullpath=index_file, headers=request_headers, 
+                                         keep_alive=keep_alive, entry=await self.static_cache.get(index_file),
+                                         protocol=protocol)
                 else:
                     if not self.allow_dirlisting:
-                        print(f"Directory listing not allowed: {fullpath}")
-                        return await self.send_status_response(writer, status_code=403, msg="Directory listing not allowed.")
-                    print(f"Serving static directory: {self.static_dir}")
-                    return await self.send_directory(writer, path=path, dirpath=self.full_base_dir)
+                        log.debug("Directory listing not allowed: %s", fullpath)
+                        await self.send_status_response(writer, status_code=403, msg="Directory listing not allowed.", keep_alive=keep_alive)
+                    else:
+                        log.debug("Serving static directory: %s", self.static_dir)
+                        await self.send_directory(writer, path=path, dirpath=self.full_base_dir, keep_alive=keep_alive,
+                                                  query=query, protocol=protocol)
             elif await is_dir(fullpath):
                 if not self.allow_dirlisting:
-                    print(f"Directory listing not allowed: {fullpath}")
-                    return await self.send_status_response(writer, status_code=403, msg="Directory listing not allowed.")
-                print(f"Serving directory: {fullpath}")
-                return await self.send_directory(writer, path=path, dirpath=fullpath)
+                    log.debug("Directory listing not allowed: %s", fullpath)
+                    await self.send_status_response(writer, status_code=403, msg="Directory listing not allowed.", keep_alive=keep_alive)
+                else:
+                    log.debug("Serving directory: %s", fullpath)
+                    await self.send_directory(writer, path=path, dirpath=fullpath, keep_alive=keep_alive,
+                                              query=query, protocol=protocol)
             else:
                 if self.app is not None:
-                    print(f"Serving app: {self.app.name}")
-                    return await self.app(reader=reader, writer=writer)
+                    log.debug("Serving app: %s", self.app.name)
+                    # The app owns the connection from here on.
+                    await self.app(reader=reader, writer=writer)
+                    return False
                 else:
-                    print(f"File {path} not found.")
-                    return await self.send_status_response(writer, status_code=404, msg=f"Resource '{path}' not found.")  
+                    log.debug("File %s not found.", path)
+                    await self.send_status_response(writer, status_code=404, msg=f"Resource '{path}' not found.", keep_alive=keep_alive)  
+        return keep_alive
 
-    @classmethod
-    async def send_directory(cls, writer: asyncio.StreamWriter, path: str, dirpath: str):
-        
-        async def get_file_details(entry):
-            fullpath = dirpath + os.path.sep + entry
-            size = await asyncio.to_thread(os.path.getsize,fullpath)
-            ret = f'<span style="text-align: right;" class="black">{size:,} bytes</span>'
-            return ret
-        
-        pth = Path(path.strip('/'))
-        prevdir = ("/" + str(pth.parent)) if path != '/' else '/'
-        body = f"""
-            <!DOCTYPE html>
-            <html><head><title>Directory Listing</title>
-            <style>
-                body {{
-                    background-color: #f0f0f0;
-                    font-family: Helvetica, Arial, sans-serif;
-                    font-size: 16px;
-                }}
-                .green {{
-                    color: green;
-                }}
-                .silver {{
-                    color: silver;
-                }}
-                .black {{
-                    color: black;
-                }}
-                .renglon_dirlist {{
-                    margin-left: 1em;
-                    width: 50%;
-                    max-width: 50%;
-                    display: flex;
-                    flex-direction: row;
-                    justify-content: space-between;
-                    align-items: center;
-                    list-style-type: none;
-                    font-size: 150%;
-                    margin-bottom: 0.5em;
-                }}
-                a.link {{
-                    text-decoration: none;
-                    color: steelblue;
-                    font-weight: bold;
-                }}
-                a.link:hover {{
-                    color: black;
-                }}
-                @media (max-width: 798px) {{
-                    .renglon_dirlist {{
-                        width: 90%;    
-                        max-width: 90%;
-                    }}
-                }}
-            </style>
-            </head><body style="margin-left: 1em; margin-right: 1em;">
-            <h2>Directory listing for <span class="green">.{str(path)}</span></h2></hr>
-            <hr>
-            <p style="margin-bottom: 1em; text-align: center; font-family: Times New Roman; font-size: 16px;">{server_software}</p>
-            <hr>
-            <ul>
-                <li class="renglon_dirlist"><a class="link" title="Home" href="/">.</a></li>
-                <li class="renglon_dirlist"><a class="link" title="{str(prevdir)}" href="{str(prevdir)}">..</a></li>
-        """
-        entries = await asyncio.to_thread(os.listdir, dirpath)
-        entries.sort()
-        entries.sort(key=lambda e: os.path.isdir(dirpath + os.path.sep + e), reverse=True)
-        for entry in entries:
-            body += f'''
-            <li class="renglon_dirlist">
-                <a class="link" href="{path + (os.path.sep if path != '/' else '') + entry}">{entry}</a>
-                {'<span class="silver">[DIR]</span>' if (await asyncio.to_thread(os.path.isdir, dirpath + os.path.sep + entry)) else (await get_file_details(entry))}
-            </li>'''
-        body += "</ul></body></html>"
-        body_len = len(body)
-        
-        # print(f"\n(PID {os.getpid()}) {method} {pth} request from {remote_ip}({remote_host}) {time.strftime('%Y-%m-%d %H:%M:%S')} - 200")
-        
+    async def send_directory(self, writer: asyncio.StreamWriter, path: str, dirpath: str, keep_alive: bool = False,
+                             query: dict = None, protocol: str = "HTTP/1.1") -> None:
+        """
+        Directory listing for `dirpath`, HTML or JSON (`?format=json`), from the listing cache.
+        `?sort=name|size|mtime&order=asc|desc` picks the order, `?limit=&offset=` the page;
+        the defaults come from Config. The body is streamed chunked, page by page of rows.
+        """
+        cls = type(self)
+        query = query or {}
+        sort = query.get("sort", self.dirlisting_sort)
+        if sort not in sort_keys:
+            sort = self.dirlisting_sort
+        reverse = query.get("order") == "desc"
         try:
-            writer.write(cls.success_line.encode("utf-8"))
-            writer.write(f"Server: {server_software}\r\n".encode("utf-8"))
-            writer.write(b"content-type: text/html; charset=utf-8\r\n"),
-            writer.write(f"content-length: {str(body_len)}\r\n".encode('utf-8'))
-            await writer.drain()
+            limit = max(0, int(query.get("limit", self.dirlisting_page_size)))
+            offset = max(0, int(query.get("offset", 0)))
+        except ValueError:
+            return await cls.send_status_response(writer, status_code=400, msg="Invalid limit or offset.",
+                                                  keep_alive=keep_alive)
+        listing = await self.directory_cache.get(dirpath, sort, reverse)
+        if listing is None:
+            return await cls.send_status_response(writer, status_code=404, msg=f"Directory '{path}' not found.",
+                                                  keep_alive=keep_alive)
+        entries = listing.sorted(sort, reverse)
+        page = entries[offset:offset + limit] if limit else entries[offset:]
+
+        if query.get("format") == "json":
+            content_type = "application/json"
+            parts = json_listing(path, page, len(entries), offset, limit)
+        else:
+            content_type = "text/html; charset=utf-8"
+            parts = html_listing(path, page, len(entries), offset, limit, sort, reverse, server_software)
+
+        try:
+            if protocol.upper() != "HTTP/1.1":
+                # No chunked encoding for HTTP/1.0: one body with its length.
+                body = "".join(parts).encode("utf-8")
+                writer.write(cls.build_head(cls.success_line,
+                                            f"Content-Type: {content_type}\r\n",
+                                            f"Content-Length: {len(body)}\r\n",
+                                            keep_alive=keep_alive) + body)
+                await writer.drain()
+                return
+
+            async def chunks():
+                for part in parts:
+                    yield part.encode("utf-8")
+
+            await cls.send_chunked(writer, cls.success_line, f"Content-Type: {content_type}\r\n",
+                                   chunks=chunks(), keep_alive=keep_alive)
         except Exception as e:
-            print(f"Error writing directory listing headers: {e}")
-            # return await self.send_status_response(writer, status_code=500, reason="Internal Server Error", msg=str(e))
+            log.warning("Error writing directory listing: %s", e)
+            writer.close()
+
+    async def send_file(self, writer: asyncio.StreamWriter, fullpath: str, 
+                        headers: dict = None, forced: bool = False, keep_alive: bool = False,
+                        entry: StaticFile = None, protocol: str = "HTTP/1.1", query: dict = None) -> None:
+        """
+        Send a static file, or a 304 if the client's copy is still current.
+        `entry` is its StaticFile (from the cache); when the body is cached too,
+        the response goes out without touching the file system.
+        """
+        cls = type(self)
+        if entry is None:
+            entry = await self.static_cache.get(fullpath)
+            if entry is None:
+                return await self.send_status_response(writer, status_code=404, 
+                                                       msg="File not found.", keep_alive=keep_alive)
+        content_type = entry.content_type
+        if content_type == 'video/mp4' and not forced:
+            return await self.send_mp4(writer, entry, headers=headers, keep_alive=keep_alive, query=query)
+        encoding = self.choose_encoding(headers, entry, protocol) if headers else None
+        if encoding:
+            try:
+                await self.send_compressed(writer, entry, encoding, headers, keep_alive=keep_alive)
+            except Exception as e:
+                log.warning("Error sending %s encoded file: %s", encoding, e)
+                writer.close()
+            return
+        if headers and self.not_modified(headers, entry):
+            try:
+                writer.write(entry.heads[304, keep_alive])
+                await writer.drain()
+            except Exception as e:
+                log.warning("Error writing not modified response: %s", e)
+                writer.close()
+            return
+        ranges = self.requested_ranges(headers, entry) if headers else None
+        if ranges is not None and not ranges:
+            return await self.send_status_response(writer, status_code=416, 
+                                                   msg=f"Requested range not satisfiable for {entry.size} bytes.",
+                                                   keep_alive=keep_alive,
+                                                   header_lines=(f"Content-Range: bytes */{entry.size}\r\n",))
+        if entry.body is not None:
+            try:
+                if ranges:
+                    await self.send_ranges(writer, entry, ranges, keep_alive=keep_alive)
+                else:
+                    writer.writelines((entry.heads[200, keep_alive], entry.body))
+                    await writer.drain()
+            except Exception as e:
+                log.warning("Error writing cached file: %s", e)
+                writer.close()
             return
         try:
-            writer.write(b"\r\n")
-            await writer.drain()
-            writer.write(to_bytes(body))
-            await writer.drain()
+            file_desc = await fs_executor.run(os.open, fullpath, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as e:
+            log.error("Error opening file: %s", e)
+            return await cls.send_status_response(writer, status_code=404, 
+                                                  msg="File not found.", keep_alive=keep_alive)
+        try:
+            if ranges:
+                await self.send_ranges(writer, entry, ranges, keep_alive=keep_alive, file_desc=file_desc)
+            else:
+                writer.write(entry.heads[200, keep_alive])
+                await writer.drain()
+                await cls.send_file_body(writer, file_desc, 0, entry.size)
         except Exception as e:
-            print(f"Error directory listing writing body: {e}")
+            log.warning("Error sending file: %s", e)
             # return await self.send_status_response(writer, status_code=500, reason="Internal Server Error", msg=str(e))
+            writer.close()
+        finally:
+            try:
+                await fs_executor.run(os.close, file_desc)
+            except Exception as e:
+                log.error("Error closing file descriptor: %s", e)
 
-    @classmethod
-    async def send_file(cls, writer: asyncio.StreamWriter, fullpath: str, 
-                        headers: dict = None, forced: bool = False) -> None:
+    def requested_ranges(self, headers: dict, entry: StaticFile, size: int = None):
+        """
+        Byte ranges the client asked for, honouring If-Range. None means send the whole
+        file, an empty list means nothing asked for is satisfiable (416). `size` is the
+        length of the representation sent, when it isn't the file's.
+        """
+        value = headers.get("range")
+        if not value:
+            return None
+        if_range = headers.get("if-range")
+        if if_range is not None:
+            if_range = if_range.strip()
+            if if_range.startswith(('"', 'W/')):
+                # Strong comparison: only our own strong validator matches.
+                if self.etag != 'strong' or if_range != entry.etag:
+                    return None
+            else:
+                try:
+                    since = parsedate_to_datetime(if_range).timestamp()
+                except (TypeError, ValueError, IndexError, OverflowError):
+                    return None
+                if int(entry.mtime) != since:
+                    return None
+        return parse_range(value, entry.size if size is None else size, max_ranges=self.max_ranges)
 
-        content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
-        if content_type == 'video/mp4' and not forced:
-            return await cls.send_mp4(writer=writer, fullpath=fullpath, headers=headers)
-        file_desc = await asyncio.to_thread(os.open, fullpath, os.O_RDONLY | os.O_NONBLOCK)
-        file_stat = await asyncio.to_thread(os.fstat, file_desc)
-        body_len = file_stat.st_size
-        try:
-            writer.write(cls.success_line.encode("utf-8"))
-            writer.write(f"Server: {server_software}\r\n".encode("utf-8"))
-            writer.write(f"Content-Type: {content_type}\r\n".encode("utf-8"))
-            writer.write(f"Content-Length: {body_len}\r\n".encode("utf-8"))
-            writer.write("Access-Control-Allow-Origin: *\r\n".encode("utf-8"))
-            writer.write(b"\r\n")
+    def validator_lines(self, entry: StaticFile, encoding: str = None) -> list:
+        """
+        ETag, Last-Modified, Cache-Control and Vary lines shared by every response for `entry`.
+        """
+        lines = []
+        etag = self.entity_tag(entry, encoding)
+        if etag:
+            lines.append(f"ETag: {etag}\r\n")
+        lines.append(f"Last-Modified: {entry.last_modified}\r\n")
+        cache_control = self.cache_control_for(entry)
+        if cache_control:
+            lines.append(f"Cache-Control: {cache_control}\r\n")
+        if self.content_codings(entry):
+            lines.append("Vary: Accept-Encoding\r\n")
+        return lines
+
+    def content_codings(self, entry: StaticFile) -> list:
+        """
+        Content codings `entry` can go out with, best first: its precompressed
+        siblings, plus whatever we can compress on the fly for compressible types.
+        """
+        if not self.compression:
+            return []
+        dynamic = is_compressible(entry.content_type) and entry.size >= self.compression_min_size
+        return [coding for coding in precompressed_suffixes 
+                if coding in entry.siblings or (dynamic and coding in encodings)]
+
+    def choose_encoding(self, headers: dict, entry: StaticFile, protocol: str = "HTTP/1.1") -> str:
+        """
+        Content coding to send `entry` with, None for identity. Range requests
+        are always served from the identity representation.
+        """
+        codings = self.content_codings(entry)
+        if not codings or "range" in headers:
+            return None
+        encoding = negotiate(headers.get("accept-encoding"), codings)
+        if encoding and encoding not in entry.siblings and entry.size > self.compression_cache_max_file \
+                and protocol.upper() != "HTTP/1.1":
+            # That one would be streamed chunked, which HTTP/1.0 can't take.
+            return None
+        return encoding
+
+    async def compressed_variant(self, entry: StaticFile, encoding: str) -> bytes:
+        """
+        `entry` compressed with `encoding`, from the variant cache or made in the compression
+        pool. Concurrent requests for the same variant share one compression job.
+        """
+        key = (entry.etag, encoding)
+        data = self.compressed_cache.get(key)
+        if data is not None:
+            return data
+        pending = self.pending_compressions.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(self.compression_pool, compress_file, entry.path, encoding)
+            self.pending_compressions[key] = pending
+            pending.add_done_callback(lambda _: self.pending_compressions.pop(key, None))
+        data = await asyncio.shield(pending)
+        if key not in self.compressed_cache:
+            self.compressed_cache.put(key, data, len(data))
+        return data
+
+    async def send_compressed(self, writer: asyncio.StreamWriter, entry: StaticFile, encoding: str,
+                              headers: dict, keep_alive: bool = False) -> None:
+        """
+        Send `entry` with content coding `encoding`: a precompressed sibling if there
+        is one, a cached or freshly made variant, or, for files too big to keep,
+        compressed on the fly and streamed chunked.
+        """
+        cls = type(self)
+        validators = self.validator_lines(entry, encoding)
+        if self.not_modified(headers, entry, encoding):
+            writer.write(self.build_head(self.not_modified_line, *validators, keep_alive=keep_alive))
             await writer.drain()
-        except Exception as e:
-            print(f"Error writing headers: {e}")
-            await asyncio.to_thread(os.close, file_desc)
-            # return await self.send_status_response(writer, status_code=500, reason="Internal Server Error", msg=str(e))
             return
-        
+        lines = (f"Content-Type: {entry.content_type}\r\n",
+                 f"Content-Encoding: {encoding}\r\n",
+                 "Access-Control-Allow-Origin: *\r\n",
+                 *validators)
+
+        sibling = entry.siblings.get(encoding)
+        variant = await self.static_cache.get(sibling) if sibling else None
+        if variant is not None:
+            head = self.build_head(self.success_line, f"Content-Length: {variant.size}\r\n", *lines, keep_alive=keep_alive)
+            if variant.body is not None:
+                writer.writelines((head, variant.body))
+                await writer.drain()
+                return
+            file_desc = await fs_executor.run(os.open, variant.path, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                writer.write(head)
+                await writer.drain()
+                await cls.send_file_body(writer, file_desc, 0, variant.size)
+            finally:
+                await fs_executor.run(os.close, file_desc)
+            return
+
+        if entry.size <= self.compression_cache_max_file:
+            data = await self.compressed_variant(entry, encoding)
+            writer.writelines((self.build_head(self.success_line, f"Content-Length: {len(data)}\r\n", *lines, 
+                                               keep_alive=keep_alive), data))
+            await writer.drain()
+            return
+
+        chunks = compress_file_chunks(entry.path, encoding, self.compression_pool, chunk_size=256 * 1024)
+        await cls.send_chunked(writer, self.success_line, *lines, chunks=chunks, keep_alive=keep_alive)
+
+    async def send_ranges(self, writer: asyncio.StreamWriter, entry: StaticFile, ranges: list,
+                          keep_alive: bool = False, file_desc: int = None) -> None:
+        """
+        206 response for `ranges` of `entry`: the bare range if there is one,
+        multipart/byteranges otherwise. Parts come from the cached body, or are
+        sent from `file_desc` at their offsets.
+        """
+        cls = type(self)
+
+        async def send_part(first: int, last: int):
+            if entry.body is not None:
+                writer.write(memoryview(entry.body)[first:last + 1])
+            else:
+                await writer.drain()
+                await cls.send_file_body(writer, file_desc, first, last - first + 1)
+
+        common = ("Accept-Ranges: bytes\r\n", *self.validator_lines(entry))
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            writer.write(self.build_head(self.partial_line,
+                                         f"Content-Type: {entry.content_type}\r\n",
+                                         f"Content-Length: {last - first + 1}\r\n",
+                                         f"Content-Range: bytes {first}-{last}/{entry.size}\r\n",
+                                         *common, keep_alive=keep_alive))
+            await send_part(first, last)
+            await writer.drain()
+            return
+
+        boundary = os.urandom(12).hex()
+        part_heads = [(f"--{boundary}\r\nContent-Type: {entry.content_type}\r\n"
+                       f"Content-Range: bytes {first}-{last}/{entry.size}\r\n\r\n").encode("utf-8")
+                      for first, last in ranges]
+        closing = f"--{boundary}--\r\n".encode("utf-8")
+        length = sum(len(part_head) + last - first + 3 for part_head, (first, last) in zip(part_heads, ranges))
+        writer.write(self.build_head(self.partial_line,
+                                     f"Content-Type: multipart/byteranges; boundary={boundary}\r\n",
+                                     f"Content-Length: {length + len(closing)}\r\n",
+                                     *common, keep_alive=keep_alive))
+        for part_head, (first, last) in zip(part_heads, ranges):
+            writer.write(part_head)
+            await send_part(first, last)
+            writer.write(b"\r\n")
+        writer.write(closing)
+        await writer.drain()
+
+    @classmethod
+    async def send_chunked(cls, writer: asyncio.StreamWriter, status_line: str, *header_lines: str,
+                           chunks, keep_alive: bool = False) -> None:
+        """
+        Send a response of unknown length with Transfer-Encoding: chunked.
+        `chunks` is an async iterable of bytes; empty ones are skipped, since a
+        zero-length chunk would end the body.
+        """
+        writer.write(cls.build_head(status_line, *header_lines, "Transfer-Encoding: chunked\r\n", 
+                                    keep_alive=keep_alive))
+        async for chunk in chunks:
+            if chunk:
+                writer.writelines((b"%x\r\n" % len(chunk), chunk, b"\r\n"))
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @classmethod
+    async def send_file_body(cls, writer: asyncio.StreamWriter, file_desc: int, offset: int, count: int) -> None:
+        """
+        Send `count` bytes of the open file `file_desc` starting at `offset`,
+        zero-copy where the platform and event loop allow it.
+        """
+
+        def account(sent: int):
+            # Zero-copy sends bypass writer.write(), so the access log meter is told here.
+            if hasattr(writer, "bytes_sent"):
+                writer.bytes_sent += sent
+
         async def send_windows():
-            remaining = body_len
+            # Reads happen in fs_executor, never on the event loop thread, in pieces
+            # large enough that the thread hops don't dominate.
+            await fs_executor.run(os.lseek, file_desc, offset, os.SEEK_SET)
+            remaining = count
             while remaining > 0:
-                chunk = min(cls.chunk_size, remaining)
-                try:
-                    data = os.read(file_desc, chunk)
-                    if not data:
-                        break
-                    writer.write(data)
-                    await writer.drain()
-                    remaining -= len(data)
-                except BlockingIOError as e:
-                    if e.errno == errno.EAGAIN:
-                        await asyncio.sleep(0)
-                        continue
-            await asyncio.to_thread(os.close, file_desc)
-            await finalize_writer(writer)
+                data = await fs_executor.run(os.read, file_desc, min(cls.read_size, remaining))
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+                remaining -= len(data)
+            await writer.drain()
 
         async def send_linux():
             loop = asyncio.get_running_loop()
             try:
+                if not cls.loop_sendfile:
+                    raise NotImplementedError
                 file_obj = open(file_desc, "rb", closefd=False)
-                await loop.sendfile(writer.transport, file_obj)
-            except (AttributeError, NotImplementedError, RuntimeError) as e:
-                print(f"loop.sendfile() not available or failed ({e}), falling back to read/write")
+                sent = await loop.sendfile(writer.transport, file_obj, offset, count)
+                account(sent)
+            except NotImplementedError:
+                if cls.loop_sendfile:
+                    log.info("%s loop has no sendfile(), using read/write for files", event_loop_name(loop))
+                    cls.loop_sendfile = False
                 await send_windows()
-            finally:
-                try:
-                    await asyncio.to_thread(os.close, file_desc)
-                    await finalize_writer(writer)
-                except Exception as e:
-                    print(f"Error closing file descriptor: {e}")
+            except (AttributeError, RuntimeError) as e:
+                log.warning("loop.sendfile() not available or failed (%s), falling back to read/write", e)
+                await send_windows()
+            await writer.drain()
 
         async def send_mac():
             sock = writer.get_extra_info("socket")
             sock_fd = sock.fileno() 
-            offset = 0
-            while offset < body_len:
-                sent = os.sendfile(sock_fd, file_desc, offset, body_len - offset)
+            position, end = offset, offset + count
+            while position < end:
+                sent = os.sendfile(sock_fd, file_desc, position, end - position)
                 if sent == 0:
                     break
-                offset += sent
-            await asyncio.to_thread(os.close, file_desc)
-            await finalize_writer(writer)
+                position += sent
+            account(position - offset)
+            await writer.drain()
 
         if is_windows():
             return await send_windows()
@@ -441,156 +927,176 @@ class ProtocolFactory:
         if is_mac():
             return await send_mac()
 
-    @classmethod
-    async def send_mp4(cls, writer: asyncio.StreamWriter, fullpath: str, headers: dict = None) -> None:
-        mp4 = Mp4(fullpath)
-        boundaries = await mp4.faststart_boundaries
-        response_line = cls.partial_line
-        start, end = 0, mp4.filesize - 1
-
-        sec_fetch_dest = headers.get("sec-fetch-dest", None)
-        if sec_fetch_dest:
-            if sec_fetch_dest != "video":
-                response_line = cls.success_line
-        bytesrange = headers.get("range")
-        if not bytesrange:
-            print(f"Range header not found. Sending full file.")
-            start = 0
-            end = 0
-            # boundaries = await mp4.faststart_boundaries
-            for entry in boundaries:
-                moov_bounds = entry.get('moov')
-                if moov_bounds:
-                    end = moov_bounds[1] - 1
-                    break
-            if end == 0:
-                end = mp4.filesize - 1
-        else:
-            bytesrange = bytesrange.lstrip("bytes=")
-            start, end = bytesrange.split("-")
-            start = int(start)
-            end = int(end) if end else mp4.filesize - 1
-            if start < 0 or end >= mp4.filesize or start > end:
-                print(f"Invalid range: {bytesrange}. Sending full file.")
-                start, end = 0, mp4.filesize - 1
-        length = end - start + 1
+    async def send_mp4(self, writer: asyncio.StreamWriter, entry: StaticFile, headers: dict = None,
+                       keep_alive: bool = False, query: dict = None) -> None:
+        """
+        Send an MP4 file in faststart order (moov before mdat), with Range support.
+        The patched moov comes from memory and every other byte straight from the
+        file, through the same zero-copy path as send_file. Layouts come from
+        faststart_cache. Files that don't parse as MP4 go out as they are.
+        With ?format=hls, ?format=init or ?segment=N the file is served as HLS instead,
+        and with ?t=seconds it starts at the last keyframe before that time.
+        """
+        if self.hls and query and (query.get("format") in ("hls", "init") or "segment" in query):
+            return await self.send_fragmented(writer, entry, query, headers=headers, keep_alive=keep_alive)
+        if self.mp4_seek and query and "t" in query:
+            return await self.send_trimmed(writer, entry, query["t"], headers=headers, keep_alive=keep_alive)
         try:
-            writer.write(response_line.encode("utf-8"))
-            writer.write(f"Server: {server_software}\r\n".encode("utf-8"))
-            writer.write(b"Content-Type: video/mp4\r\n")
-            # writer.write(b"Access-Control-Allow-Origin: *\r\n")
-            writer.write(b"Accept-Ranges: bytes\r\n")
-            print(f'\nSENDING video content:\tContent-Range: bytes {start}-{end}/{mp4.filesize}\n')
-            writer.write(f'Content-Range: bytes {start}-{end}/{mp4.filesize}\r\n'.encode('utf-8'))                        
-            writer.write(f"Content-Length: {length}\r\n\r\n".encode("utf-8"))
-            await writer.drain()
+            layout = await self.faststart_cache.get(entry.path, entry.size, entry.mtime_ns)
         except Exception as e:
-            print(f"Error writing mp4 headers: {e}")
-            # return await cls.send_status_response(writer, status_code=500, reason="Internal Server Error", msg=str(e))
-            return
+            log.warning("Cannot lay out %s for streaming (%s), sending it as is.", entry.path, e)
+            return await self.send_file(writer, entry.path, headers=headers, forced=True, 
+                                        keep_alive=keep_alive, entry=entry)
+        await self.send_layout(writer, entry, layout, headers=headers, keep_alive=keep_alive)
 
-        stream = mp4.async_stream_range(start, end)
-        written = 0
-        async for chunk in stream:
-            try:
-                writer.write(chunk)
-                await writer.drain()
-                written += len(chunk)
-                # print(f"Written {len(chunk)} bytes for a total of {written} out of {mp4.filesize}.")
-            except Exception as e:
-                print(f"Error writing mp4 chunk: {e}")
-                # return await cls.send_status_response(writer, status_code=500, reason="Internal Server Error", msg=str(e))
-                break
-        try:    
-            writer.close()
-            await writer.wait_closed()
+    async def fragmented_mp4(self, entry: StaticFile) -> FragmentedMp4:
+        """
+        The FragmentedMp4 for the current version of `entry`, parsed once and kept in fragment_cache.
+        """
+        key = (entry.path, entry.mtime_ns, entry.size)
+        fragmented = self.fragment_cache.get(key)
+        if fragmented is None:
+            fragmented = await fs_executor.run(FragmentedMp4.load, entry.path, self.hls_segment_duration,
+                                               key=('fragmented', key))
+            if fragmented.size == entry.size:
+                self.fragment_cache.put(key, fragmented, fragmented.memory)
+        return fragmented
+
+    async def send_fragmented(self, writer: asyncio.StreamWriter, entry: StaticFile, query: dict,
+                              headers: dict = None, keep_alive: bool = False) -> None:
+        """
+        `entry` as HLS with fragmented MP4 media: the playlist (?format=hls), the
+        init segment (?format=init) or media segment N (?segment=N).
+        """
+        cls = type(self)
+        try:
+            fragmented = await self.fragmented_mp4(entry)
         except Exception as e:
-            print(f"Error closing writer: {e}")
-            # return await cls.send_status_response(writer, status_code=500, reason="Internal Server Error", msg=str(e))
-        finally:
-            print(f"{written} bytes written out of {mp4.filesize}.")
+            log.warning("Cannot fragment %s: %s", entry.path, e)
+            return await cls.send_status_response(writer, status_code=415, keep_alive=keep_alive,
+                                                  msg="This file can't be streamed as fragmented MP4.")
+        if "segment" in query:
+            try:
+                index = int(query["segment"])
+                if not 0 <= index < len(fragmented):
+                    raise ValueError(index)
+            except ValueError:
+                return await cls.send_status_response(writer, status_code=404, msg="No such segment.",
+                                                      keep_alive=keep_alive)
+            return await self.send_layout(writer, entry, fragmented.fragment(index), headers=headers,
+                                          keep_alive=keep_alive)
+        if headers and self.not_modified(headers, entry):
+            writer.write(entry.heads[304, keep_alive])
+            await writer.drain()
             return
+        if query["format"] == "hls":
+            body = fragmented.playlist(os.path.basename(entry.path)).encode("utf-8")
+            content_type = "application/vnd.apple.mpegurl"
+        else:
+            body, content_type = fragmented.init, entry.content_type
+        writer.writelines((self.build_head(self.success_line, f"Content-Type: {content_type}\r\n",
+                                           f"Content-Length: {len(body)}\r\n", *self.validator_lines(entry),
+                                           keep_alive=keep_alive), body))
+        await writer.drain()
 
-    @classmethod    
-    async def get_request_line(cls, reader: asyncio.StreamReader) -> tuple[str]:
+    async def send_trimmed(self, writer: asyncio.StreamWriter, entry: StaticFile, start: str,
+                           headers: dict = None, keep_alive: bool = False) -> None:
         """
-        Read the request line from the client.
+        `entry` cut to start at the keyframe at or before `start` seconds: a valid MP4 with
+        a rewritten moov and only the mdat bytes from there on. Trimmed layouts are kept
+        in fragment_cache, per keyframe, for the Range requests that follow.
         """
-        retries = 0
-        max_retries = 3
-        while True:
-            try:
-                request_line = await reader.readuntil(b"\r\n")
-                break
-            except asyncio.IncompleteReadError as e:
-                retries += 1
-                print(f"Retrying to read request line: {e}\nAttempt {retries}/{max_retries}")
-                if retries >= max_retries:
-                    request_line = ''
-                    break
-                else:
-                    await asyncio.sleep(0)
-                    continue
-        if not request_line:
-            raise ValueError("Request line is incomplete after multiple attempts.")
-        request_line = request_line.rstrip(b"\r\n")
-        if not request_line:
-            raise ValueError("Request line is empty after stripping.")
-        request_line = request_line.decode("utf-8").strip()
-        if not request_line:
-            raise ValueError("Request line is empty after decoding.")
+        cls = type(self)
         try:
-            # self.request_line = request_line
-            method, path, protocol = re.split(r"\s+", request_line)
+            start = float(start)
+            if not 0 <= start < float("inf"):
+                raise ValueError(start)
         except ValueError:
-            raise ValueError("Request line is malformed. Unable to split into method, path, and protocol.")
-        if not method or not path or not protocol:
-            raise ValueError("Request line is malformed. Missing method, path, or protocol.")
-        return method.upper(), unquote_plus(path), protocol
+            return await cls.send_status_response(writer, status_code=400, msg="Bad start time.",
+                                                  keep_alive=keep_alive)
+        try:
+            fragmented = await self.fragmented_mp4(entry)
+            keyframe = fragmented.keyframe(start)
+            key = (entry.path, entry.mtime_ns, entry.size, 'trim', keyframe)
+            layout = self.fragment_cache.get(key)
+            if layout is None:
+                layout = await fs_executor.run(fragmented.trim, keyframe, key=key)
+                self.fragment_cache.put(key, layout, layout.memory)
+        except Exception as e:
+            log.warning("Cannot seek into %s (%s), sending it whole.", entry.path, e)
+            return await self.send_mp4(writer, entry, headers=headers, keep_alive=keep_alive)
+        await self.send_layout(writer, entry, layout, headers=headers, keep_alive=keep_alive)
 
-    @classmethod
-    async def get_headers_block(cls, reader: asyncio.StreamReader) -> bytes:
+    async def send_layout(self, writer: asyncio.StreamWriter, entry: StaticFile, layout: FaststartLayout,
+                          headers: dict = None, keep_alive: bool = False) -> None:
         """
-        Read header lines from the client.
+        Send `layout` (whole, or the single range asked for) as a representation of `entry`:
+        in-memory pieces are written, file pieces go out through send_file_body.
         """
-        retries = 0
-        max_retries = 3
-        while True:
-            try:
-                headers_block = await reader.readuntil(b"\r\n\r\n")
-                break
-            except asyncio.IncompleteReadError as e:
-                retries += 1
-                print(f"Retrying to read header blocks: {e}\nAttempt {retries}/{max_retries}")
-                if retries >= max_retries:
-                    headers_block = b''
-                    break
-                else:
-                    await asyncio.sleep(0)
+        cls = type(self)
+        if headers and self.not_modified(headers, entry):
+            writer.write(entry.heads[304, keep_alive])
+            await writer.drain()
+            return
+        ranges = self.requested_ranges(headers, entry, size=layout.size) if headers else None
+        if ranges is not None and not ranges:
+            return await cls.send_status_response(writer, status_code=416, 
+                                                  msg=f"Requested range not satisfiable for {layout.size} bytes.",
+                                                  keep_alive=keep_alive,
+                                                  header_lines=(f"Content-Range: bytes */{layout.size}\r\n",))
+        common = ("Access-Control-Allow-Origin: *\r\n", "Accept-Ranges: bytes\r\n", *self.validator_lines(entry))
+        if ranges and len(ranges) == 1:
+            first, last = ranges[0]
+            writer.write(self.build_head(self.partial_line,
+                                         f"Content-Type: {entry.content_type}\r\n",
+                                         f"Content-Length: {last - first + 1}\r\n",
+                                         f"Content-Range: bytes {first}-{last}/{layout.size}\r\n",
+                                         *common, keep_alive=keep_alive))
+        else:
+            # Several ranges: players never ask for them, so the whole file will do (RFC 7233 allows it).
+            first, last = 0, layout.size - 1
+            writer.write(self.build_head(self.success_line,
+                                         f"Content-Type: {entry.content_type}\r\n",
+                                         f"Content-Length: {layout.size}\r\n",
+                                         *common, keep_alive=keep_alive))
+        log.debug("Sending video content: bytes %s-%s/%s", first, last, layout.size)
+
+        file_desc = None
+        try:
+            for data, file_offset, length in layout.pieces(first, last):
+                if data is not None:
+                    writer.write(data)
                     continue
-        if not headers_block:
-            raise ValueError("Headers block is incomplete after multiple attempts.")
-        headers_block = headers_block.rstrip(b"\r\n\r\n")
-        if not headers_block:
-            raise ValueError("Headers block is empty after stripping.")
-        # self.headers_block = headers_block
-        return headers_block
+                if file_desc is None:
+                    file_desc = await fs_executor.run(os.open, layout.path, os.O_RDONLY | os.O_NONBLOCK)
+                await writer.drain()
+                await cls.send_file_body(writer, file_desc, file_offset, length)
+            await writer.drain()
+        except Exception as e:
+            log.warning("Error sending video content: %s", e)
+            writer.close()
+        finally:
+            if file_desc is not None:
+                await fs_executor.run(os.close, file_desc)
 
-    @classmethod
-    async def parse_headers(cls, headers_block: bytes) -> dict:
+    async def read_request(self, reader: asyncio.StreamReader) -> RequestHead:
         """
-        Parse the headers block into a dictionary.
+        Read and parse the next request head on the connection.
+        Raises EOFError if the client hung up cleanly between requests.
         """
-        headers = {}
-        lines = headers_block.decode("utf-8").split("\r\n")
-        for line in lines:
-            if ": " in line:
-                key, value = line.split(": ", 1)
-                headers[key.strip().lower()] = value.strip()
-        return headers
-    
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                raise EOFError("Connection closed by client.")
+            raise HttpParserError("Request head is incomplete.")
+        except asyncio.LimitOverrunError:
+            raise HttpParserError("Request head too large.", 431)
+        return self.parser.parse_head(head)
+
     @classmethod
-    async def send_status_response(cls, writer: asyncio.StreamWriter, status_code: int=404, reason: str = None, msg:str="") -> None:
+    async def send_status_response(cls, writer: asyncio.StreamWriter, status_code: int=404, reason: str = None, 
+                                   msg:str="", keep_alive: bool = False, header_lines: tuple = ()) -> None:
         reason = reason or status_dict.get(status_code, "Unknown Status")
         status_line = f"HTTP/1.1 {status_code} {reason}\r\n"
         realmsg = msg + '\r\n' if len(msg) else ''
@@ -603,29 +1109,23 @@ class ProtocolFactory:
 <p>&nbsp;</p>
 <p>{realmsg}</p>
 </body>
-</html>"""
+</html>""".encode("utf-8")
         if writer.is_closing():
-            print(f"Writer is closing. Cannot send status response.")
+            log.debug("Writer is closing. Cannot send status response.")
             return
         
         try:
-            writer.write(status_line.encode("utf-8"))
-            writer.write(f"Server: {server_software}\r\n".encode("utf-8"))
-            writer.write(b"Content-Type: text/html; charset=utf-8\r\n")
-            writer.write(f"Content-Length: {len(response)}\r\n\r\n".encode("utf-8"))
-            writer.write(response.encode("utf-8"))
+            writer.write(cls.build_head(status_line,
+                                        "Content-Type: text/html; charset=utf-8\r\n",
+                                        f"Content-Length: {len(response)}\r\n",
+                                        *header_lines,
+                                        keep_alive=keep_alive) + response)
             await writer.drain()
         except Exception as e:
-            print(f"Error writing status response: {e}")
-            return
-        try:
+            log.warning("Error writing status response: %s", e)
             writer.close()
-            await writer.wait_closed()
-        except Exception as e:
-            print(f"Error closing writer: {e}")
-            return
 
-    async def oxiserver_demo(self, writer: asyncio.StreamWriter = None) -> None:
+    async def oxiserver_demo(self, writer: asyncio.StreamWriter = None, keep_alive: bool = False) -> None:
         """
         Send a demo HTML page to the client.
         """
@@ -635,8 +1135,8 @@ class ProtocolFactory:
         exists = await is_static("./static/img")
         if not exists:
             msg = "Static directory not found. Please create a static directory with images."
-            return await self.send_status_response(writer, status_code=404, msg=msg)
-        listdir = await asyncio.to_thread(os.listdir, "./static/img")
+            return await self.send_status_response(writer, status_code=404, msg=msg, keep_alive=keep_alive)
+        listdir = await fs_executor.run(os.listdir, "./static/img")
         listdir = [entry for entry in listdir if mimetypes.guess_type(entry)[0] and mimetypes.guess_type(entry)[0].startswith("image")]
         img_src = random.choice(listdir)
         newzen = random.choice([self.zen, self.zen, self.zen, self.original_zen]).replace("\n", "<br>")
@@ -666,93 +1166,495 @@ class ProtocolFactory:
             </body>
         </html>
 """
+        html = html.encode("utf-8")
         content_length = len(html)
-        print(f"Writing to socket {content_length} bytes.\n")
-        writer.write(f"Server: {server_software}\r\n".encode("utf-8"))
+        log.debug("Writing to socket %s bytes.", content_length)
         content_type = "text/html; charset=utf-8"
-        writer.write(self.success_line.encode("utf-8"))
-        writer.write(f"Content-Type: {content_type}\r\n".encode("utf-8"))
-        writer.write(f"Content-Length: {content_length}\r\n".encode("utf-8"))
-        writer.write(b"\r\n")
-        writer.write(html.encode("utf-8"))
-        writer.write(b"\r\n")
+        writer.write(self.build_head(self.success_line,
+                                     f"Content-Type: {content_type}\r\n",
+                                     f"Content-Length: {content_length}\r\n",
+                                     keep_alive=keep_alive) + html)
         await writer.drain()
-        writer.close()
-        await writer.wait_closed()
 
 ######################################################################################
 
-def fs_monitor():
+class HttpConnection(asyncio.Protocol):
+    """
+    Low-level asyncio.Protocol front end for a ProtocolFactory, without the
+    StreamReader/StreamWriter layer.
+
+    Request heads are parsed in `data_received` as the bytes come in, and the connection
+    itself stands in for both the reader and the writer the handlers expect. Writes are
+    collected in one buffer that goes out in a single `transport.write` on `drain()`,
+    and `drain()` waits while the transport has paused us (pause_writing/resume_writing).
+    """
+
+    # Hand buffered response data to the transport once this much has piled up.
+    write_buffer_size = 64 * 1024
+    # Stop reading from the socket while this much unconsumed input is buffered.
+    read_buffer_size = 256 * 1024
+
+    def __init__(self, factory: ProtocolFactory):
+        self.factory = factory
+        self.parser = HttpRequestParser(max_head_size=factory.max_head_size,
+                                        max_header_count=factory.max_header_count)
+        self.transport = None
+        self.task = None
+        self._loop = asyncio.get_running_loop()
+        self._write_buffer = bytearray()
+        self._head_waiter = None
+        self._data_waiter = None
+        self._drain_waiter = None
+        self._closed = self._loop.create_future()
+        self._write_paused = False
+        self._read_paused = False
+        self._eof = False
+        # Access log figures: status of the response being written, bytes sent so far.
+        self.status = None
+        self.bytes_sent = 0
+
+    # asyncio.Protocol callbacks
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        self.task = self._loop.create_task(self.factory.serve_connection(self, self, self.read_request))
+
+    def data_received(self, data: bytes) -> None:
+        parser = self.parser
+        parser.feed(data)
+        waiter = self._head_waiter
+        if waiter is not None and not waiter.done():
+            try:
+                head = parser.parse()
+            except HttpParserError as e:
+                waiter.set_exception(e)
+            else:
+                if head is not None:
+                    waiter.set_result(head)
+        else:
+            self._wakeup(self._data_waiter)
+        if len(parser.buffer) > self.read_buffer_size and not self._read_paused:
+            self._read_paused = True
+            self.transport.pause_reading()
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wakeup(self._head_waiter)
+        self._wakeup(self._data_waiter)
+        # Keep the transport open: requests sent before the EOF still get their answers.
+        return True
+
+    def connection_lost(self, exc: Exception) -> None:
+        self.eof_received()
+        waiter = self._drain_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(exc or ConnectionResetError("Connection lost"))
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    def pause_writing(self) -> None:
+        self._write_paused = True
+
+    def resume_writing(self) -> None:
+        self._write_paused = False
+        self._wakeup(self._drain_waiter)
+
+    @staticmethod
+    def _wakeup(waiter: asyncio.Future) -> None:
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    # Reader side
+
+    async def read_request(self) -> RequestHead:
+        """
+        Next request head on the connection. A pipelined one may already be buffered,
+        otherwise `data_received` completes the parse.
+        Raises EOFError if the client hung up cleanly between requests.
+        """
+        while True:
+            head = self.parser.parse()
+            if head is not None:
+                return head
+            if self._eof:
+                if self.parser.buffer:
+                    raise HttpParserError("Request head is incomplete.")
+                raise EOFError("Connection closed by client.")
+            self._resume_reading()
+            self._head_waiter = self._loop.create_future()
+            try:
+                head = await self._head_waiter
+            finally:
+                self._head_waiter = None
+            if head is not None:
+                return head
+
+    async def _wait_for_data(self) -> None:
+        if self._eof:
+            return
+        self._resume_reading()
+        self._data_waiter = self._loop.create_future()
+        try:
+            await self._data_waiter
+        finally:
+            self._data_waiter = None
+
+    def _resume_reading(self) -> None:
+        if self._read_paused and not self.transport.is_closing():
+            self._read_paused = False
+            self.transport.resume_reading()
+
+    async def read(self, n: int = -1) -> bytes:
+        if n == 0:
+            return b""
+        if n < 0:
+            while not self._eof:
+                await self._wait_for_data()
+        else:
+            while not self.parser.buffer and not self._eof:
+                await self._wait_for_data()
+        return self.parser.take(n)
+
+    async def readexactly(self, n: int) -> bytes:
+        while len(self.parser.buffer) < n:
+            if self._eof:
+                raise asyncio.IncompleteReadError(self.parser.take(), n)
+            await self._wait_for_data()
+        return self.parser.take(n)
 
+    async def readuntil(self, separator: bytes = b"\n") -> bytes:
+        offset = 0
+        while (index := self.parser.buffer.find(separator, offset)) == -1:
+            if self._eof:
+                raise asyncio.IncompleteReadError(self.parser.take(), None)
+            if len(self.parser.buffer) > self.read_buffer_size:
+                raise asyncio.LimitOverrunError("Separator is not found, and chunk exceed the limit", offset)
+            offset = max(0, len(self.parser.buffer) - len(separator) + 1)
+            await self._wait_for_data()
+        return self.parser.take(index + len(separator))
+
+    async def readline(self) -> bytes:
+        try:
+            return await self.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+
+    def at_eof(self) -> bool:
+        return self._eof and not self.parser.buffer
+
+    # Writer side
+
+    def start_response(self) -> int:
+        self.status = None
+        return self.bytes_sent
+
+    def write(self, data: bytes) -> None:
+        if self.status is None:
+            self.status = response_status(data)
+        self.bytes_sent += len(data)
+        if not self._write_buffer and len(data) >= self.write_buffer_size:
+            self.transport.write(data)
+            return
+        self._write_buffer += data
+        if len(self._write_buffer) >= self.write_buffer_size:
+            self._flush()
+
+    def writelines(self, data) -> None:
+        for chunk in data:
+            self.write(chunk)
+
+    def _flush(self) -> None:
+        if not self._write_buffer:
+            return
+        if self.transport.is_closing():
+            self._write_buffer.clear()
+            return
+        # Hand the buffer over instead of copying it: the transport may hold on to it.
+        data, self._write_buffer = self._write_buffer, bytearray()
+        self.transport.write(data)
+
+    async def drain(self) -> None:
+        self._flush()
+        if self._closed.done():
+            raise ConnectionResetError("Connection lost")
+        if self._write_paused:
+            self._drain_waiter = self._loop.create_future()
+            try:
+                await self._drain_waiter
+            finally:
+                self._drain_waiter = None
+
+    def is_closing(self) -> bool:
+        return self.transport.is_closing()
+
+    def close(self) -> None:
+        self._flush()
+        self.transport.close()
+
+    async def wait_closed(self) -> None:
+        await self._closed
+
+    def get_extra_info(self, name: str, default=None):
+        return self.transport.get_extra_info(name, default)
+
+######################################################################################
+
+def source_fingerprint() -> list:
+    """
+    Hashes of the package's Python sources, used to detect code changes.
+    """
     parentdir = Path(__file__).parent
+    hashes = []
+    for entry in sorted(parentdir.glob("*.py")):
+        with open(str(entry), 'rb') as fd:
+            hashes.append(hashlib.sha1(fd.read()).hexdigest())
+    return hashes
 
-    pyfiles = [open(str(entry), 'rb') for entry in parentdir.glob("*.py")]
-    hashes = [hashlib.sha1(fd.read()).hexdigest() for fd in pyfiles]
-    for fd in pyfiles:
-        fd.close()
+def fs_monitor(on_change: Callable = None):
+    """
+    Watch the package sources. On change, call `on_change` or, by default,
+    restart the whole process in place.
+    """
+    hashes = source_fingerprint()
 
     while True:
         time.sleep(1)
-        newpyfiles = [open(str(entry), 'rb') for entry in parentdir.glob("*.py")]
-        if len(newpyfiles) != len(pyfiles):
-            for fd in newpyfiles:
-                fd.close()
-            print(f"File count changed. Signaling server restart")
-            time.sleep(0.5)  # Optional debounce
-            os.execv(os.sys.executable, [os.sys.executable] + os.sys.argv)            # os.kill(os.getpid(), signal.SIGUSR1)
-            # os.kill(os.getpid(), signal.SIGUSR1)
-            # return
-        newhashes = [hashlib.sha1(fd.read()).hexdigest() for fd in newpyfiles]
-        for fd in newpyfiles:
-            fd.close()
+        newhashes = source_fingerprint()
         if newhashes != hashes:
-            print(f"File hashes changed. Signaling server restart")
+            log.info("Source files changed. Signaling server restart")
             time.sleep(0.5)  # Optional debounce
-            os.execv(os.sys.executable, [os.sys.executable] + os.sys.argv)            # os.kill(os.getpid(), signal.SIGUSR1)
-            # os.kill(os.getpid(), signal.SIGUSR1)
-            # return
+            if on_change is None:
+                os.execv(os.sys.executable, [os.sys.executable] + os.sys.argv)
+            hashes = source_fingerprint()
+            on_change()
 
 ######################################################################################
 
+class WorkerSupervisor:
+    """
+    Keeps `workers` server processes listening on the same port (SO_REUSEPORT),
+    restarts the ones that die, and replaces them one by one on reload.
+
+    Workers are fresh interpreters started with the supervisor's own command line,
+    so a reload picks up changed code. SIGTERM/SIGINT drain the workers and stop,
+    SIGHUP (or a change in the sources) triggers a rolling restart.
+    """
+
+    boot_timeout = 10
+    respawn_delay = 1
+
+    def __init__(self, workers: int, port: int = oxi_port, host: str = oxi_host, watch: bool = True):
+        self.workers = workers
+        self.port = port
+        self.host = host
+        self.watch = watch
+        self.children: dict = {}
+        self.retired: list = []
+        self.stopping = False
+        self.reload_requested = False
+
+    def worker_command(self, ready_fd: int) -> list:
+        argv = getattr(sys, "orig_argv", None) or [sys.executable] + sys.argv
+        return [*argv, "--worker", "--ready-fd", str(ready_fd)]
+
+    def spawn(self) -> int:
+        """
+        Start a worker and wait until it is accepting connections.
+        Returns its pid, or None if it didn't come up.
+        """
+        ready_r, ready_w = os.pipe()
+        try:
+            process = subprocess.Popen(self.worker_command(ready_w), pass_fds=(ready_w,), 
+                                       stdin=subprocess.DEVNULL)
+        finally:
+            os.close(ready_w)
+        try:
+            ready, _, _ = select.select([ready_r], [], [], self.boot_timeout)
+            started = bool(ready) and os.read(ready_r, 1) == b"1"
+        finally:
+            os.close(ready_r)
+        if not started:
+            log.error("Worker %s failed to start.", process.pid)
+            process.kill()
+            process.wait()
+            return None
+        self.children[process.pid] = process
+        log.info("Worker %s ready.", process.pid)
+        return process.pid
+
+    def retire(self, pid: int) -> None:
+        process = self.children.pop(pid, None)
+        if process and process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            self.retired.append(process)
+
+    def reload(self) -> None:
+        """
+        Rolling restart: each worker is retired only once its replacement is serving,
+        so in-flight connections finish on the old one and nothing is refused.
+        """
+        log.info("Reloading workers...")
+        for pid in list(self.children):
+            if self.stopping:
+                return
+            if self.spawn() is None:
+                log.warning("Replacement worker failed, keeping the current ones.")
+                return
+            self.retire(pid)
+
+    def reap(self) -> None:
+        self.retired = [process for process in self.retired if process.poll() is None]
+        for pid, process in list(self.children.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del self.children[pid]
+            if not self.stopping:
+                log.warning("Worker %s exited with code %s. Restarting it.", pid, code)
+        while not self.stopping and len(self.children) < self.workers:
+            if self.spawn() is None:
+                time.sleep(self.respawn_delay)
+                break
+
+    def shutdown(self) -> None:
+        processes = [*self.children.values(), *self.retired]
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + Config.get('graceful_timeout', 10) + self.boot_timeout
+        for process in processes:
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                log.warning("Worker %s did not stop in time. Killing it.", process.pid)
+                process.kill()
+                process.wait()
+        self.children.clear()
+        self.retired = []
+
+    def run(self) -> None:
+        def _stop(signum, frame):
+            self.stopping = True
+
+        def _reload(signum=None, frame=None):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGINT, _stop)
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGHUP, _reload)
+
+        with no_ctrlc_echo():
+            subprocess.run("clear")
+            log.info("\n Oxi supervisor (PID %s) starting %s workers at %s:%s\n", os.getpid(), self.workers, self.host, self.port)
+            if self.watch:
+                Thread(target=fs_monitor, kwargs={'on_change': _reload}, daemon=True).start()
+            self.reap()
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                self.reap()
+                time.sleep(0.2)
+            log.info("\nSignal received. Stopping workers...")
+            self.shutdown()
+            log.info("Oxi supervisor shut down cleanly.")
+
+######################################################################################
+
+event_loops = ('asyncio', 'uvloop', 'auto')
+
+def install_event_loop(choice: str = 'asyncio') -> str:
+    """
+    Set up the event loop the next asyncio.run() will create: 'asyncio', 'uvloop',
+    or 'auto' (uvloop when it is installed). Returns the loop actually chosen, falling
+    back to asyncio when uvloop is missing or unsupported.
+    uvloop has no loop.sendfile(): file bodies then go out by reads in fs_executor
+    instead of zero-copy, which is why it is opt-in.
+    """
+    if choice not in event_loops:
+        raise ValueError(f"Unknown event loop '{choice}'. Use one of {', '.join(event_loops)}.")
+    if choice != 'asyncio' and not is_windows():
+        try:
+            import uvloop
+        except ImportError:
+            if choice == 'uvloop':
+                log.warning("uvloop is not installed. Falling back to the asyncio event loop.")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return 'uvloop'
+    elif choice == 'uvloop':
+        log.warning("uvloop is not supported on Windows. Falling back to the asyncio event loop.")
+    asyncio.set_event_loop_policy(None)
+    return 'asyncio'
+
+def event_loop_name(loop: asyncio.AbstractEventLoop) -> str:
+    return type(loop).__module__.split('.')[0]
+
 async def run_dev_server(protocol: Callable = ProtocolFactory(), 
                          host:str=oxi_host, port:int=oxi_port, 
-                         unix_socket:str=None) -> None:
+                         unix_socket:str=None, clear_screen: bool = True,
+                         on_ready: Callable = None, server_mode: str = None) -> None:
+    """
+    Serve `protocol` until SIGINT/SIGTERM/SIGHUP.
+    `server_mode` picks the connection front end: 'stream' runs `protocol` as a
+    `start_server` callback, 'protocol' wraps each connection in an HttpConnection.
+    Defaults to Config['server_mode'].
+    """
+    server_mode = server_mode or Config.get('server_mode', 'stream')
+    if server_mode not in ('stream', 'protocol'):
+        raise ValueError(f"Unknown server mode '{server_mode}'. Use 'stream' or 'protocol'.")
+    if server_mode == 'protocol' and not isinstance(protocol, ProtocolFactory):
+        raise ValueError("The 'protocol' server mode needs a ProtocolFactory.")
     
-    subprocess.run("clear")
+    if clear_screen:
+        subprocess.run("clear")
 
     with no_ctrlc_echo():
         stop_event = asyncio.Event()
         loop = asyncio.get_running_loop()
 
         def _signal_handler():
-            print("\nSignal received. Shutting down...")
+            log.info("\nSignal received. Shutting down (PID %s)...", os.getpid())
             stop_event.set()
 
     
         loop.add_signal_handler(signal.SIGINT, _signal_handler)
         loop.add_signal_handler(signal.SIGTERM, _signal_handler)
+        loop.add_signal_handler(signal.SIGHUP, _signal_handler)
         
         server = None
-        if unix_socket:
-            if os.path.exists(unix_socket):
-                os.remove(unix_socket)
-            server = await asyncio.start_unix_server(protocol, path=unix_socket, loop=loop)
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        if server_mode == 'protocol':
+            connection_factory = lambda: HttpConnection(protocol)
+            if unix_socket:
+                server = await loop.create_unix_server(connection_factory, path=unix_socket)
+            else:
+                server = await loop.create_server(connection_factory, host, port, reuse_address=True, reuse_port=True)
+        elif unix_socket:
+            server = await asyncio.start_unix_server(protocol, path=unix_socket, limit=Config['max_head_size'])
         else:
-            server = await asyncio.start_server(protocol, host, port, reuse_address=True, reuse_port=True)
+            server = await asyncio.start_server(protocol, host, port, reuse_address=True, reuse_port=True, 
+                                                limit=Config['max_head_size'])
 
         server_task = asyncio.create_task(server.serve_forever())
 
+        details = f"PID {os.getpid()}, {server_mode} mode, {event_loop_name(loop)} loop"
         if unix_socket:
-            print(f"\n Oxi Server running at {unix_socket}\n")
+            log.info("\n Oxi Server running at %s (%s)\n", unix_socket, details)
         else:
-            print(f"\n Oxi Server running at {host}:{port}\n")
+            log.info("\n Oxi Server running at %s:%s (%s)\n", host, port, details)
+        if on_ready is not None:
+            on_ready()
 
         # Wait for shutdown signal
         await stop_event.wait()
-        print("Stopping Oxi server...")
+        log.info("Stopping Oxi server...")
 
-        # Cleanup
+        # Cleanup: stop accepting, then let in-flight requests finish.
         server.close()
+        if hasattr(protocol, 'drain'):
+            await protocol.drain()
         await server.wait_closed()
         server_task.cancel()
 
@@ -761,26 +1663,71 @@ async def run_dev_server(protocol: Callable = ProtocolFactory(),
         except asyncio.CancelledError:
             pass
 
-        print("Oxi Server shut down cleanly.")
+        log.info("Oxi Server shut down cleanly.")
 
-async def runner(port: int = oxi_port, host: str = oxi_host) -> None:
+async def runner(port: int = oxi_port, host: str = oxi_host, **kwargs) -> None:
     # protocol = ProtocolFactory()
     # protocol.allow_dirlisting = False
     # await run_dev_server(protocol, host=oxi_host, port=oxi_port)
-    await run_dev_server(host=host, port=port) # Uses ProtocolFactory() by default
+    await run_dev_server(host=host, port=port, **kwargs) # Uses ProtocolFactory() by default
 
 def main():
+    parser = argparse.ArgumentParser(description='Command line arguments for Oxi server', prog='oxi')
+    parser.add_argument('-V', '--version', action='version', version=f"{parser.prog} v {oxi_version}", help=f"Shows {parser.prog} version and exits.")
+    parser.add_argument('port', type=str, nargs='?', default=str(oxi_port), help=f"Port to listen on. Defaults to {oxi_port}.")
+    parser.add_argument('--host', type=str, default=oxi_host, help=f"Address to bind to. Defaults to {oxi_host}.")
+    parser.add_argument('-w', '--workers', type=int, default=Config.get('workers', 1), 
+                        help="Number of worker processes sharing the port. Defaults to 1 (no supervisor).")
+    parser.add_argument('-m', '--mode', choices=['stream', 'protocol'], default=Config.get('server_mode', 'stream'),
+                        help="Connection handling: asyncio streams or the buffered asyncio.Protocol. Defaults to stream.")
+    parser.add_argument('--loop', choices=event_loops, default=Config.get('event_loop', 'asyncio'),
+                        help="Event loop implementation. 'auto' uses uvloop when installed, at the cost of "
+                             "zero-copy file sends. Defaults to asyncio.")
+    parser.add_argument('--log-level', choices=list(levels), default=Config.get('log_level', 'info'),
+                        help="Least severe server message shown. 'silent' also turns off the access log. Defaults to info.")
+    parser.add_argument('-s', '--silent', action='store_const', const='silent', dest='log_level',
+                        help="No output at all. Same as --log-level silent.")
+    parser.add_argument('--access-log', type=str, default=Config.get('access_log', '-'),
+                        help="Access log file ('-' for stdout, 'off' for none). Relative paths go in the log directory.")
+    parser.add_argument('--log-format', choices=formats, default=Config.get('access_log_format', 'common'),
+                        help="Access log format. Defaults to common.")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    Config['log_level'] = args.log_level
+    Config['access_log'] = None if args.access_log == 'off' else args.access_log
+    Config['access_log_format'] = args.log_format
+    log.configure(Config['access_log'], Config['access_log_format'], Config['log_level'], Config['log_dir'])
+    port = oxi_port
+    try:
+        port = int(args.port)
+    except ValueError:
+        log.warning("Invalid port number '%s'. Using default port %s.", args.port, oxi_port)
+
+    # Must happen before asyncio.run() creates the loop. Workers get the same --loop.
+    install_event_loop(args.loop)
+
+    if args.worker:
+        # Spawned by a WorkerSupervisor: no screen clearing, no file watching.
+        def notify_ready():
+            if args.ready_fd is not None:
+                os.write(args.ready_fd, b"1")
+                os.close(args.ready_fd)
+        return asyncio.run(runner(port=port, host=args.host, clear_screen=False, on_ready=notify_ready,
+                                  server_mode=args.mode))
+
+    if args.workers > 1:
+        if is_windows():
+            log.warning("Worker processes are not supported on Windows. Running a single server.")
+        else:
+            return WorkerSupervisor(args.workers, port=port, host=args.host).run()
+
     # Start the file system monitor in a separate thread
     fs_monitor_thread = Thread(target=fs_monitor, daemon=True)
     fs_monitor_thread.start()
     # Run the server
-    port = oxi_port
-    if len(sys.argv) > 1:
-        try:
-            port = int(sys.argv[1])
-        except ValueError:
-            print(f"Invalid port number '{sys.argv[1]}'. Using default port {oxi_port}.")
-    asyncio.run(runner(port=port, host=oxi_host ))
+    asyncio.run(runner(port=port, host=args.host, server_mode=args.mode))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,14 +1,12 @@
 #! -*- coding: utf_8 -*-
 
-import enum, random, os, re, json, inspect, asyncio
-from io import StringIO
+import enum, random, os, re, sys, json, inspect, asyncio, hashlib, marshal, argparse
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 from html.parser import HTMLParser
 
 from . import __version__ as oxi_version
-from .utils import SmartDict, aopen, dual_mode
-from .server import OxiProtocol
+from .utils import SmartDict, LRUCache, aopen, dual_mode
+from .config import Config
 
 oxi_version
        
@@ -322,22 +320,117 @@ class CodeBuilder:
     def __str__(self):
         return "".join(str(c) for c in self.code)
 
-    def get_globals(self):
-        """Execute the code, and return a dict of globals it defines."""
+    def get_code(self, filename="<template>"):
+        """Compile the code, and return the code object."""
         # A check that the caller really finished all the blocks they started.
         assert self.indent_level == 0
-        # Get the Python source as a single string.
-        python_source = str(self)
-        # Execute the source, defining globals, and return them.
+        return compile(str(self), filename, "exec")
+
+    def get_globals(self):
+        """Execute the code, and return a dict of globals it defines."""
+        # Execute the compiled source, defining globals, and return them.
         global_namespace = {}
-        exec(python_source, global_namespace)
+        exec(self.get_code(), global_namespace)
         return global_namespace
 
 
+class TemplateBytecodeCache:
+    """
+    Render functions compiled before, as marshalled code objects in `directory`,
+    one file per template named after a hash of its (preprocessed) text, the oxi
+    version and the Python version. Files are read when a template is first compiled.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.loaded = 0
+        self.saved = 0
+
+    def path(self, text: str, kind: str = 'render') -> str:
+        tag = f"{oxi_version}\0{sys.implementation.cache_tag}\0{kind}\0{text}"
+        return os.path.join(self.directory, hashlib.sha1(tag.encode('utf-8')).hexdigest() + ".oxc")
+
+    def load(self, text: str, kind: str = 'render'):
+        """
+        Blocking. The (code object, size) stored for `text` and `kind` of render function, or None.
+        """
+        try:
+            with open(self.path(text, kind), 'rb') as fd:
+                data = fd.read()
+            code = marshal.loads(data)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        self.loaded += 1
+        return code, len(data)
+
+    def save(self, text: str, code, kind: str = 'render') -> None:
+        """
+        Blocking. Store `code` for `text` and `kind`. The file appears atomically or not at all;
+        failing to write it only costs a compile next time.
+        """
+        path = self.path(text, kind)
+        temp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, 'wb') as fd:
+                marshal.dump(code, fd)
+            os.replace(temp, path)
+            self.saved += 1
+        except OSError:
+            pass
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def stats(self) -> dict:
+        return {'directory': self.directory, 'loaded': self.loaded, 'saved': self.saved}
+
+
 class TemplateSyntaxError(BaseException):
     pass
 
 
+class DottedAccess:
+    """One `a.b.c` call site of a compiled template: a.b.c is DottedAccess(('b', 'c'))(a).
+    Same lookups as TemplateLight._do_dots: an attribute if there is one, else a key
+    or a list index. Where a segment turned out to be a key or an index of a plain
+    dict, list or tuple (which can't grow attributes), the site remembers the type and
+    the key, and goes straight to value[key] while it keeps seeing that type, instead
+    of trying getattr and catching AttributeError every time.
+    """
+
+    __slots__ = ('dots', 'caches')
+
+    def __init__(self, dots):
+        self.dots = dots
+        # Per segment: None, or (type, key) as one tuple, replaced whole.
+        self.caches = [None] * len(dots)
+
+    def _lookup(self, value, dot):
+        if isinstance(value, (list, tuple)) and dot.isnumeric():
+            key = int(dot)
+        else:
+            key = dot
+        result = value[key]
+        if type(value) in (dict, list, tuple):
+            # A segment repeated in the path shares the entry: same dot, same type, same key.
+            self.caches[self.dots.index(dot)] = (type(value), key)
+        return result
+
+    def __call__(self, value):
+        for dot, cache in zip(self.dots, self.caches):
+            if cache is not None and type(value) is cache[0]:
+                value = value[cache[1]]
+            else:
+                try:
+                    value = getattr(value, dot)
+                except AttributeError:
+                    value = self._lookup(value, dot)
+            if callable(value):
+                value = value()
+        return value
+
+
 class TemplateLight:
 
     test_tpl = """
@@ -364,9 +457,45 @@ class TemplateLight:
         self.context.update(contexts)
         self.all_vars = set()
         self.loop_vars = set()
-
+        self._code = None
+        self._render_function, self._code_size = self._build()
+        # The generator version, made on the first render_stream().
+        self._stream_function = None
+
+    def _build(self, stream=False):
+        """Make the render function, from the bytecode cache or by generating its code.
+        Returns the function and the size of its code.
+        """
+        text = self._template_text
+        kind = ('stream' if stream else 'render') + ('-inline' if self.inline_dots else '')
+        cached = self.bytecode_cache.load(text, kind) if self.bytecode_cache is not None else None
+        if cached is None:
+            code = self._generate(text, stream)
+            bytecode = code.get_code()
+            size = len(str(code))
+            if self.bytecode_cache is not None:
+                self.bytecode_cache.save(text, bytecode, kind)
+            if not stream:
+                self._code = code
+        else:
+            bytecode, size = cached
+        global_namespace = {'DottedAccess': DottedAccess}
+        exec(bytecode, global_namespace)
+        return global_namespace['render_function'], size
+
+    def _generate(self, text, stream=False):
+        """Generate the source of the render function for `text`, in a CodeBuilder.
+        With `stream`, it is a generator yielding the output every `chunk_items`
+        fragments or so, at the points where buffered output is flushed.
+        """
         code = CodeBuilder()
-        code.add_line("def render_function(context, do_dots):")
+        # With inline_dots, the DottedAccess objects of the dotted expressions, one per call site.
+        self._dots_code = code.add_section()
+        self._dots_sites = 0
+        if stream:
+            code.add_line("def render_function(context, do_dots, chunk_items):")
+        else:
+            code.add_line("def render_function(context, do_dots):")
         code.indent()
         vars_code = code.add_section()
         code.add_line("result = []")
@@ -382,6 +511,12 @@ class TemplateLight:
                 code.add_line("append_result(%s)" % buffered[0])
             elif len(buffered) > 1:
                 code.add_line("extend_result([%s])" % ", ".join(buffered))
+            if stream and buffered:
+                code.add_line("if len(result) >= chunk_items:")
+                code.indent()
+                code.add_line("yield ''.join(result)")
+                code.add_line("result.clear()")
+                code.dedent()
             del buffered[:]
 
         ops_stack = []
@@ -480,11 +615,22 @@ class TemplateLight:
         for var_name in self.all_vars - self.loop_vars:
             vars_code.add_line("c_%s = context[%r]" % (var_name, var_name))
 
-        code.add_line("return ''.join(result)")
+        if stream:
+            code.add_line("if result:")
+            code.indent()
+            code.add_line("yield ''.join(result)")
+            code.dedent()
+        else:
+            code.add_line("return ''.join(result)")
         code.dedent()
+        return code
 
-        self._code = code
-        self._render_function = code.get_globals()['render_function']
+    @property
+    def memory(self) -> int:
+        """
+        Rough size of the template in memory: its text and generated code, charged against the cache budget.
+        """
+        return 2 * (len(self._template_text) + self._code_size)
 
     @staticmethod
     def _is_string(name):
@@ -535,7 +681,13 @@ class TemplateLight:
             dots = expr.split(".")
             code = self._expr_code(dots[0])
             args = ", ".join(repr(d) for d in dots[1:])
-            code = "do_dots(%s, %s)" % (code, args)
+            if self.inline_dots:
+                site = "dots_%d" % self._dots_sites
+                self._dots_sites += 1
+                self._dots_code.add_line("%s = DottedAccess((%s,))" % (site, args))
+                code = "%s(%s)" % (site, code)
+            else:
+                code = "do_dots(%s, %s)" % (code, args)
         else:
             subexprs = expr.split()
             code = ""
@@ -584,22 +736,54 @@ class TemplateLight:
         if context:
             render_context.update(context)
         return self._render_function(render_context, self._do_dots)
-    
+
+    def render_stream(self, **context):
+        """Render this template by applying it to `context`, as a generator of
+        string chunks made while rendering: the whole output is never held at once.
+        """
+        if self._stream_function is None:
+            self._stream_function, _ = self._build(stream=True)
+        render_context = dict(self.context)
+        if context:
+            render_context.update(context)
+        return self._stream_function(render_context, self._do_dots, self.stream_chunk_items)
+
+    async def render_stream_async(self, **context):
+        """Async iterator over the chunks of render_stream, letting the event loop
+        run between chunks. Fit to feed a chunked response as it renders.
+        """
+        for chunk in self.render_stream(**context):
+            yield chunk
+            await asyncio.sleep(0)
+
+    # Output fragments gathered before render_stream yields a chunk.
+    stream_chunk_items = 256
+
     template_filters = {}
 
+    # A TemplateBytecodeCache, when Config['template_bytecode_dir'] names one.
+    bytecode_cache = None
+
+    # Compile dotted expressions to DottedAccess call sites instead of do_dots calls.
+    inline_dots = Config.get('template_inline_dots', True)
+
 TemplateLight.template_filters['title'] = str.title
 TemplateLight.template_filters['capitalize'] = str.capitalize
 TemplateLight.template_filters['upper'] = str.upper
 TemplateLight.template_filters['lower'] = str.lower 
 TemplateLight.template_filters['toJson'] = lambda x: json.dumps(x, ensure_ascii=False)
 
+if Config.get('template_bytecode_dir'):
+    TemplateLight.bytecode_cache = TemplateBytecodeCache(
+        os.path.join(os.getcwd(), Config['template_bytecode_dir']))
+
 def get_template_dir():
-    templates_root = OxiProtocol.config.get(
-        'template-dir', 'templates')
+    templates_root = Config.get(
+        'template_dir', 'templates')
     return os.path.join(os.getcwd(), templates_root)
 
-def get_template_fullpath(template_file):
-    return os.path.join(get_template_dir(), template_file)
+def get_template_fullpath(template_file, template_dir=None):
+    return os.path.join(template_dir or get_template_dir(), template_file)
 
 def _load_template_sync(template_filename):
     path = get_template_fullpath(template_filename)
@@ -614,57 +798,286 @@ def load_template(template_filename):
 async def load_template_async(template_filename):
     return await asyncio.to_thread(load_template, template_filename)
     
-def preprocess_template(tpl_str=TemplateLight.test_tpl):
-    ftpl = StringIO(tpl_str)
-    lines = ftpl.readlines()
-    ftpl.close()
-    for index, line in enumerate(lines):
-        stripline = line.strip()
-        # m = re.match(r"^\{\#include\s+(?P<inc_file>.+?)\s+\#\}$", stripline)
-        if stripline.startswith('{#include') and stripline.endswith("#}"):
-            # m = re.match(r"^(.+?)\s+(.+?)\s+(\#\})$", stripline)
-            m = re.split(r"\s+", stripline)
-            if m:
-                # inc_file = m.groupdict().get("inc_file")
-                # inc_file = m.groups()[1]
-                inc_file = m[1]
-                if not inc_file:
-                    raise TemplateSyntaxError(
-                        "Include directiva must refer to a file")
-                fullpath = get_template_fullpath(
-                    inc_file.replace("\"", "").replace("'", ""))
-                if os.path.exists(fullpath) and os.path.isfile(fullpath):
-                    fp = open(fullpath)
-                    new_tpl_str = fp.read()
-                    fp.close()
-                    replace_line = preprocess_template(
-                        new_tpl_str)
-                    lines[index] = replace_line
-            else:
-                raise TemplateSyntaxError(
-                    "Included file {0} in line {1} does not exist.".format(inc_file, index))
-    return "".join(lines)
+# Compile time tags, resolved before a template reaches TemplateLight.
+include_tag = re.compile(r"""\{[#%]\s*include\s+['"]?(?P<name>[^'"\s#%]+)['"]?\s*[#%]\}""")
+extends_tag = re.compile(r"""\{%\s*extends\s+['"]?(?P<name>[^'"\s%]+)['"]?\s*%\}""")
+block_tag = re.compile(r"\{%\s*(?:block\s+(?P<name>\w+)|endblock(?:\s+\w+)?)\s*%\}")
+
+def template_stamp(path: str):
+    """
+    (mtime_ns, size) of `path`, None if it doesn't exist.
+    """
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def read_template_file(template_filename, dependencies: dict, template_dir=None):
+    """
+    The text of a template file, or None if there is no such file. Its stamp goes
+    into `dependencies` either way: a file that appears later counts as a change.
+    """
+    path = get_template_fullpath(template_filename, template_dir)
+    dependencies[path] = template_stamp(path)
+    if dependencies[path] is None or not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as fp:
+        return fp.read()
+
+def parse_blocks(text):
+    """
+    `text` split into literal strings and (name, inner text, pieces) blocks, nested as written.
+    """
+    root = []
+    stack = [(None, 0, root)]
+    position = 0
+    for match in block_tag.finditer(text):
+        stack[-1][2].append(text[position:match.start()])
+        position = match.end()
+        if match.group('name'):
+            stack.append((match.group('name'), position, []))
+        else:
+            if len(stack) == 1:
+                raise TemplateSyntaxError("'endblock' without previous 'block'")
+            name, start, pieces = stack.pop()
+            stack[-1][2].append((name, text[start:match.start()], pieces))
+    if len(stack) > 1:
+        raise TemplateSyntaxError("Unclosed block: %r" % stack[-1][0])
+    root.append(text[position:])
+    return root
+
+def template_blocks(pieces, blocks: dict = None) -> dict:
+    """
+    Inner text of every block in `pieces`, nested ones included, by name. First definition wins.
+    """
+    blocks = {} if blocks is None else blocks
+    for piece in pieces:
+        if not isinstance(piece, str):
+            blocks.setdefault(piece[0], piece[1])
+            template_blocks(piece[2], blocks)
+    return blocks
+
+def fill_blocks(pieces, overrides: dict) -> str:
+    """
+    `pieces` back into text, block tags dropped, blocks named in `overrides` replaced.
+    """
+    text = []
+    for piece in pieces:
+        if isinstance(piece, str):
+            text.append(piece)
+        elif piece[0] in overrides:
+            inner = {name: content for name, content in overrides.items() if name != piece[0]}
+            text.append(fill_blocks(parse_blocks(overrides[piece[0]]), inner))
+        else:
+            text.append(fill_blocks(piece[2], overrides))
+    return "".join(text)
+
+def preprocess_template(tpl_str=TemplateLight.test_tpl, dependencies: dict = None, chain: tuple = (),
+                        template_dir=None):
+    """
+    Resolve the compile time tags of `tpl_str` into one flat template: includes
+    ({% include file %} or {#include file #}) are replaced by the file, and
+    {% extends file %} makes the text that file, with its {% block name %}s
+    overridden by the blocks of the same name given here. Every template file
+    read is stamped in `dependencies`. `chain` holds the files being resolved.
+    File names are relative to `template_dir`, by default the configured one.
+    """
+    dependencies = {} if dependencies is None else dependencies
+
+    def include(match):
+        name = match.group('name')
+        if name in chain:
+            raise TemplateSyntaxError("Template includes itself: %r" % name)
+        included = read_template_file(name, dependencies, template_dir)
+        if included is None:
+            # Missing files render as nothing, like the comment the old syntax is.
+            return ""
+        return preprocess_template(included, dependencies, chain + (name,), template_dir)
+
+    text = include_tag.sub(include, tpl_str)
+    overrides = {}
+    while True:
+        match = extends_tag.search(text)
+        if not match:
+            break
+        name = match.group('name')
+        if name in chain:
+            raise TemplateSyntaxError("Template extends itself: %r" % name)
+        chain += (name,)
+        # The most derived template's blocks win.
+        for block_name, content in template_blocks(parse_blocks(text)).items():
+            overrides.setdefault(block_name, content)
+        parent = read_template_file(name, dependencies, template_dir)
+        if parent is None:
+            raise TemplateSyntaxError("Extended template does not exist: %r" % name)
+        text = include_tag.sub(include, parent)
+    return fill_blocks(parse_blocks(text), overrides)
+
+class TemplateGraph:
+    """
+    Which template files each compiled template was made from. `dependencies[key]`
+    holds the {path: stamp} the template cached under `key` was compiled with, and
+    `dependents[path]` the keys of the templates that read `path`.
+    """
+
+    def __init__(self):
+        self.dependencies = {}
+        self.dependents = {}
+
+    def add(self, key, dependencies: dict) -> None:
+        self.forget(key)
+        self.dependencies[key] = dependencies
+        for path in dependencies:
+            self.dependents.setdefault(path, set()).add(key)
+
+    def forget(self, key) -> None:
+        for path in self.dependencies.pop(key, ()):
+            keys = self.dependents.get(path)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.dependents[path]
+
+    def changed(self, key) -> bool:
+        """
+        Blocking. Whether any file the template under `key` was made from has changed since.
+        """
+        dependencies = self.dependencies.get(key)
+        if dependencies is None:
+            return True
+        return any(template_stamp(path) != stamp for path, stamp in dependencies.items())
+
+    def invalidate(self, path: str) -> list:
+        """
+        Drop every compiled template made from `path`. Returns their keys.
+        """
+        keys = list(self.dependents.get(os.path.abspath(path), ()))
+        for key in keys:
+            template_cache.pop(key)
+            self.forget(key)
+        return keys
+
+# Compiled templates, keyed by template file path or by a hash of the template
+# source, and by the filters they were compiled with. The graph forgets what the
+# cache evicts.
+template_graph = TemplateGraph()
+template_cache = LRUCache(Config.get('template_cache_size', 8 * 1024 * 1024),
+                          on_evict=lambda key, compiled: template_graph.forget(key))
+
+def template_cache_stats() -> dict:
+    return template_cache.stats()
+
+def invalidate_template(template_filename) -> list:
+    """
+    Drop the compiled templates using `template_filename`, itself or as a base or partial.
+    """
+    return template_graph.invalidate(get_template_fullpath(template_filename))
 
 def compile_template(tpl_str=TemplateLight.test_tpl):
+    """
+    The TemplateLight for `tpl_str`, a template file name or the template source itself,
+    from the cache if it was compiled before. It is compiled again once any template
+    file it was made from (itself, a base template, a partial) changes.
+    """
     if not tpl_str:
         return None
+    filters = frozenset(TemplateLight.template_filters.items())
     words = tpl_str.split()
-    if len(words) == 1:
-        fullpath = get_template_fullpath(tpl_str)
-        if os.path.exists(fullpath) and os.path.isfile(fullpath):
-            # fp = open(fullpath)
-            # tpl_str = fp.read()
-            # fp.close()
-            tpl_str = load_template(tpl_str)
+    fullpath = get_template_fullpath(tpl_str) if len(words) == 1 else None
+    if fullpath is not None and os.path.isfile(fullpath):
+        key = ('file', fullpath, filters)
+    else:
+        key = ('source', hashlib.sha1(tpl_str.encode('utf-8')).digest(), filters)
+    compiled = template_cache.get(key)
+    if compiled is not None and not template_graph.changed(key):
+        return compiled
+    dependencies = {}
+    chain = ()
+    if key[0] == 'file':
+        tpl_str, chain = read_template_file(tpl_str, dependencies), (tpl_str,)
+        if tpl_str is None:
+            return None
+    compiled = TemplateLight(preprocess_template(tpl_str, dependencies, chain),
+                             **TemplateLight.template_filters)
+    if template_cache.put(key, compiled, compiled.memory):
+        template_graph.add(key, dependencies)
+    else:
+        template_graph.forget(key)
+    return compiled
 
-    return TemplateLight(preprocess_template(tpl_str),
-                            **TemplateLight.template_filters)
+def precompile(template_dir: str = None, bytecode_dir: str = None) -> tuple:
+    """
+    Blocking. Compile every template under `template_dir` (by default the configured one)
+    into the bytecode cache in `bytecode_dir` (by default the configured one), so that
+    freshly started workers find them ready. Includes and base templates are looked
+    up in `template_dir` too: it should be the directory the server will use.
+    Hidden and __dunder__ directories are skipped. Returns (compiled, failed) file name lists.
+    """
+    template_dir = os.path.abspath(template_dir or get_template_dir())
+    directory = bytecode_dir or Config.get('template_bytecode_dir')
+    if not directory:
+        raise ValueError("No bytecode directory: set 'template_bytecode_dir' or give one.")
+    cache_dir = os.path.join(os.getcwd(), directory)
+    previous = TemplateLight.bytecode_cache
+    TemplateLight.bytecode_cache = TemplateBytecodeCache(cache_dir)
+    compiled, failed = [], []
+    try:
+        for folder, folders, filenames in os.walk(template_dir):
+            folders[:] = sorted(name for name in folders if not name.startswith(('.', '__'))
+                                and os.path.join(folder, name) != os.path.abspath(cache_dir))
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(folder, filename)
+                try:
+                    with open(path, "r", encoding="utf-8") as fp:
+                        TemplateLight(preprocess_template(fp.read(), template_dir=template_dir))
+                    compiled.append(path)
+                except (OSError, UnicodeDecodeError, SyntaxError, TemplateSyntaxError) as exc:
+                    failed.append(f"{path}: {exc}")
+    finally:
+        TemplateLight.bytecode_cache = previous
+    return compiled, failed
+
+def precompile_main():
+    parser = argparse.ArgumentParser(description='Compiles templates into the bytecode cache ahead of time', prog='oxi-precompile')
+    parser.add_argument('-V', '--version', action='version', version=f"{parser.prog} v {oxi_version}", help=f"Shows {parser.prog} version and exits.")
+    parser.add_argument('template_dir', type=str, nargs='?', default=None, help="Directory holding the templates. Defaults to the configured template_dir.")
+    parser.add_argument('-o', '--bytecode-dir', type=str, default=Config.get('template_bytecode_dir'),
+                        help="Directory to write the compiled templates to. Defaults to the configured template_bytecode_dir.")
+    args = parser.parse_args()
+    if not args.bytecode_dir:
+        parser.error("no bytecode directory: set 'template_bytecode_dir' in config.json or use --bytecode-dir")
+    compiled, failed = precompile(args.template_dir, args.bytecode_dir)
+    for failure in failed:
+        print(f"ERROR: {failure}")
+    print(f"{len(compiled)} templates compiled into {args.bytecode_dir}, {len(failed)} failed.")
+    if args.bytecode_dir != Config.get('template_bytecode_dir'):
+        print(f"Set 'template_bytecode_dir' to {args.bytecode_dir!r} in config.json for the server to use them.")
+    if failed:
+        raise SystemExit(1)
+
+def render_template_stream(tpl_str=TemplateLight.test_tpl, **kw):
+    """
+    Like render_template, but returns the generator of TemplateLight.render_stream.
+    """
+    if tpl_str.__class__.__name__ == "TemplateLight":
+        return tpl_str.render_stream(**kw)
+    elif tpl_str.__class__.__name__ == "str":
+        compiled = compile_template(tpl_str)
+        if compiled:
+            return compiled.render_stream(**kw)
+        else:
+            return None
+    else:
+        return None
 
 def render_template(tpl_str=TemplateLight.test_tpl, **kw):
     if tpl_str.__class__.__name__ == "TemplateLight":
         return tpl_str.render(**kw)
     elif tpl_str.__class__.__name__ == "str":
-        compiled = compile_template(preprocess_template(tpl_str))
+        compiled = compile_template(tpl_str)
         if compiled:
             return compiled.render(**kw)
         else:
@@ -682,49 +1095,29 @@ def render_template(tpl_str=TemplateLight.test_tpl, **kw):
 
 # Special templates
 
-swiss_army_knife_template = """
-{{% if full %}}
-    <{{{{parentElement}}}} class="{{{{parentClass}}}}" {{% if size %}} size="{{{{ size }}}}" {{% endif%}}>
-{{% endif %}}
-{header}
-{{% for record in records %}}
-    {{% if childElement == 'option' %}}
-        <{{{{childElement}}}} {{% if record['{idColumn}'] == {selected} %}} selected {{% endif %}} value="{{{{ record['{idColumn}'] }}}}" data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}'>
-            {{{{ record['{nameColumn}'] }}}}
-        </{{{{childElement}}}}>
-    {{% elif childElement == 'li' %}}
-        <{{{{childElement}}}} data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}'>
-            <span {{% if record['{idColumn}'] == {selected} %}} class="selected" {{% endif %}}>{{{{ record['{nameColumn}'] }}}}</span>
-        </{{{{childElement}}}}>
-    {{% elif childElement == 'tr' %}}
-        <{{{{childElement}}}} data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}' {{% if record['{idColumn}'] == {selected} %}} class="selected" {{% endif %}}>
-            {{%for key in keyz %}}
-                <{{{{grandchildElement}}}}> 
-                    {{{{ record[key] }}}}
-                </{{{{grandchildElement}}}}>
-            {{%endfor%}}
-        </{{{{childElement}}}}>
-    {{% elif childElement == 'p' %}}
-        <{{{{childElement}}}} data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}' {{% if record['{idColumn}'] == {selected} %}} class="selected" {{% endif %}}>
-            {{%for key in keyz %}}
-                <{{{{grandchildElement}}}}> 
-                    {{{{ record[key] }}}}
-                </{{{{grandchildElement}}}}>
-            {{%endfor%}}
-        </{{{{childElement}}}}>
-    {{% else %}}
-        <p data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}'>{{{{record['{nameColumn}']}}}}</p>
-    {{% endif %}}
-{{% endfor %}}
-{footer}
-
-{{% if full %}}
-    </{{{{parentElement}}}}>
-{{% endif %}}
+# Row markup of swiss_army_knife, by child element: the opening tag, then either the
+# record's name or (None) one grandchild element per column, and the mark of the
+# selected record. Any other child element gets the last layout, as <p> rows.
+swiss_army_rows = {
+    'option': ('<option{selected} value="{id}" data-id="{id}" data-json=\'{json}\'>', '{name}', ' selected'),
+    'li': ('<li data-id="{id}" data-json=\'{json}\'>', '<span{selected}>{name}</span>', ' class="selected"'),
+    'tr': ('<tr data-id="{id}" data-json=\'{json}\'{selected}>', None, ' class="selected"'),
+    'p': ('<p data-id="{id}" data-json=\'{json}\'{selected}>', None, ' class="selected"'),
+    None: ('<p data-id="{id}" data-json=\'{json}\'>', '{name}', ''),
+}
 
-"""
+# Layout defaults by parent element: child element, grandchild element, parent class.
+swiss_army_layouts = {
+    'table': ('tr', 'td', 'zebra'),
+    'div': ('p', 'span', 'panel'),
+    'ul': ('li', 'a', 'big'),
+    'select': ('option', 'span', 'big'),
+}
 
-def swiss_army_knife(records, **kwargs):
+# One encoder for every record, instead of json.dumps setting one up per call.
+to_json = json.JSONEncoder(ensure_ascii=False).encode
+
+def swiss_army_options(records, **kwargs) -> SmartDict:
     options = SmartDict({
         'parentElement': 'select',
         'childElement': 'option',
@@ -738,61 +1131,91 @@ def swiss_army_knife(records, **kwargs):
         'full': True,
         'parentClass': '',
         'emptyMsg': 'No records found.',
-        'selected': 0,
-        'size': None
+        'size': None,
+        'indent': '  ',
+        'rows_per_chunk': 500,
     })
     options.update(kwargs)
     if not len(records):
-        return f"""
-        <p class='{options.parentClass}'>{options.emptyMsg}</p>
-        """
-    options.keyz = records[0].keys()
+        return options
+    options.keyz = list(records[0].keys())
     options.headers = [key.title() for key in options.keyz]
-    
-    if options.parentElement.lower() == 'table':
-        options.childElement = 'tr'
-        options.grandchildElement = 'td'
-        options.parentClass = options.parentClass or 'zebra'
-        options.header = f"""
-        <thead>
-        <tr>
-        {'<th>' + '</th><th>'.join(options.headers) + '</th>'}
-        </tr>
-        </thead>
-        <tbody>
-        """
-        options.footer = '</tbody>'
-    elif options.parentElement.lower() == 'div':
-        options.childElement = 'p'
-        options.grandchildElement = 'span'
-        options.parentClass = options.parentClass or 'panel'
-    elif options.parentElement.lower() == 'ul':
-        options.childElement = 'li'
-        options.grandchildElement = 'a'
-        options.parentClass = options.parentClass or 'big'
-    elif options.parentElement.lower() == 'select':
-        options.childElement = 'option'
-        options.grandchildElement = 'span'
-        options.parentClass = options.parentClass or 'big'
-
+    layout = swiss_army_layouts.get(options.parentElement.lower())
+    if layout:
+        options.childElement, options.grandchildElement, parent_class = layout
+        options.parentClass = options.parentClass or parent_class
     if options.nameColumn not in options.keyz:
-        listkeyz = list(options.keyz)
-        if len(listkeyz) > 1:
-            options.nameColumn = list(options.keyz)[1] 
+        options.nameColumn = options.keyz[1] if len(options.keyz) > 1 else options.keyz[0]
+    return options
+
+def swiss_army_knife_stream(records, **kwargs):
+    """
+    Generator of the markup of swiss_army_knife, `rows_per_chunk` records at a time,
+    so that even huge record lists render in flat memory. Lines are indented by
+    `indent` ('' or None for all of it on a single line).
+    """
+    options = swiss_army_options(records, **kwargs)
+    if not len(records):
+        yield f"<p class='{options.parentClass}'>{options.emptyMsg}</p>"
+        return
+    indent = options.indent or ''
+    newline = "\n" if options.indent else ''
+    opening, content, mark = swiss_army_rows.get(options.childElement, swiss_army_rows[None])
+    closing = f"</{options.childElement if options.childElement in swiss_army_rows else 'p'}>"
+    id_column, name_column, selected, keyz = options.idColumn, options.nameColumn, options.selected, options.keyz
+    depth = 1 if options.full else 0
+    head = []
+    if options.full:
+        size = f' size="{options.size}"' if options.size else ''
+        head.append(f'<{options.parentElement} class="{options.parentClass}"{size}>')
+    if options.parentElement.lower() == 'table':
+        head.extend([indent * depth + "<thead>", indent * (depth + 1) + "<tr>"])
+        head.extend(f"{indent * (depth + 2)}<th>{header}</th>" for header in options.headers)
+        head.extend([indent * (depth + 1) + "</tr>", indent * depth + "</thead>", indent * depth + "<tbody>"])
+        footer = indent * depth + "</tbody>"
+        depth += 1
+    else:
+        if options.header:
+            head.append(indent * depth + options.header)
+        footer = indent * depth + options.footer if options.footer else None
+    if head:
+        yield newline.join(head) + newline
+
+    # Everything but the record's own values is worked out once, here.
+    opening = indent * depth + opening + newline
+    closing = indent * depth + closing + newline
+    if content is not None:
+        content = indent * (depth + 1) + content + newline
+    else:
+        grandchild = options.grandchildElement
+        cell = f"{indent * (depth + 1)}<{grandchild}>{newline}{indent * (depth + 2)}{{}}{newline}{indent * (depth + 1)}</{grandchild}>{newline}"
+    format_opening, format_content = opening.format, content.format if content is not None else None
+    rows_per_chunk = options.rows_per_chunk
+    chunk = []
+    for count, record in enumerate(records, 1):
+        record_id = record[id_column]
+        values = {'id': record_id, 'json': to_json(record), 'selected': mark if record_id == selected else ''}
+        chunk.append(format_opening(**values))
+        if format_content is not None:
+            chunk.append(format_content(name=record[name_column], **values))
         else:
-            options.nameColumn = list(options.keyz)[0]
-
-    formatted_template = swiss_army_knife_template.format(**options)
-    rendered = render_template(formatted_template, records=records, **options)
-    try: 
-        prepared_rendered = rendered.strip('\n ').encode('utf-8').decode('utf-8')
-        if not options.get('full'):
-            return prepared_rendered
-        prettyhtml = minidom.parseString(prepared_rendered).toprettyxml(indent="  ")
-        return prettyhtml
-    except Exception as e:
-        print(f"Error parsing template: {e}")
-        return rendered
+            chunk.extend(cell.format(record[key]) for key in keyz)
+        chunk.append(closing)
+        if not count % rows_per_chunk:
+            yield ''.join(chunk)
+            chunk.clear()
+    if footer:
+        chunk.append(footer + newline)
+    if options.full:
+        chunk.append(f"</{options.parentElement}>{newline}")
+    yield ''.join(chunk)
+
+def swiss_army_knife(records, **kwargs):
+    """
+    Markup listing `records` (dicts) as a select (the default `parentElement`), ul,
+    table or div, whose rows carry each record's id and JSON and mark the `selected` one.
+    """
+    return ''.join(swiss_army_knife_stream(records, **kwargs))
     
 # End of special templates
 
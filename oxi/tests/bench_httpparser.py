@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Micro-benchmark: request head parsing, the old three-coroutine StreamReader
+# path against oxi.httpparser. Run with: python bench_httpparser.py [requests]
+
+import asyncio, re, sys, time
+from urllib.parse import unquote_plus
+
+from activate_this import oxi_env
+
+if oxi_env:
+    from oxi.httpparser import HttpRequestParser
+
+request = (b"GET /img/oxi_1.png?size=large&theme=dark HTTP/1.1\r\n"
+           b"Host: localhost:8086\r\n"
+           b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n"
+           b"Accept: image/avif,image/webp,image/png,image/svg+xml,image/*;q=0.8,*/*;q=0.5\r\n"
+           b"Accept-Language: en-US,en;q=0.5\r\n"
+           b"Accept-Encoding: gzip, deflate, br, zstd\r\n"
+           b"Connection: keep-alive\r\n"
+           b"Referer: http://localhost:8086/\r\n"
+           b"Cookie: session=4f2a9c0e; theme=dark\r\n"
+           b"Sec-Fetch-Dest: image\r\n"
+           b"Sec-Fetch-Mode: no-cors\r\n"
+           b"Sec-Fetch-Site: same-origin\r\n"
+           b"Priority: u=5, i\r\n"
+           b"\r\n")
+
+# The pre-httpparser implementation, kept here for comparison only.
+
+async def legacy_request_line(reader):
+    request_line = await reader.readuntil(b"\r\n")
+    request_line = request_line.rstrip(b"\r\n").decode("utf-8").strip()
+    method, path, protocol = re.split(r"\s+", request_line)
+    return method.upper(), unquote_plus(path), protocol
+
+async def legacy_headers_block(reader):
+    headers_block = await reader.readuntil(b"\r\n\r\n")
+    return headers_block.rstrip(b"\r\n\r\n")
+
+async def legacy_parse_headers(headers_block):
+    headers = {}
+    for line in headers_block.decode("utf-8").split("\r\n"):
+        if ": " in line:
+            key, value = line.split(": ", 1)
+            headers[key.strip().lower()] = value.strip()
+    return headers
+
+async def bench_legacy(count):
+    reader = asyncio.StreamReader()
+    reader.feed_data(request * count)
+    start = time.perf_counter()
+    for _ in range(count):
+        await legacy_request_line(reader)
+        headers = await legacy_parse_headers(await legacy_headers_block(reader))
+        headers.get("range")
+    return time.perf_counter() - start
+
+async def bench_stream(count):
+    reader = asyncio.StreamReader()
+    reader.feed_data(request * count)
+    parser = HttpRequestParser()
+    start = time.perf_counter()
+    for _ in range(count):
+        head = parser.parse_head(await reader.readuntil(b"\r\n\r\n"))
+        head.path, head.headers.get("range")
+    return time.perf_counter() - start
+
+def bench_incremental(count):
+    parser = HttpRequestParser()
+    data = request * 16
+    start = time.perf_counter()
+    for _ in range(count // 16):
+        parser.feed(data)
+        while (head := parser.parse()) is not None:
+            head.path, head.headers.get("range")
+    return time.perf_counter() - start
+
+def report(name, count, elapsed, baseline=None):
+    rate = count / elapsed
+    ratio = f"  ({baseline / elapsed:.2f}x)" if baseline else ""
+    print(f"{name:<36}{rate:>14,.0f} req/s{ratio}")
+
+async def main(count, rounds=5):
+    # Best of several rounds, to keep scheduler noise out of the comparison.
+    legacy = min([await bench_legacy(count) for _ in range(rounds)])
+    stream = min([await bench_stream(count) for _ in range(rounds)])
+    incremental = min([bench_incremental(count) for _ in range(rounds)])
+    print(f"\n{count:,} requests of {len(request)} bytes, best of {rounds} rounds\n")
+    report("legacy get_request_line + headers", count, legacy)
+    report("readuntil + parse_head", count, stream, legacy)
+    report("feed/parse (pipelined buffer)", count - count % 16, incremental, legacy)
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000))
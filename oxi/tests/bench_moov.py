@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Micro-benchmark: relocating the chunk offset tables of a moov, the old
+# per-entry loop against Mp4._patch_moov (array, and NumPy if installed).
+# Run with: python bench_moov.py [entries]
+
+import mmap, os, struct, sys, tempfile, time
+
+from activate_this import oxi_env
+
+if oxi_env:
+    import oxi.mp4parser as mp4parser
+    from oxi.mp4parser import Mp4
+
+def atom(name: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+def write_sample(path, entries, tracks=2):
+    """
+    A late-moov MP4 skeleton: ftyp, a sparse mdat, then a moov with `tracks`
+    stco tables of `entries` offsets each.
+    """
+    mdat_size = 64 * 1024 * 1024
+    traks = b""
+    for track in range(tracks):
+        offsets = [40 + (i * 997 + track) % (mdat_size - 8) for i in range(entries)]
+        stco = atom(b"stco", b"\0\0\0\0" + struct.pack(f">I{entries}I", entries, *offsets))
+        traks += atom(b"trak", atom(b"mdia", atom(b"minf", atom(b"stbl", stco))))
+    ftyp = atom(b"ftyp", b"isom\0\0\0\0isom")
+    with open(path, "wb") as fd:
+        fd.write(ftyp)
+        fd.write(struct.pack(">I", mdat_size) + b"mdat")
+        fd.seek(len(ftyp) + mdat_size)
+        fd.write(atom(b"moov", atom(b"mvhd", b"\0" * 100) + traks))
+
+# The pre-vectorization implementation, kept here for comparison only.
+
+def legacy_patch_moov(mp4):
+    offset_shift = mp4.moov.size
+    mp4.moov.contents.seek(0)
+    patched = mmap.mmap(-1, mp4.moov.size)
+    patched.write(mp4.moov.contents.read())
+    for atom in mp4.relocation_targets:
+        offset_pos_begin = atom.offset - mp4.moov.offset
+        entry_count = int.from_bytes(patched[offset_pos_begin+12:offset_pos_begin+16], byteorder='big')
+        displacement = 4 if atom.name == 'stco' else 8
+        for i in range(entry_count):
+            offset_pos = offset_pos_begin + 16 + (i * displacement)
+            current_offset = int.from_bytes(patched[offset_pos:offset_pos+4], byteorder='big')
+            new_offset = current_offset + offset_shift
+            patched[offset_pos:offset_pos+4] = new_offset.to_bytes(displacement, byteorder='big')
+    return patched
+
+def bench(path, patch):
+    mp4 = Mp4(path)
+    start = time.perf_counter()
+    result = patch(mp4)
+    elapsed = time.perf_counter() - start
+    # The patched moov lives in the Mp4's mappings: copy it out before closing.
+    result = bytes(result)
+    mp4.close()
+    return elapsed, result
+
+def current_patch(mp4):
+    return mp4.patched_moov
+
+def report(name, count, elapsed, baseline=None):
+    ratio = f"  ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"{name:<28}{elapsed * 1000:>10.1f} ms{count / elapsed:>16,.0f} entries/s{ratio}")
+
+def main(entries, rounds=3):
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "sample.mp4")
+        write_sample(path, entries)
+        count = 2 * entries
+        legacy, expected = min(bench(path, legacy_patch_moov) for _ in range(rounds))
+        numpy = mp4parser.numpy
+        if numpy is not None:
+            vectorized, result = min(bench(path, current_patch) for _ in range(rounds))
+            assert result == expected
+        mp4parser.numpy = None
+        try:
+            arrays, result = min(bench(path, current_patch) for _ in range(rounds))
+            assert result == expected
+        finally:
+            mp4parser.numpy = numpy
+    print(f"\n{count:,} chunk offsets in 2 stco tables, best of {rounds} rounds\n")
+    report("legacy per-entry loop", count, legacy)
+    report("_patch_moov (array)", count, arrays, legacy)
+    if numpy is not None:
+        report("_patch_moov (numpy)", count, vectorized, legacy)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 250000)
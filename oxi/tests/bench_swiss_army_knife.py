@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Benchmark: swiss_army_knife, the old format/compile/render/minidom function
+# against the streaming one, time and peak traced memory per layout.
+# Run with: python bench_swiss_army_knife.py [records]
+
+import sys, time, tracemalloc
+from xml.dom import minidom
+
+from activate_this import oxi_env
+
+if oxi_env:
+    from oxi.utils import SmartDict
+    from oxi.template import render_template, swiss_army_knife, swiss_army_knife_stream
+
+# The pre-streaming implementation, kept here for comparison only.
+
+legacy_template = """
+{{% if full %}}
+    <{{{{parentElement}}}} class="{{{{parentClass}}}}" {{% if size %}} size="{{{{ size }}}}" {{% endif%}}>
+{{% endif %}}
+{header}
+{{% for record in records %}}
+    {{% if childElement == 'option' %}}
+        <{{{{childElement}}}} {{% if record['{idColumn}'] == {selected} %}} selected {{% endif %}} value="{{{{ record['{idColumn}'] }}}}" data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}'>
+            {{{{ record['{nameColumn}'] }}}}
+        </{{{{childElement}}}}>
+    {{% elif childElement == 'li' %}}
+        <{{{{childElement}}}} data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}'>
+            <span {{% if record['{idColumn}'] == {selected} %}} class="selected" {{% endif %}}>{{{{ record['{nameColumn}'] }}}}</span>
+        </{{{{childElement}}}}>
+    {{% elif childElement == 'tr' %}}
+        <{{{{childElement}}}} data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}' {{% if record['{idColumn}'] == {selected} %}} class="selected" {{% endif %}}>
+            {{%for key in keyz %}}
+                <{{{{grandchildElement}}}}> 
+                    {{{{ record[key] }}}}
+                </{{{{grandchildElement}}}}>
+            {{%endfor%}}
+        </{{{{childElement}}}}>
+    {{% elif childElement == 'p' %}}
+        <{{{{childElement}}}} data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}' {{% if record['{idColumn}'] == {selected} %}} class="selected" {{% endif %}}>
+            {{%for key in keyz %}}
+                <{{{{grandchildElement}}}}> 
+                    {{{{ record[key] }}}}
+                </{{{{grandchildElement}}}}>
+            {{%endfor%}}
+        </{{{{childElement}}}}>
+    {{% else %}}
+        <p data-id="{{{{ record['{idColumn}'] }}}}" data-json='{{{{ record|toJson }}}}'>{{{{record['{nameColumn}']}}}}</p>
+    {{% endif %}}
+{{% endfor %}}
+{footer}
+
+{{% if full %}}
+    </{{{{parentElement}}}}>
+{{% endif %}}
+
+"""
+
+def legacy_swiss_army_knife(records, **kwargs):
+    options = SmartDict({
+        'parentElement': 'select',
+        'childElement': 'option',
+        'grandchildElement': 'span',
+        'header': '',
+        'footer': '',
+        'selected': 0,
+        'idColumn': 'id',
+        'nameColumn': 'name',
+        'titleColumn': 'description',
+        'full': True,
+        'parentClass': '',
+        'emptyMsg': 'No records found.',
+        'selected': 0,
+        'size': None
+    })
+    options.update(kwargs)
+    if not len(records):
+        return f"""
+        <p class='{options.parentClass}'>{options.emptyMsg}</p>
+        """
+    options.keyz = records[0].keys()
+    options.headers = [key.title() for key in options.keyz]
+    
+    if options.parentElement.lower() == 'table':
+        options.childElement = 'tr'
+        options.grandchildElement = 'td'
+        options.parentClass = options.parentClass or 'zebra'
+        options.header = f"""
+        <thead>
+        <tr>
+        {'<th>' + '</th><th>'.join(options.headers) + '</th>'}
+        </tr>
+        </thead>
+        <tbody>
+        """
+        options.footer = '</tbody>'
+    elif options.parentElement.lower() == 'div':
+        options.childElement = 'p'
+        options.grandchildElement = 'span'
+        options.parentClass = options.parentClass or 'panel'
+    elif options.parentElement.lower() == 'ul':
+        options.childElement = 'li'
+        options.grandchildElement = 'a'
+        options.parentClass = options.parentClass or 'big'
+    elif options.parentElement.lower() == 'select':
+        options.childElement = 'option'
+        options.grandchildElement = 'span'
+        options.parentClass = options.parentClass or 'big'
+
+    if options.nameColumn not in options.keyz:
+        listkeyz = list(options.keyz)
+        if len(listkeyz) > 1:
+            options.nameColumn = list(options.keyz)[1] 
+        else:
+            options.nameColumn = list(options.keyz)[0]
+
+    formatted_template = legacy_template.format(**options)
+    rendered = render_template(formatted_template, records=records, **options)
+    try: 
+        prepared_rendered = rendered.strip('\n ').encode('utf-8').decode('utf-8')
+        if not options.get('full'):
+            return prepared_rendered
+        prettyhtml = minidom.parseString(prepared_rendered).toprettyxml(indent="  ")
+        return prettyhtml
+    except Exception as e:
+        print(f"Error parsing template: {e}")
+        return rendered
+
+def sample(count):
+    return [{'id': i, 'name': f"Record {i}", 'description': f"Description of record number {i}",
+             'price': i * 1.25, 'active': i % 2 == 0} for i in range(count)]
+
+def measure(func, *args, rounds=3, **kwargs):
+    """
+    Best time of `rounds` calls, then the peak traced memory of one more: tracing
+    slows everything down too much to time the same run.
+    """
+    elapsed = min(timed(func, *args, **kwargs) for _ in range(rounds))
+    tracemalloc.start()
+    func(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+def drain(records, **kwargs):
+    for _ in swiss_army_knife_stream(records, **kwargs):
+        pass
+
+def report(name, elapsed, peak, baseline=None):
+    ratio = f"  ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"{name:<34}{elapsed * 1000:>10.1f} ms{peak / 1024 / 1024:>10.1f} MB peak{ratio}")
+
+def main(count):
+    records = sample(count)
+    print(f"\n{count:,} records\n")
+    for layout in ('select', 'ul', 'table', 'div'):
+        legacy, legacy_peak = measure(legacy_swiss_army_knife, records, parentElement=layout, selected=7)
+        joined, joined_peak = measure(swiss_army_knife, records, parentElement=layout, selected=7)
+        streamed, streamed_peak = measure(drain, records, parentElement=layout, selected=7)
+        report(f"{layout}: legacy", legacy, legacy_peak)
+        report(f"{layout}: swiss_army_knife", joined, joined_peak, legacy)
+        report(f"{layout}: swiss_army_knife_stream", streamed, streamed_peak, legacy)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Micro-benchmark: rendering dotted expressions ({{ a.b.c }}) through do_dots
+# against per-call-site DottedAccess inline caches (TemplateLight.inline_dots).
+# Run with: python bench_template_dots.py [records]
+
+import sys, time
+
+from activate_this import oxi_env
+
+if oxi_env:
+    from oxi.template import TemplateLight
+    from oxi.utils import SmartDict
+
+class Address:
+    def __init__(self, city, country):
+        self.city = city
+        self.country = country
+
+class Person:
+    def __init__(self, pk, name, city):
+        self.id = pk
+        self.name = name
+        self.address = Address(city, "AR")
+
+    def initials(self):
+        return "".join(part[0] for part in self.name.split())
+
+# A select built the way swiss_army_knife's template did it, with dotted access to the records.
+select_template = """
+<select class="{{ parentClass }}">
+{% for record in records %}
+    <option {% if record['id'] == selected %} selected {% endif %} value="{{ record.id }}" data-json='{{ record|toJson }}'>
+        {{ record.name }} ({{ record.address.city }})
+    </option>
+{% endfor %}
+</select>
+"""
+
+table_template = """
+<table>
+{% for row in rows %}
+    <tr><td>{{ row.id }}</td><td>{{ row.name }}</td><td>{{ row.address.city }}</td><td>{{ row.address.country }}</td><td>{{ row.tags.0 }}</td></tr>
+{% endfor %}
+</table>
+"""
+
+objects_template = """
+<ul>
+{% for person in people %}
+    <li>{{ person.id }} {{ person.name }} {{ person.initials }} {{ person.address.city }} {{ person.address.country }}</li>
+{% endfor %}
+</ul>
+"""
+
+def sample(count):
+    rows = [{'id': i, 'name': f"Record {i}", 'address': {'city': f"City {i % 50}", 'country': "AR"},
+             'tags': [f"tag{i % 7}", "x"]} for i in range(count)]
+    people = [Person(i, f"Person Number {i}", f"City {i % 50}") for i in range(count)]
+    smart = [SmartDict(row) for row in rows]
+    return rows, people, smart
+
+def bench(template, rounds, **context):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        output = template.render(**context)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+def compiled(text, inline):
+    previous = TemplateLight.inline_dots
+    TemplateLight.inline_dots = inline
+    try:
+        return TemplateLight(text, **TemplateLight.template_filters)
+    finally:
+        TemplateLight.inline_dots = previous
+
+def report(name, elapsed, baseline=None):
+    ratio = f"  ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"{name:<40}{elapsed * 1000:>10.1f} ms{ratio}")
+
+def main(count, rounds=5):
+    rows, people, smart = sample(count)
+    cases = [
+        ("select of dicts (swiss_army_knife)", select_template, {'records': rows, 'selected': 7, 'parentClass': "big"}),
+        ("table of nested dicts and lists", table_template, {'rows': rows}),
+        ("list of objects and methods", objects_template, {'people': people}),
+        ("table of SmartDicts", table_template, {'rows': smart}),
+    ]
+    print(f"\n{count:,} records per render, best of {rounds} rounds\n")
+    for name, text, context in cases:
+        legacy, expected = bench(compiled(text, False), rounds, **context)
+        inline, output = bench(compiled(text, True), rounds, **context)
+        assert output == expected
+        report(f"{name}: do_dots", legacy)
+        report(f"{name}: inline", inline, legacy)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# Benchmark: small static files over keep-alive connections, served by the
+# StreamReader/StreamWriter front end and by the asyncio.Protocol one (HttpConnection).
+# Run with: python bench_transport.py [connections] [requests per connection]
+
+import asyncio, multiprocessing, os, signal, socket, sys, tempfile, time
+
+from activate_this import oxi_env
+
+if oxi_env:
+    from oxi.server import ProtocolFactory, run_dev_server
+
+files = {"style.css": b"body { background-color: #f0f0f0; }\n" * 24,
+         "index.html": b"<html><body><h1>Oxi</h1></body></html>\n"}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def serve(mode, root, port, ready, requests):
+    os.chdir(root)
+    # The access log still runs, but writes to nowhere instead of the terminal.
+    sys.stdout = open(os.devnull, "w")
+    protocol = ProtocolFactory(base_dir="static")
+    protocol.keep_alive_max_requests = requests + 1
+    asyncio.run(run_dev_server(protocol, host="127.0.0.1", port=port,
+                               clear_screen=False, on_ready=ready.set, server_mode=mode))
+
+async def client(port, path, requests):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    request = f"GET /{path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+    for _ in range(requests):
+        writer.write(request)
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.split(b"Content-Length: ", 1)[1].split(b"\r\n", 1)[0])
+        await reader.readexactly(length)
+    writer.close()
+    await writer.wait_closed()
+
+async def load(port, connections, requests):
+    start = time.perf_counter()
+    await asyncio.gather(*[client(port, "style.css" if i % 2 else "index.html", requests)
+                           for i in range(connections)])
+    return time.perf_counter() - start
+
+def bench(mode, root, connections, requests, rounds):
+    port = free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(mode, root, port, ready, requests))
+    server.start()
+    try:
+        if not ready.wait(10):
+            raise RuntimeError(f"{mode} server did not start")
+        asyncio.run(load(port, connections, 10))  # warm up
+        return min(asyncio.run(load(port, connections, requests)) for _ in range(rounds))
+    finally:
+        os.kill(server.pid, signal.SIGTERM)
+        server.join()
+
+def main(connections, requests, rounds=3):
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, "static"))
+        for name, data in files.items():
+            with open(os.path.join(root, "static", name), "wb") as fd:
+                fd.write(data)
+        total = connections * requests
+        stream = bench("stream", root, connections, requests, rounds)
+        protocol = bench("protocol", root, connections, requests, rounds)
+    print(f"\n{total:,} requests over {connections} keep-alive connections, best of {rounds} rounds\n")
+    print(f"{'stream (StreamReader/StreamWriter)':<38}{total / stream:>12,.0f} req/s")
+    print(f"{'protocol (HttpConnection)':<38}{total / protocol:>12,.0f} req/s  ({stream / protocol:.2f}x)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 32,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200)
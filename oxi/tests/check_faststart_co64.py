@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Regression check: a late-moov MP4 whose stco offsets overflow 32 bits once moov
+# moves in front of mdat. The stco table is promoted to co64, which makes the
+# faststart layout longer than the file. The layout must still be cached and
+# saved as a sidecar, and the server must send it (not the original file), with
+# every chunk offset, before and after the original moov, pointing at its chunk.
+# The sample is a sparse 4 GiB file. Run with: python check_faststart_co64.py
+
+import asyncio, os, struct, tempfile
+
+from activate_this import oxi_env
+
+if oxi_env:
+    from oxi.config import Config
+    from oxi.mp4parser import Mp4, FaststartCache, FaststartLayout
+
+def atom(name: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+ftyp = atom(b"ftyp", b"isom\0\0\0\0isom")
+
+def marker(index: int) -> bytes:
+    return b"CHUNK%03d" % index
+
+def write_sample(path) -> int:
+    """
+    ftyp, a sparse mdat ending just under 4 GiB, moov, then a free atom. Track 1 has
+    an stco table reaching the end of mdat, track 2 a co64 table with one chunk in
+    the free atom after moov. Every chunk starts with its marker.
+    Returns the number of chunks.
+    """
+    mdat_size = 0xFFFFFF00 - len(ftyp)
+    moov_offset = len(ftyp) + mdat_size
+    # A padded mvhd makes moov long enough to push the last chunks past 32 bits.
+    mvhd = atom(b"mvhd", b"\0" * 8192)
+    stco_offsets = [len(ftyp) + 8, moov_offset - 4096]
+    stco = atom(b"stco", b"\0\0\0\0" + struct.pack(">3I", 2, *stco_offsets))
+
+    def make_moov(trailing: int) -> bytes:
+        co64 = atom(b"co64", b"\0\0\0\0" + struct.pack(">I2Q", 2, len(ftyp) + 1024, trailing))
+        return atom(b"moov", mvhd + b"".join(atom(b"trak", atom(b"mdia", atom(b"minf", atom(b"stbl", table))))
+                                             for table in (stco, co64)))
+
+    # The co64 chunk lies in the free atom's payload, right after moov.
+    trailing = moov_offset + len(make_moov(0)) + 8
+    moov = make_moov(trailing)
+    chunks = stco_offsets + [len(ftyp) + 1024, trailing]
+    with open(path, "wb") as fd:
+        fd.write(ftyp)
+        fd.write(struct.pack(">I", mdat_size) + b"mdat")
+        fd.seek(moov_offset)
+        fd.write(moov)
+        fd.write(atom(b"free", b"\0" * 64))
+        for index, offset in enumerate(chunks):
+            fd.seek(offset)
+            fd.write(marker(index))
+    return len(chunks)
+
+def chunk_offsets(moov: bytes) -> list:
+    """
+    The offsets of the stco and co64 tables in `moov`, in order.
+    """
+    offsets, position = [], 0
+    while True:
+        stco, co64 = moov.find(b"stco", position), moov.find(b"co64", position)
+        position = min(found for found in (stco, co64, len(moov)) if found >= 0)
+        if position == len(moov):
+            return offsets
+        width = 4 if moov[position:position + 4] == b"stco" else 8
+        count, = struct.unpack(">I", moov[position + 8:position + 12])
+        offsets += struct.unpack(f">{count}{'I' if width == 4 else 'Q'}",
+                                 moov[position + 12:position + 12 + count * width])
+        position += 12 + count * width
+
+async def fetch(port: int, path: str, first: int = None, last: int = None):
+    """
+    Status line, headers and body of a GET, ranged if `first` is given. Whole
+    responses are cut after the head.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    ranged = f"Range: bytes={first}-{last}\r\n" if first is not None else ""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n{ranged}Connection: close\r\n\r\n".encode())
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    headers = dict(line.lower().split(": ", 1) for line in head[1:] if line)
+    body = await reader.readexactly(int(headers["content-length"])) if ranged else b""
+    writer.close()
+    return head[0], headers, body
+
+async def check_server(root: str, count: int, expected_size: int):
+    from oxi.server import ProtocolFactory
+    cwd = os.getcwd()
+    os.chdir(root)
+    protocol = ProtocolFactory(base_dir="media")
+    server = await asyncio.start_server(protocol, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        status, headers, _ = await fetch(port, "/sample.mp4")
+        assert status.endswith("200 OK"), status
+        assert int(headers["content-length"]) == expected_size, headers
+        status, headers, front = await fetch(port, "/sample.mp4", 0, len(ftyp) + 16 * 1024)
+        assert status.endswith("206 Partial Content"), status
+        assert headers["content-range"].endswith(f"/{expected_size}"), headers
+        assert front[len(ftyp) + 4:len(ftyp) + 8] == b"moov", "not served faststart"
+        offsets = chunk_offsets(front[len(ftyp):])
+        assert len(offsets) == count, offsets
+        for index, offset in enumerate(offsets):
+            _, _, data = await fetch(port, "/sample.mp4", offset, offset + 7)
+            assert data == marker(index), (index, offset, data)
+        assert protocol.faststart_cache.stats()["entries"] == 1, protocol.faststart_cache.stats()
+    finally:
+        # Let the connection whose response was cut short notice and wind down.
+        while protocol.connections:
+            await asyncio.sleep(0.01)
+        server.close()
+        await server.wait_closed()
+        os.chdir(cwd)
+
+def main():
+    Config.update(access_log="off", log_level="error")
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, "media"))
+        path = os.path.join(root, "media", "sample.mp4")
+        count = write_sample(path)
+        st = os.stat(path)
+        with Mp4(path) as mp4:
+            assert any(atom.name == "co64" for atom in mp4.relocation_targets)
+            moov_growth = len(mp4.patched_moov) - mp4.moov.size
+        assert moov_growth == 4 * 2, moov_growth
+        layout = FaststartLayout.load(path)
+        assert layout.size == st.st_size + moov_growth, (layout.size, st.st_size)
+
+        cache = FaststartCache(sidecar_dir=os.path.join(root, "sidecars"))
+        cached = asyncio.run(cache.get(path, st.st_size, st.st_mtime_ns))
+        assert cached.size == layout.size and cache.stats()["entries"] == 1, cache.stats()
+        assert os.path.exists(cache.sidecar(path)), "no sidecar"
+        reloaded = FaststartLayout.from_sidecar(cache.sidecar(path), path, st.st_size, st.st_mtime_ns)
+        assert reloaded is not None and reloaded.segments == cached.segments
+
+        asyncio.run(check_server(root, count, layout.size))
+    print(f"ok: {count} chunks, layout {layout.size:,} bytes for a {st.st_size:,} byte file")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 import re, asyncio, platform, threading, sys, termios
 from functools import wraps
 from contextlib import contextmanager
+from collections import OrderedDict
 from http import HTTPStatus
 
 ######################################################################################
@@ -148,3 +149,86 @@ class SmartDict(dict):
 
 ######################################################################################
 
+class LRUCache:
+    """
+    Least recently used cache bounded by a byte budget and, optionally, an entry count.
+    Values are stored along with the size they account for; `hits` and `misses`
+    count lookups made through `get`. `on_evict(key, value)`, if given, is called
+    for every entry dropped to make room.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int = 0, on_evict=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def peek(self, key, default=None):
+        """
+        Like `get`, but neither counts the lookup nor refreshes the entry.
+        """
+        item = self._entries.get(key)
+        return default if item is None else item[0]
+
+    def put(self, key, value, size: int = 0) -> bool:
+        """
+        Store `value`, evicting the least recently used entries to make room.
+        Returns False if it is larger than the whole budget and wasn't stored.
+        """
+        evicted = []
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return False
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes or (self.max_entries and len(self._entries) > self.max_entries):
+                old_key, (old_value, old_size) = self._entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append((old_key, old_value))
+        if self.on_evict is not None:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+        return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._discard(key)
+            return default if item is None else item[0]
+
+    def _discard(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+        return item
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+######################################################################################
@@ -21,6 +21,7 @@ setup(
     entry_points={
         'console_scripts': [
             'mp4parser=oxi.mp4parser:main',
+            'oxi-precompile=oxi.template:precompile_main',
         ],
     },
     license='MIT',